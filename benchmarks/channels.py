@@ -0,0 +1,100 @@
+"""
+Measure how long small control messages wait behind a bulk transfer sharing the same duct, with and without channels.
+
+Without channels, the control messages and the bulk messages go through send() one whole message at a time, so a
+control message sent while a bulk message is being written waits for all of it. On channels, the bulk messages are
+split into fragments, and a control message only waits for the fragment being written.
+
+Run from the repository root with:
+
+    python -m benchmarks.channels
+"""
+from __future__ import print_function
+import argparse
+import threading
+import time
+
+from ductworks.message_duct import create_anonymous_duct_pair, CODECS
+
+# The highest resolution clock available.
+clock = getattr(time, 'perf_counter', time.time)
+
+CONTROL_CHANNEL = 1
+BULK_CHANNEL = 2
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def control_latencies(use_channels, bulk_size, bulk_count, control_count, fragment_size):
+    codec = CODECS['tagged-json']
+    parent, child = create_anonymous_duct_pair(serialize=codec.serialize, deserialize=codec.deserialize,
+                                               parent_lock=(threading.Lock(), threading.Lock()),
+                                               child_lock=(threading.Lock(), threading.Lock()),
+                                               channel_fragment_size=fragment_size)
+    if use_channels:
+        send_control, send_bulk = parent.channel(CONTROL_CHANNEL).send, parent.channel(BULK_CHANNEL).send
+        recv_control, recv_bulk = child.channel(CONTROL_CHANNEL).recv, child.channel(BULK_CHANNEL).recv
+    else:
+        # Both kinds of message on the one stream; tell them apart by type.
+        send_control = send_bulk = parent.send
+        recv_control = recv_bulk = None
+    bulk_payload = b'x' * bulk_size
+    latencies = []
+    bulk_done = threading.Event()
+
+    def bulk_sender():
+        for _ in range(bulk_count):
+            send_bulk(bulk_payload)
+        bulk_done.set()
+
+    def control_sender():
+        for _ in range(control_count):
+            send_control(clock())
+            time.sleep(0.001)
+
+    senders = [threading.Thread(target=bulk_sender), threading.Thread(target=control_sender)]
+    for t in senders:
+        t.start()
+    if use_channels:
+        bulk_receiver = threading.Thread(target=lambda: [recv_bulk() for _ in range(bulk_count)])
+        bulk_receiver.start()
+        for _ in range(control_count):
+            sent = recv_control()
+            latencies.append(clock() - sent)
+        bulk_receiver.join()
+    else:
+        while len(latencies) < control_count:
+            message = child.recv()
+            if isinstance(message, float):
+                latencies.append(clock() - message)
+        while not bulk_done.is_set() or child.poll(0.1):
+            child.recv_many()
+    for t in senders:
+        t.join()
+    child.close()
+    parent.close()
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bulk-size', type=int, default=64 * 1024 * 1024, help="Bulk message size, in bytes.")
+    parser.add_argument('--bulk-count', type=int, default=4, help="Bulk messages to send.")
+    parser.add_argument('--control-count', type=int, default=200, help="Control messages to send.")
+    parser.add_argument('--fragment-size', type=int, default=64 * 1024, help="Channel fragment size, in bytes.")
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>12}".format("mode", "p50 (ms)", "p99 (ms)", "max (ms)"))
+    for use_channels in (False, True):
+        latencies = control_latencies(use_channels, args.bulk_size, args.bulk_count, args.control_count,
+                                      args.fragment_size)
+        print("{:>10} {:>12.2f} {:>12.2f} {:>12.2f}".format("channels" if use_channels else "plain",
+                                                           percentile(latencies, 0.5) * 1e3,
+                                                           percentile(latencies, 0.99) * 1e3, latencies[-1] * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare thread-shared message ducts guarded by one lock in both directions against ducts with separate send and
+recv locks (which is what ducts given a single lock get by default).
+
+Several client threads share one end of a duct, each sending a request and then waiting for a reply from an echo
+thread at the other end. With a single lock, whichever thread is waiting for a reply holds the lock the whole time,
+so no other thread can send a request until it arrives; with separate locks, the others keep sending meanwhile.
+
+Run from the repository root with:
+
+    python -m benchmarks.duplex
+"""
+from __future__ import print_function
+import argparse
+import threading
+import time
+
+from ductworks.message_duct import create_anonymous_duct_pair
+
+
+def identity(payload):
+    return payload
+
+
+def lock_for(mode):
+    if mode == 'single':
+        lock = threading.Lock()
+        return lock, lock
+    return threading.Lock()
+
+
+def request_throughput(mode, payload, threads, count):
+    parent, child = create_anonymous_duct_pair(serialize=identity, deserialize=identity, parent_lock=lock_for(mode))
+
+    def echo():
+        for _ in range(threads * count):
+            child.send(child.recv())
+
+    def client():
+        # Replies may go to any of the clients; only the total matters here.
+        for _ in range(count):
+            parent.send(payload)
+            parent.recv()
+
+    echo_thread = threading.Thread(target=echo)
+    echo_thread.start()
+    clients = [threading.Thread(target=client) for _ in range(threads)]
+    start_time = time.time()
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.time() - start_time
+    echo_thread.join()
+    child.close()
+    parent.close()
+    return threads * count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=5000, help="Requests sent by each client thread.")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16], help="Client thread counts.")
+    # Every client may have a request and a reply in flight at once, so these must all fit in the socket buffers.
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1024, 4096], help="Payload sizes, in bytes.")
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>10} {:>14}".format("locking", "threads", "size", "requests/s"))
+    for size in args.sizes:
+        payload = b'x' * size
+        for threads in args.threads:
+            for mode in ('single', 'duplex'):
+                requests_per_second = request_throughput(mode, payload, threads, args.count)
+                print("{:>10} {:>10} {:>10} {:>14.0f}".format(mode, threads, size, requests_per_second))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare a DuctPool against a multiprocessing.Pool using the spawn start method.
+
+The spawn method is what multiprocessing falls back to when workers must run a separate interpreter (set with
+multiprocessing.set_executable, as for a worker virtualenv), which is the case DuctPool is built for. Both pools run
+the same batch of small tasks and the same batch of slower ones; startup is timed separately from the batches.
+
+Run from the repository root with:
+
+    python -m benchmarks.pool
+"""
+from __future__ import print_function
+import argparse
+import multiprocessing
+import time
+
+from ductworks.pool import DuctPool
+
+# The highest resolution clock available.
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def tiny_task(x):
+    return x + 1
+
+
+def busy_task(x):
+    # About a millisecond of pure Python work.
+    total = 0
+    for i in range(20000):
+        total += i ^ x
+    return total
+
+
+TASKS = (('tiny', tiny_task), ('busy', busy_task))
+
+
+def time_batches(pool_map, count):
+    timings = {}
+    for name, func in TASKS:
+        started = clock()
+        pool_map(func, range(count))
+        timings[name] = clock() - started
+    return timings
+
+
+def measure_duct_pool(processes, count, prefetch):
+    started = clock()
+    pool = DuctPool(processes=processes, prefetch=prefetch)
+    # Don't count the workers as started until every one of them has answered.
+    pool.map(tiny_task, range(processes))
+    startup = clock() - started
+    try:
+        return startup, time_batches(pool.map, count)
+    finally:
+        pool.close()
+
+
+def measure_multiprocessing_pool(processes, count, chunksize):
+    started = clock()
+    pool = multiprocessing.get_context('spawn').Pool(processes)
+    pool.map(tiny_task, range(processes))
+    startup = clock() - started
+    try:
+        return startup, time_batches(lambda func, items: pool.map(func, items, chunksize), count)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4, help="Workers in each pool.")
+    parser.add_argument('--count', type=int, default=20000, help="Tasks in each batch.")
+    parser.add_argument('--prefetch', type=int, default=16, help="DuctPool tasks in flight per worker.")
+    parser.add_argument('--chunksize', type=int, default=1, help="multiprocessing.Pool.map chunk size.")
+    args = parser.parse_args()
+
+    print("{:>16} {:>12} {:>14} {:>14}".format("pool", "startup (s)", "tiny tasks/s", "busy tasks/s"))
+    for name, measure, option in (('DuctPool', measure_duct_pool, args.prefetch),
+                                  ('mp spawn Pool', measure_multiprocessing_pool, args.chunksize)):
+        startup, timings = measure(args.processes, args.count, option)
+        print("{:>16} {:>12.2f} {:>14.0f} {:>14.0f}".format(name, startup, args.count / timings['tiny'],
+                                                             args.count / timings['busy']))
+
+
+if __name__ == '__main__':
+    # The workers can't import __main__, so run main() from the module as imported by name; that way the task
+    # functions are pickled as benchmarks.pool.tiny_task and so on.
+    from benchmarks.pool import main as importable_main
+    importable_main()
@@ -0,0 +1,92 @@
+"""
+Measure how long urgent control messages wait behind a bulk transfer sharing the same duct, and what bulk throughput
+is left, with plain sends, with PRIORITY_HIGH sends, and with PRIORITY_HIGH sends over a duct with priority lanes.
+
+Plain control messages queue up behind whatever bulk messages were sent before them, and are only received after
+those have been. PRIORITY_HIGH messages jump the queue of messages still waiting to be sent, and the receiver picks
+them out with poll(priority=PRIORITY_HIGH) ahead of the bulk messages it hasn't received yet; but without priority
+lanes, one still waits for the whole bulk message being written when it is sent. With priority lanes, bulk messages
+are split into fragments, and a control message only waits for the fragment being written.
+
+Run from the repository root with:
+
+    python -m benchmarks.priority
+"""
+from __future__ import print_function
+import argparse
+import threading
+import time
+
+from ductworks.message_duct import create_anonymous_duct_pair, CODECS, PRIORITY_HIGH, PRIORITY_NORMAL
+
+# The highest resolution clock available.
+clock = getattr(time, 'perf_counter', time.time)
+
+MODES = ('plain', 'priority', 'lanes')
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def control_latencies(mode, bulk_size, bulk_count, control_count, fragment_size):
+    codec = CODECS['tagged-json']
+    parent, child = create_anonymous_duct_pair(serialize=codec.serialize, deserialize=codec.deserialize,
+                                               parent_lock=(threading.Lock(), threading.Lock()),
+                                               channel_fragment_size=fragment_size,
+                                               priority_lanes=mode == 'lanes')
+    control_priority = PRIORITY_NORMAL if mode == 'plain' else PRIORITY_HIGH
+    bulk_payload = b'x' * bulk_size
+    latencies = []
+
+    def bulk_sender():
+        for _ in range(bulk_count):
+            parent.send(bulk_payload)
+
+    def control_sender():
+        for _ in range(control_count):
+            parent.send(clock(), priority=control_priority)
+            time.sleep(0.001)
+
+    senders = [threading.Thread(target=bulk_sender), threading.Thread(target=control_sender)]
+    start_time = clock()
+    for t in senders:
+        t.start()
+    bulk_received = 0
+    while bulk_received < bulk_count or len(latencies) < control_count:
+        if control_priority == PRIORITY_HIGH and len(latencies) < control_count:
+            # Look for urgent messages first, without waiting behind the bulk messages already on their way.
+            child.poll(None if bulk_received == bulk_count else 0, priority=PRIORITY_HIGH)
+        message = child.recv()
+        if isinstance(message, float):
+            latencies.append(clock() - message)
+        else:
+            bulk_received += 1
+    elapsed = clock() - start_time
+    for t in senders:
+        t.join()
+    child.close()
+    parent.close()
+    return sorted(latencies), bulk_size * bulk_count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bulk-size', type=int, default=64 * 1024 * 1024, help="Bulk message size, in bytes.")
+    parser.add_argument('--bulk-count', type=int, default=16, help="Bulk messages to send.")
+    parser.add_argument('--control-count', type=int, default=200, help="Control messages to send.")
+    parser.add_argument('--fragment-size', type=int, default=64 * 1024, help="Priority lane fragment size, in bytes.")
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>12} {:>12}".format("mode", "p50 (ms)", "p99 (ms)", "max (ms)", "bulk MB/s"))
+    for mode in MODES:
+        latencies, bulk_throughput = control_latencies(mode, args.bulk_size, args.bulk_count, args.control_count,
+                                                       args.fragment_size)
+        print("{:>10} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.0f}".format(mode, percentile(latencies, 0.5) * 1e3,
+                                                                      percentile(latencies, 0.99) * 1e3,
+                                                                      latencies[-1] * 1e3, bulk_throughput / 1e6))
+
+
+if __name__ == '__main__':
+    main()
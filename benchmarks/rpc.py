@@ -0,0 +1,134 @@
+"""
+Compare lock-step RPC calls against pipelined ones, with raw one-way messaging as the ceiling.
+
+The server runs in a subprocess. Lock-step calls wait for each reply before making the next call; pipelined calls
+keep up to a window of calls outstanding with RpcClient.call_async(), and batched calls do the same but write half a
+window of requests at a time with RpcClient.call_many().
+
+Run from the repository root with:
+
+    python -m benchmarks.rpc
+"""
+from __future__ import print_function
+import argparse
+import multiprocessing
+import time
+
+from ductworks.message_duct import MessageDuctParent, MessageDuctChild
+from ductworks.rpc import RpcClient, RpcServer, RpcRegistry
+
+# The highest resolution clock available.
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def echo(value):
+    return value
+
+
+def run_server(listener_address):
+    registry = RpcRegistry()
+    registry.register(echo)
+    duct = MessageDuctChild.psuedo_anonymous_child_duct(listener_address, timeout=None)
+    duct.connect()
+    RpcServer(duct, registry).serve_forever()
+    duct.close()
+
+
+def run_sink(listener_address, count):
+    duct = MessageDuctChild.psuedo_anonymous_child_duct(listener_address, timeout=None)
+    duct.connect()
+    for _ in range(count):
+        duct.recv()
+    duct.send('done')
+    duct.close()
+
+
+def connect_to(target, *args):
+    parent = MessageDuctParent.psuedo_anonymous_parent_duct()
+    parent.bind()
+    peer = multiprocessing.Process(target=target, args=(parent.listener_address,) + args)
+    peer.start()
+    if not parent.listen():
+        raise RuntimeError("The benchmark peer never connected!")
+    return parent, peer
+
+
+def lock_step(client, payload, count):
+    for _ in range(count):
+        client.call('echo', payload)
+
+
+def pipelined(client, payload, count, window):
+    futures = []
+    for _ in range(count):
+        futures.append(client.call_async('echo', payload))
+        if len(futures) >= window:
+            # Wait for the oldest half of the window, so new calls go out while the rest are answered.
+            for future in futures[:window // 2]:
+                future.result()
+            del futures[:window // 2]
+    for future in futures:
+        future.result()
+
+
+def batched(client, payload, count, window):
+    futures = []
+    for sent in range(0, count, window // 2):
+        # Send half a window of calls in one write, then wait for the half sent before it.
+        futures.extend(client.call_many([('echo', [payload])] * min(window // 2, count - sent)))
+        if len(futures) >= window:
+            for future in futures[:window // 2]:
+                future.result()
+            del futures[:window // 2]
+    for future in futures:
+        future.result()
+
+
+def measure_calls(mode, payload, count, window):
+    parent, server = connect_to(run_server)
+    client = RpcClient(parent)
+    try:
+        client.call('echo', payload)
+        started = clock()
+        if mode == 'lock-step':
+            lock_step(client, payload, count)
+        elif mode == 'pipelined':
+            pipelined(client, payload, count, window)
+        else:
+            batched(client, payload, count, window)
+        return count / (clock() - started)
+    finally:
+        client.close()
+        server.join()
+
+
+def measure_one_way(payload, count):
+    parent, sink = connect_to(run_sink, count)
+    try:
+        started = clock()
+        for _ in range(count):
+            parent.send(['call', 1, 'echo', [payload], {}])
+        parent.recv()
+        return count / (clock() - started)
+    finally:
+        parent.close()
+        sink.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000, help="Calls (or messages) per measurement.")
+    parser.add_argument('--window', type=int, default=256, help="The most pipelined calls outstanding at once.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 1024], help="Payload sizes, in bytes.")
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>14}".format("mode", "size", "calls/s"))
+    for size in args.sizes:
+        payload = 'x' * size
+        for mode in ('lock-step', 'pipelined', 'batched'):
+            print("{:>10} {:>10} {:>14.0f}".format(mode, size, measure_calls(mode, payload, args.count, args.window)))
+        print("{:>10} {:>10} {:>14.0f}".format("one-way", size, measure_one_way(payload, args.count)))
+
+
+if __name__ == '__main__':
+    main()
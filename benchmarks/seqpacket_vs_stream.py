@@ -0,0 +1,81 @@
+"""
+Compare message ducts running over SOCK_STREAM and SOCK_SEQPACKET socket pairs.
+
+Run from the repository root with:
+
+    python -m benchmarks.seqpacket_vs_stream
+"""
+from __future__ import print_function
+import argparse
+import threading
+import time
+
+from ductworks.message_duct import create_anonymous_duct_pair, create_anonymous_seqpacket_duct_pair
+
+
+def identity(payload):
+    return payload
+
+
+def one_way_throughput(pair_factory, payload, count):
+    parent, child = pair_factory(serialize=identity, deserialize=identity)
+
+    def sender():
+        for _ in range(count):
+            child.send(payload)
+
+    t = threading.Thread(target=sender)
+    start_time = time.time()
+    t.start()
+    for _ in range(count):
+        parent.recv()
+    elapsed = time.time() - start_time
+    t.join()
+    child.close()
+    parent.close()
+    return count / elapsed, count * len(payload) / elapsed
+
+
+def ping_pong_latency(pair_factory, payload, count):
+    parent, child = pair_factory(serialize=identity, deserialize=identity)
+
+    def echo():
+        for _ in range(count):
+            child.send(child.recv())
+
+    t = threading.Thread(target=echo)
+    t.start()
+    start_time = time.time()
+    for _ in range(count):
+        parent.send(payload)
+        parent.recv()
+    elapsed = time.time() - start_time
+    t.join()
+    child.close()
+    parent.close()
+    return elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000, help="Messages per measurement.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 256, 4096, 60000, 1024 * 1024],
+                        help="Payload sizes, in bytes.")
+    args = parser.parse_args()
+
+    transports = [('stream', create_anonymous_duct_pair), ('seqpacket', create_anonymous_seqpacket_duct_pair)]
+    print("{:>10} {:>10} {:>14} {:>14} {:>14}".format("transport", "size", "msgs/s", "MB/s", "rtt (us)"))
+    for size in args.sizes:
+        payload = b'x' * size
+        # Keep the total amount of data per measurement reasonable for big payloads.
+        count = max(10, min(args.count, (256 * 1024 * 1024) // size))
+        for name, pair_factory in transports:
+            messages_per_second, bytes_per_second = one_way_throughput(pair_factory, payload, count)
+            latency = ping_pong_latency(pair_factory, payload, max(10, count // 4))
+            print("{:>10} {:>10} {:>14.0f} {:>14.1f} {:>14.1f}".format(
+                name, size, messages_per_second, bytes_per_second / (1024 * 1024), latency * 1e6
+            ))
+
+
+if __name__ == '__main__':
+    main()
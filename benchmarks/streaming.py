@@ -0,0 +1,78 @@
+"""
+Compare sending a large payload as one message against sending it as a stream of chunks, by throughput and by the
+peak memory of the process holding both ends.
+
+A single message has to be held whole by the sender, and is received whole into a buffer of its own, so moving one
+takes about twice its size in memory. A stream only ever holds the chunk being sent and the chunk being received.
+
+Run from the repository root with:
+
+    python -m benchmarks.streaming
+"""
+from __future__ import print_function
+import argparse
+import resource
+import threading
+import time
+
+from ductworks.message_duct import create_anonymous_duct_pair
+
+# The highest resolution clock available.
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def identity(payload):
+    return payload
+
+
+def peak_memory_mb():
+    # Linux reports the peak resident set size in kilobytes.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def stream_throughput(total_size, chunk_size):
+    parent, child = create_anonymous_duct_pair()
+    chunk = b'x' * chunk_size
+    sender = threading.Thread(target=parent.send_stream, args=((chunk for _ in range(total_size // chunk_size)),))
+    start_time = clock()
+    sender.start()
+    received = 0
+    for received_chunk in child.recv_stream():
+        received += len(received_chunk)
+    sender.join()
+    elapsed = clock() - start_time
+    child.close()
+    parent.close()
+    return received / elapsed
+
+
+def message_throughput(total_size):
+    parent, child = create_anonymous_duct_pair(serialize=identity, deserialize=identity)
+    payload = b'x' * total_size
+    sender = threading.Thread(target=parent.send, args=(payload,))
+    start_time = clock()
+    sender.start()
+    received = len(child.recv())
+    sender.join()
+    elapsed = clock() - start_time
+    child.close()
+    parent.close()
+    return received / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=1024 * 1024 * 1024, help="Total payload size, in bytes.")
+    parser.add_argument('--chunk-size', type=int, default=4 * 1024 * 1024, help="Stream chunk size, in bytes.")
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>16}".format("mode", "MB/s", "peak memory (MB)"))
+    # The peak only ever goes up, so the stream goes first.
+    throughput = stream_throughput(args.size, args.chunk_size)
+    print("{:>10} {:>12.0f} {:>16.0f}".format("stream", throughput / 1e6, peak_memory_mb()))
+    throughput = message_throughput(args.size)
+    print("{:>10} {:>12.0f} {:>16.0f}".format("message", throughput / 1e6, peak_memory_mb()))
+
+
+if __name__ == '__main__':
+    main()
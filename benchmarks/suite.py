@@ -0,0 +1,273 @@
+"""
+Measure message duct latency and throughput across transports, payload sizes, codecs, locking, and peer kinds.
+
+Every combination selected on the command line is run as its own measurement: a ping-pong round trip latency
+distribution (p50/p99/p999) and a one-way throughput run. multiprocessing.Pipe is included as a baseline. Results
+can be written out as JSON, and a previous results file can be compared against, so that regressions show up
+between releases.
+
+Run from the repository root with, for instance:
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --transports uds pipe --sizes 16 4096 --compare results.json
+"""
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import threading
+import time
+
+from ductworks import __version__
+from ductworks.message_duct import MessageDuctParent, MessageDuctChild, CODECS
+
+# The highest resolution clock available.
+clock = getattr(time, 'perf_counter', time.time)
+
+TRANSPORTS = ('uds', 'tcp', 'pipe')
+PEERS = ('thread', 'subprocess')
+LOCKING = ('unlocked', 'locked')
+DEFAULT_SIZES = (16, 256, 4096, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 256 * 1024 * 1024)
+# multiprocessing.Pipe always pickles, so its results are labelled with this codec.
+PIPE_CODEC = 'pickle'
+
+# The fields identifying a measurement, used to match results up when comparing two runs.
+KEY_FIELDS = ('transport', 'codec', 'size', 'locking', 'peer')
+
+
+def make_payload(size):
+    # A string is the one payload every codec can carry, and is sent as-is by the tagged codec.
+    return 'x' * size
+
+
+def duct_kwargs(codec_name, locking):
+    codec = CODECS[codec_name]
+    return {
+        'serialize': codec.serialize,
+        'deserialize': codec.deserialize,
+        'out_of_band': codec.out_of_band,
+        'lock': multiprocessing.Lock() if locking == 'locked' else None,
+    }
+
+
+def open_parent_end(transport, codec_name, locking):
+    """
+    Create the measuring end of a connection, and the spec the peer needs to build the other end.
+    """
+    if transport == 'pipe':
+        parent_conn, child_conn = multiprocessing.Pipe()
+        return parent_conn, (transport, child_conn, codec_name, locking)
+    if transport == 'tcp':
+        parent = MessageDuctParent.psuedo_anonymous_tcp_parent_duct(**duct_kwargs(codec_name, locking))
+    else:
+        parent = MessageDuctParent.psuedo_anonymous_parent_duct(**duct_kwargs(codec_name, locking))
+    parent.bind()
+    return parent, (transport, parent.listener_address, codec_name, locking)
+
+
+def open_peer_end(peer_spec):
+    transport, address, codec_name, locking = peer_spec
+    if transport == 'pipe':
+        return address
+    if transport == 'tcp':
+        child = MessageDuctChild.psuedo_anonymous_tcp_child_duct(address[0], address[1],
+                                                                 **duct_kwargs(codec_name, locking))
+    else:
+        child = MessageDuctChild.psuedo_anonymous_child_duct(address, **duct_kwargs(codec_name, locking))
+    child.connect()
+    return child
+
+
+def run_peer(peer_spec, mode, size, count):
+    """
+    The far end of a measurement, run in a thread or a subprocess. In 'echo' mode it sends back every message it
+    receives; in 'send' mode it waits for a go message and then sends count messages of the given size.
+    """
+    peer_end = open_peer_end(peer_spec)
+    try:
+        if mode == 'echo':
+            for _ in range(count):
+                peer_end.send(peer_end.recv())
+        else:
+            payload = make_payload(size)
+            peer_end.recv()
+            for _ in range(count):
+                peer_end.send(payload)
+            # Don't close until everything has been read, or the last messages may be cut off.
+            peer_end.recv()
+    finally:
+        peer_end.close()
+
+
+def start_peer(peer, peer_spec, mode, size, count):
+    if peer == 'subprocess':
+        worker = multiprocessing.Process(target=run_peer, args=(peer_spec, mode, size, count))
+    else:
+        worker = threading.Thread(target=run_peer, args=(peer_spec, mode, size, count))
+    worker.daemon = True
+    worker.start()
+    return worker
+
+
+def connect(parent_end, transport):
+    if transport != 'pipe':
+        if not parent_end.listen():
+            raise RuntimeError("The benchmark peer never connected!")
+
+
+def percentile(sorted_samples, fraction):
+    # Nearest rank, so the result is always a latency that was actually observed.
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def measure_latency(transport, codec_name, locking, peer, size, count, warmup):
+    parent_end, peer_spec = open_parent_end(transport, codec_name, locking)
+    worker = start_peer(peer, peer_spec, 'echo', size, count + warmup)
+    try:
+        connect(parent_end, transport)
+        payload = make_payload(size)
+        samples = []
+        for i in range(count + warmup):
+            started = clock()
+            parent_end.send(payload)
+            parent_end.recv()
+            if i >= warmup:
+                samples.append(clock() - started)
+    finally:
+        worker.join()
+        parent_end.close()
+    samples.sort()
+    return {
+        'latency_count': count,
+        'latency_mean_us': sum(samples) / len(samples) * 1e6,
+        'latency_p50_us': percentile(samples, 0.50) * 1e6,
+        'latency_p99_us': percentile(samples, 0.99) * 1e6,
+        'latency_p999_us': percentile(samples, 0.999) * 1e6,
+    }
+
+
+def measure_throughput(transport, codec_name, locking, peer, size, count):
+    parent_end, peer_spec = open_parent_end(transport, codec_name, locking)
+    worker = start_peer(peer, peer_spec, 'send', size, count)
+    try:
+        connect(parent_end, transport)
+        started = clock()
+        parent_end.send('go')
+        for _ in range(count):
+            parent_end.recv()
+        elapsed = clock() - started
+        parent_end.send('done')
+    finally:
+        worker.join()
+        parent_end.close()
+    return {
+        'throughput_count': count,
+        'messages_per_second': count / elapsed,
+        'megabytes_per_second': count * size / elapsed / (1024 * 1024),
+    }
+
+
+def scaled_count(count, size, max_bytes):
+    # Keep the amount of data moved per measurement bounded for big payloads, but always take a few samples.
+    return max(3, min(count, max_bytes // max(size, 1)))
+
+
+def measurements(args):
+    for transport in args.transports:
+        for codec_name in ([PIPE_CODEC] if transport == 'pipe' else args.codecs):
+            # multiprocessing.Pipe has no lock of its own.
+            for locking in (['unlocked'] if transport == 'pipe' else args.locking):
+                for peer in args.peers:
+                    for size in args.sizes:
+                        yield transport, codec_name, locking, peer, size
+
+
+def run_measurement(args, transport, codec_name, locking, peer, size):
+    result = dict(zip(KEY_FIELDS, (transport, codec_name, size, locking, peer)))
+    count = scaled_count(args.count, size, args.max_bytes)
+    result.update(measure_latency(transport, codec_name, locking, peer, size, max(3, count // 4),
+                                  min(args.warmup, count)))
+    result.update(measure_throughput(transport, codec_name, locking, peer, size, count))
+    return result
+
+
+def result_key(result):
+    return tuple(result[field] for field in KEY_FIELDS)
+
+
+def print_header(compare):
+    columns = ["transport", "codec", "size", "locking", "peer", "p50 (us)", "p99 (us)", "p999 (us)", "msgs/s",
+               "MB/s"]
+    if compare:
+        columns.append("vs. baseline")
+    print(" ".join("{:>11}".format(column) for column in columns))
+
+
+def print_result(result, baseline=None):
+    line = "{transport:>11} {codec:>11} {size:>11} {locking:>11} {peer:>11} {latency_p50_us:>11.1f} " \
+           "{latency_p99_us:>11.1f} {latency_p999_us:>11.1f} {messages_per_second:>11.0f} " \
+           "{megabytes_per_second:>11.1f}".format(**result)
+    if baseline is not None:
+        # Above 1.0 is faster than the baseline run, for both latency and throughput.
+        line += " {:>+6.0%} p50 {:>+6.0%} msgs/s".format(
+            baseline['latency_p50_us'] / result['latency_p50_us'] - 1,
+            result['messages_per_second'] / baseline['messages_per_second'] - 1
+        )
+    print(line)
+    sys.stdout.flush()
+
+
+def environment():
+    return {
+        'ductworks_version': __version__,
+        'python_version': platform.python_version(),
+        'python_implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'timestamp': time.time(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transports', nargs='+', choices=TRANSPORTS, default=list(TRANSPORTS),
+                        help="Transports to measure; 'pipe' is the multiprocessing.Pipe baseline.")
+    parser.add_argument('--codecs', nargs='+', choices=sorted(CODECS), default=['json'],
+                        help="Codecs to measure the ducts with. Default: json, the duct default.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Payload sizes, in bytes.")
+    parser.add_argument('--locking', nargs='+', choices=LOCKING, default=list(LOCKING),
+                        help="Whether to measure ducts created with a lock, without one, or both.")
+    parser.add_argument('--peers', nargs='+', choices=PEERS, default=list(PEERS),
+                        help="Run the other end in a thread, in a subprocess, or both.")
+    parser.add_argument('--count', type=int, default=20000,
+                        help="Messages per throughput measurement; latency uses a quarter as many round trips.")
+    parser.add_argument('--max-bytes', type=int, default=512 * 1024 * 1024,
+                        help="Cap on the bytes moved per measurement, which lowers the count for big payloads.")
+    parser.add_argument('--warmup', type=int, default=100, help="Untimed round trips before measuring latency.")
+    parser.add_argument('--output', help="Write the results to this file as JSON.")
+    parser.add_argument('--compare', help="A JSON results file from an earlier run to compare against.")
+    args = parser.parse_args()
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as compare_file:
+            baselines = dict((result_key(result), result) for result in json.load(compare_file)['results'])
+
+    results = []
+    print_header(bool(baselines))
+    for transport, codec_name, locking, peer, size in measurements(args):
+        result = run_measurement(args, transport, codec_name, locking, peer, size)
+        results.append(result)
+        print_result(result, baselines.get(result_key(result)))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'environment': environment(), 'results': results}, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
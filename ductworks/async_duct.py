@@ -0,0 +1,416 @@
+import asyncio
+import errno
+import os
+from tempfile import NamedTemporaryFile
+
+from ductworks.base_duct import AlreadyConnectedException, NotConnectedException, ConnectBackoff, \
+    random_abstract_namespace_address, ABSTRACT_NAMESPACE_SUPPORTED, is_abstract_namespace_address
+from ductworks.compression import FrameCompressor
+from ductworks.framing import FrameReader, MessageProtocolException, RemoteDuctClosed, pack_frame_header, \
+    parse_frame_header, FRAME_FLAG_COMPRESSED, FRAME_FLAG_PRIORITY
+from ductworks.serialization import default_serializer, default_deserializer, serialized_buffers, serialized_length
+
+
+class BaseAsyncMessageDuct(object):
+    """
+    The BaseAsyncMessageDuct holds the behavior shared by both ends of an asyncio message duct. The async ducts use
+    exactly the same message envelope as the ducts in ductworks.message_duct, so a synchronous duct on one end
+    can talk to an asynchronous duct on the other.
+
+    Messages are read through the event loop's buffered StreamReader, and sends apply backpressure by awaiting the
+    StreamWriter's drain(), so a slow peer suspends the sending coroutine rather than blocking the event loop.
+
+    Async ducts read any frame a synchronous duct can send, including frames over 4 GiB, compressed frames (made
+    without a compression dictionary) and PRIORITY_HIGH messages, which are simply received in the order they
+    arrive. They don't support the handshake, channels, shared memory, file descriptors or out-of-band buffers, and
+    a MessageProtocolException is raised if any of those turn up.
+
+    Given a max_frame_size, a MessageProtocolException is raised for any frame longer than that, before reading
+    any of it, so a peer can't make the duct allocate however much memory its frame header claims.
+    """
+
+    def __init__(self, serialize=default_serializer, deserialize=default_deserializer, max_frame_size=None):
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.max_frame_size = max_frame_size
+        self.reader = None
+        self.writer = None
+        self.recv_lock = asyncio.Lock()
+        self.frame_compressor = FrameCompressor()
+
+    def _check_connected(self):
+        if self.writer is None:
+            raise NotConnectedException("Must be connected to other end to send/receive data!")
+
+    def _write_message(self, payload):
+        serialized_payload = self.serialize(payload)
+        self.writer.write(pack_frame_header(serialized_length(serialized_payload)))
+        self.writer.writelines(serialized_buffers(serialized_payload))
+
+    async def _read_frame(self):
+        try:
+            header = await self.reader.readexactly(FrameReader.HEADER_SIZE)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise RemoteDuctClosed("Remote duct closed mid-message!")
+            raise RemoteDuctClosed("Remote duct closed.")
+        try:
+            parsed_header = parse_frame_header(header)
+            while parsed_header is None:
+                # Extended headers carry a flags byte, and wide ones a 64 bit length, past the plain header.
+                header_size = FrameReader.EXTENDED_HEADER_SIZE
+                if len(header) >= header_size:
+                    header_size = FrameReader.WIDE_HEADER_SIZE
+                header += await self.reader.readexactly(header_size - len(header))
+                parsed_header = parse_frame_header(header)
+            flags, _, payload_len = parsed_header
+            if self.max_frame_size is not None and payload_len > self.max_frame_size:
+                raise MessageProtocolException("Received a {} byte frame, larger than the {} byte limit!"
+                                               "".format(payload_len, self.max_frame_size))
+            return flags, await self.reader.readexactly(payload_len)
+        except asyncio.IncompleteReadError:
+            raise RemoteDuctClosed("Remote duct closed mid-message!")
+
+    def fileno(self):
+        """
+        Get the file descriptor of the underlying connection socket.
+
+        A NotConnectedException is raised if the duct hasn't been connected to the other end yet.
+
+        :return: The connection file descriptor.
+        :rtype: int
+        """
+        self._check_connected()
+        return self.writer.get_extra_info('socket').fileno()
+
+    async def send(self, payload):
+        """
+        Send a payload to the other end, waiting for the write buffer to drain if the other end isn't keeping up.
+
+        :param payload: A serializable Python object to send to the other duct.
+        :return: None
+        """
+        self._check_connected()
+        # The whole frame is written before the first await, so concurrent senders can't interleave their frames.
+        self._write_message(payload)
+        await self.writer.drain()
+
+    async def send_many(self, payloads):
+        """
+        Send a batch of payloads to the other end, draining the write buffer once for the whole batch.
+
+        :param payloads: An iterable of serializable Python objects to send to the other duct.
+        :return: The number of payloads sent.
+        :rtype: int
+        """
+        self._check_connected()
+        sent_count = 0
+        for payload in payloads:
+            self._write_message(payload)
+            sent_count += 1
+        await self.writer.drain()
+        return sent_count
+
+    async def recv(self):
+        """
+        Receive a payload from the other end, waiting for one to arrive if none is present.
+
+        A RemoteDuctClosed exception is raised if the other end closed the connection.
+
+        :return: A deserialized Python object from the other end of the duct.
+        """
+        self._check_connected()
+        async with self.recv_lock:
+            flags, serialized_payload = await self._read_frame()
+        # There's only one lane to receive on, so PRIORITY_HIGH messages are simply received in the order they came.
+        flags &= ~FRAME_FLAG_PRIORITY
+        if flags == FRAME_FLAG_COMPRESSED:
+            serialized_payload = self.frame_compressor.decompress(serialized_payload)
+        elif flags:
+            raise MessageProtocolException("Received a frame with flags async ducts don't support: {:#04x}. The "
+                                           "other end must not use the handshake, channels, shared memory, file "
+                                           "descriptors or out-of-band buffers.".format(flags))
+        return self.deserialize(serialized_payload)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.recv()
+        except RemoteDuctClosed:
+            raise StopAsyncIteration
+
+    async def close(self):
+        """
+        Close the connection, waiting for any buffered outgoing data to be flushed.
+
+        :return: None
+        """
+        if self.writer is not None:
+            writer = self.writer
+            self.reader = self.writer = None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+class AsyncMessageDuctParent(BaseAsyncMessageDuct):
+    """
+    The AsyncMessageDuctParent is the asyncio counterpart of ductworks.message_duct.MessageDuctParent. It listens
+    for exactly one child duct to connect, after which the listener is torn down and the pair act like an anonymous
+    socket pair.
+    """
+
+    def __init__(self, bind_address, serialize=default_serializer, deserialize=default_deserializer,
+                 max_frame_size=None):
+        super(AsyncMessageDuctParent, self).__init__(serialize=serialize, deserialize=deserialize,
+                                                     max_frame_size=max_frame_size)
+        self.bind_address = bind_address
+        self.listener_address = None
+        self.server = None
+        self._connection_future = None
+
+    @classmethod
+    def psuedo_anonymous_parent_duct(cls, bind_address=None, serialize=default_serializer,
+                                     deserialize=default_deserializer, abstract_namespace=False, max_frame_size=None):
+        """
+        Create a new psuedo-anonymous async parent message duct with Unix Domain sockets.
+
+        :param bind_address: The (filesystem) address to listen on, if any. If None a new random address will be
+            chosen. Default: None.
+        :type bind_address: basestring | None
+        :param abstract_namespace: If True and no bind address is given, pick a random address in the Linux
+            abstract namespace instead of the filesystem. Other platforms fall back to a filesystem address.
+            Default: False
+        :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+        :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
+        :param max_frame_size: The largest frame to accept, in bytes. Default: None
+        :type max_frame_size: int | None
+        :return: A new AsyncMessageDuctParent.
+        :rtype: ductworks.async_duct.AsyncMessageDuctParent
+        """
+        if bind_address is None and abstract_namespace and ABSTRACT_NAMESPACE_SUPPORTED:
+            bind_address = random_abstract_namespace_address()
+        elif bind_address is None:
+            tmp = NamedTemporaryFile()
+            bind_address = tmp.name
+            tmp.close()
+        return cls(bind_address, serialize=serialize, deserialize=deserialize, max_frame_size=max_frame_size)
+
+    @classmethod
+    def psuedo_anonymous_tcp_parent_duct(cls, bind_address='localhost', bind_port=0, serialize=default_serializer,
+                                         deserialize=default_deserializer, max_frame_size=None):
+        """
+        Create a new psuedo-anonymous async parent message duct with TCP sockets.
+
+        :param bind_address: The interface address to listen on, if any. Default: 'localhost'.
+        :type bind_address: basestring
+        :param bind_port: The port to bind the interface to. If 0, pick the a random open port. Default: 0.
+        :type bind_port: int
+        :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+        :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
+        :param max_frame_size: The largest frame to accept, in bytes. Default: None
+        :type max_frame_size: int | None
+        :return: A new AsyncMessageDuctParent.
+        :rtype: ductworks.async_duct.AsyncMessageDuctParent
+        """
+        return cls((bind_address, bind_port), serialize=serialize, deserialize=deserialize,
+                   max_frame_size=max_frame_size)
+
+    def _on_connection(self, reader, writer):
+        if self._connection_future.done():
+            # Only the first child gets to connect.
+            writer.close()
+        else:
+            self._connection_future.set_result((reader, writer))
+
+    async def bind(self):
+        """
+        Create and bind the listener, if this hasn't been done already.
+
+        This will raise AlreadyConnectedException if the connection has already been established.
+
+        :return: None
+        """
+        if self.writer is not None:
+            raise AlreadyConnectedException("Already connected to other end!")
+        if self.server is None:
+            self._connection_future = asyncio.get_running_loop().create_future()
+            if isinstance(self.bind_address, tuple):
+                host, port = self.bind_address
+                self.server = await asyncio.start_server(self._on_connection, host, port, backlog=1)
+            else:
+                self.server = await asyncio.start_unix_server(self._on_connection, self.bind_address, backlog=1)
+            self.listener_address = self.server.sockets[0].getsockname()
+
+    def _close_server(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            if not isinstance(self.bind_address, tuple) and \
+                    not is_abstract_namespace_address(self.listener_address):
+                try:
+                    os.unlink(self.listener_address)
+                except OSError:
+                    pass
+
+    async def listen(self, timeout=60):
+        """
+        Wait for a child duct to connect. This will bind if it hasn't been done already.
+
+        This will raise AlreadyConnectedException if the connection has already been established.
+
+        :param timeout: Amount of time to wait for the other end to connect before giving up.
+        :type timeout: float | int
+        :return: True if a connection was received and connected, False otherwise.
+        :rtype: bool
+        """
+        if self.writer is not None:
+            raise AlreadyConnectedException("Already connected to other end!")
+        await self.bind()
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.shield(self._connection_future), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._close_server()
+        return True
+
+    async def close(self):
+        """
+        Close the connection or listener, if they're open.
+
+        :return: None
+        """
+        self._close_server()
+        await super(AsyncMessageDuctParent, self).close()
+
+
+class AsyncMessageDuctChild(BaseAsyncMessageDuct):
+    """
+    The AsyncMessageDuctChild is the asyncio counterpart of ductworks.message_duct.MessageDuctChild, and should be
+    connected to a listening MessageDuctParent or AsyncMessageDuctParent.
+    """
+
+    DEFAULT_CONNECT_TIMEOUT = 10
+    # Deprecated, as on RawDuctChild: connect() retries with a backoff until connect_timeout runs out by default, but
+    # passing these to it still retries on the old schedule.
+    DEFAULT_CONNECT_RETRY_COUNT = 3
+    DEFAULT_RETRY_DELAY = 3
+
+    def __init__(self, connect_address, serialize=default_serializer, deserialize=default_deserializer,
+                 max_frame_size=None):
+        super(AsyncMessageDuctChild, self).__init__(serialize=serialize, deserialize=deserialize,
+                                                    max_frame_size=max_frame_size)
+        self.connect_address = connect_address
+
+    @classmethod
+    def psuedo_anonymous_child_duct(cls, connect_address, serialize=default_serializer,
+                                    deserialize=default_deserializer, max_frame_size=None):
+        """
+        Create a new psuedo-anonymous async child message duct with Unix Domain sockets.
+
+        :param connect_address: The filesystem address to connect to. Get this from parent_duct.listener_address.
+        :type connect_address: basestring
+        :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+        :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
+        :param max_frame_size: The largest frame to accept, in bytes. Default: None
+        :type max_frame_size: int | None
+        :return: A new AsyncMessageDuctChild.
+        :rtype: ductworks.async_duct.AsyncMessageDuctChild
+        """
+        return cls(connect_address, serialize=serialize, deserialize=deserialize, max_frame_size=max_frame_size)
+
+    @classmethod
+    def psuedo_anonymous_tcp_child_duct(cls, connect_address, connect_port, serialize=default_serializer,
+                                        deserialize=default_deserializer, max_frame_size=None):
+        """
+        Create a new psuedo-anonymous async child message duct with TCP sockets.
+
+        :param connect_address: The interface address to connect to. Get this from parent_duct.listener_address[0].
+        :type connect_address: basestring
+        :param connect_port: The TCP port to connect to. Get this from parent_duct.listener_address[1].
+        :type connect_port: int
+        :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+        :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
+        :param max_frame_size: The largest frame to accept, in bytes. Default: None
+        :type max_frame_size: int | None
+        :return: A new AsyncMessageDuctChild.
+        :rtype: ductworks.async_duct.AsyncMessageDuctChild
+        """
+        return cls((connect_address, connect_port), serialize=serialize, deserialize=deserialize,
+                   max_frame_size=max_frame_size)
+
+    async def connect(self, connect_retry_count=None, connect_retry_delay=None,
+                      connect_timeout=DEFAULT_CONNECT_TIMEOUT, backoff=None):
+        """
+        Attempt to connect to another duct, retrying with an exponential backoff if the connection is refused or
+        the file system entry for the Unix Domain socket does not exist yet.
+
+        AlreadyConnectedException is raised if the connection has already been established. If the connection
+        can't be made before the deadline, the last connection error is raised.
+
+        :param connect_retry_count: The maximum number of times to retry connecting. If None, retry until
+            connect_timeout runs out. Before the backoff was added, this was DEFAULT_CONNECT_RETRY_COUNT by default.
+            Default: None
+        :type connect_retry_count: int | None
+        :param connect_retry_delay: A fixed amount of time to wait between successive connect retries. If None, use
+            the exponential backoff instead. Before the backoff was added, this was DEFAULT_RETRY_DELAY by default.
+            Default: None
+        :type connect_retry_delay: int | float | None
+        :param connect_timeout: The total amount of time to keep trying to connect, in seconds. If None, there is
+            no deadline. Default: 10
+        :type connect_timeout: int | float | None
+        :param backoff: The backoff schedule for retries. If None, a ConnectBackoff with default settings is used.
+            Default: None
+        :type backoff: ductworks.base_duct.ConnectBackoff | None
+        :return: None
+        """
+        if self.writer is not None:
+            raise AlreadyConnectedException("Already connected to other end!")
+        loop = asyncio.get_running_loop()
+        deadline = None if connect_timeout is None else loop.time() + connect_timeout
+        delays = (backoff or ConnectBackoff()).delays()
+        while True:
+            try:
+                if isinstance(self.connect_address, tuple):
+                    host, port = self.connect_address
+                    self.reader, self.writer = await asyncio.open_connection(host, port)
+                else:
+                    self.reader, self.writer = await asyncio.open_unix_connection(self.connect_address)
+                return
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ECONNREFUSED) or connect_retry_count == 0:
+                    raise e
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    raise e
+                if connect_retry_count is not None:
+                    connect_retry_count -= 1
+                delay = next(delays) if connect_retry_delay is None else connect_retry_delay
+                await asyncio.sleep(delay if remaining is None else min(delay, remaining))
+
+
+async def create_psuedo_anonymous_async_duct_pair(serialize=default_serializer, deserialize=default_deserializer,
+                                                  max_frame_size=None):
+    """
+    Create an already connected pair of anonymous async ducts, running on the current event loop.
+
+    :param serialize: The serializer function for the pair. Defaults to encoded JSON.
+    :param deserialize: The deserializer funtion for the pair. Defaults to encoded JSON.
+    :param max_frame_size: The largest frame either duct accepts, in bytes. Default: None
+    :type max_frame_size: int | None
+    :return: A parent/child pair of ducts.
+    :rtype: (ductworks.async_duct.AsyncMessageDuctParent, ductworks.async_duct.AsyncMessageDuctChild)
+    """
+    parent = AsyncMessageDuctParent.psuedo_anonymous_parent_duct(serialize=serialize, deserialize=deserialize,
+                                                                 max_frame_size=max_frame_size)
+    await parent.bind()
+    child = AsyncMessageDuctChild.psuedo_anonymous_child_duct(
+        parent.listener_address, serialize=serialize, deserialize=deserialize, max_frame_size=max_frame_size
+    )
+    await child.connect()
+    await parent.listen()
+    return parent, child
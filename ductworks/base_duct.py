@@ -4,6 +4,34 @@ import os
 import struct
 import errno
 import time
+import sys
+import random
+import array
+from binascii import hexlify
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+# The kernel refuses sendmsg calls with more than IOV_MAX buffers in the scatter/gather list.
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = -1
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+# Linux lets Unix Domain sockets be bound to names in an "abstract namespace", which never touch the filesystem.
+ABSTRACT_NAMESPACE_SUPPORTED = sys.platform.startswith('linux')
+
+# Open file descriptors can be handed across Unix Domain sockets as SCM_RIGHTS ancillary data.
+FD_PASSING_SUPPORTED = hasattr(socket, 'AF_UNIX') and hasattr(socket, 'SCM_RIGHTS') and \
+    hasattr(socket.socket, 'sendmsg')
+
+# The most descriptors Linux accepts in a single SCM_RIGHTS message (SCM_MAX_FD).
+MAX_FDS_PER_MESSAGE = 253
 
 
 class DuctworksException(Exception):
@@ -16,8 +44,8 @@ class DuctworksException(Exception):
 
 class CommunicationFaultException(DuctworksException):
     """
-    This exception is thrown when the underlying listener socket in the parent is returned in
-    the error list on the select syscall while waiting for the child to connect.
+    This exception is thrown when the underlying listener socket in the parent reports an error condition
+    while waiting for the child to connect.
     """
     pass
 
@@ -40,8 +68,8 @@ class NotConnectedException(DuctworksException):
 
 class LocalSocketFault(DuctworksException):
     """
-    This exception is thrown when the underlying communication socket is returned in
-    the error list on the select syscall.
+    This exception is thrown when the underlying communication socket reports an error condition
+    while polling.
     """
     pass
 
@@ -61,6 +89,23 @@ def unix_domain_socket_constructor(linger_time=3):
     return new_socket
 
 
+def unix_domain_seqpacket_socket_constructor(linger_time=3):
+    """
+    Create a new UDS sequenced-packet socket with reasonable socket options set. Unlike a streaming socket, a
+    SOCK_SEQPACKET socket preserves message boundaries: each send is received by exactly one recv on the other end.
+    This is only supported on Linux (and a few other platforms).
+
+    :param linger_time: The linger time after closing the socket to allow buffers to flush. Default: 3
+    :type linger_time: int
+    :return: A new Unix Domain sequenced-packet socket.
+    :rtype: socket.socket
+    """
+    new_socket = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    new_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    new_socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, linger_time))
+    return new_socket
+
+
 def tcp_socket_constructor(linger_time=10, tcp_no_delay=1):
     """
     Create a new TCP socket with reasonable socket options set.
@@ -82,6 +127,32 @@ def tcp_socket_constructor(linger_time=10, tcp_no_delay=1):
     return new_socket
 
 
+def random_abstract_namespace_address(prefix='ductworks'):
+    """
+    Build a new random Unix Domain socket address in the Linux abstract namespace. Binding to one of these never
+    creates a file, so there is nothing to clean up on disk afterwards.
+
+    :param prefix: A human readable prefix for the address, to make it easier to identify. Default: 'ductworks'
+    :type prefix: str
+    :return: The new abstract namespace address.
+    :rtype: str
+    """
+    return '\0{}-{}'.format(prefix, hexlify(os.urandom(16)).decode('ascii'))
+
+
+def is_abstract_namespace_address(address):
+    """
+    Check if a Unix Domain socket address is in the Linux abstract namespace (or is unnamed), and so has no
+    filesystem entry.
+
+    :param address: The address to check.
+    :type address: str | bytes
+    :return: True if the address has no filesystem entry, False otherwise.
+    :rtype: bool
+    """
+    return not address or address[:1] in ('\0', b'\0')
+
+
 def unix_domain_socket_listener_destructor(listener_socket, shutdown=False, shutdown_mode=socket.SHUT_RDWR):
     """
     Close and clean up a Unix Domain listener socket.
@@ -98,12 +169,30 @@ def unix_domain_socket_listener_destructor(listener_socket, shutdown=False, shut
     if shutdown:
         listener_socket.shutdown(shutdown_mode)
     listener_socket.close()
+    if is_abstract_namespace_address(socket_address):
+        return
     try:
         os.unlink(socket_address)
     except OSError:
         pass
 
 
+def unix_domain_seqpacket_socket_listener_destructor(listener_socket, shutdown=False,
+                                                    shutdown_mode=socket.SHUT_RDWR):
+    """
+    Close and clean up a Unix Domain sequenced-packet listener socket.
+
+    :param listener_socket: The socket to close down.
+    :type listener_socket: socket.socket
+    :param shutdown: Should shutdown be performed on the socket? (Usually no). Default: False
+    :type shutdown: bool
+    :param shutdown_mode: The parameters to be passed to the socket's shutdown function.
+    :type shutdown_mode: int
+    :return: None
+    """
+    unix_domain_socket_listener_destructor(listener_socket, shutdown=shutdown, shutdown_mode=shutdown_mode)
+
+
 def tcp_socket_listener_destructor(listener_socket, shutdown=False, shutdown_mode=socket.SHUT_RDWR):
     """
     Close and clean up a TCP listener socket.
@@ -138,6 +227,260 @@ def client_socket_destructor(client_socket, shutdown=False, shutdown_mode=socket
     client_socket.close()
 
 
+def sendmsg_all(sock, buffers, ancdata=None, flags=None):
+    """
+    Write every byte of a scatter/gather list of buffers to a socket, using as few sendmsg calls as possible.
+    The buffers are never concatenated; partial writes are resumed from wherever the kernel stopped, and lists
+    longer than IOV_MAX are split across multiple calls. Any ancillary data is only sent with the first call.
+
+    :param sock: The connected socket to write to.
+    :type sock: socket.socket
+    :param buffers: The bytes-like objects to write, in order.
+    :type buffers: list | tuple
+    :param ancdata: Optional ancillary data (as accepted by socket.sendmsg) to send with the first chunk of data.
+    :type ancdata: list | None
+    :param flags: Optional flags to be set on the socket sendmsg calls.
+    :type flags: int | None
+    :return: The total number of bytes sent.
+    :rtype: int
+    """
+    views = []
+    for buff in buffers:
+        view = memoryview(buff)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        if view:
+            views.append(view)
+    ancdata = list(ancdata) if ancdata else []
+    flags = flags or 0
+    total_sent = 0
+    start = 0
+    while start < len(views) or ancdata:
+        bytes_sent = sock.sendmsg(views[start:start + IOV_MAX], ancdata, flags)
+        ancdata = []
+        total_sent += bytes_sent
+        while bytes_sent and start < len(views):
+            head_len = len(views[start])
+            if bytes_sent >= head_len:
+                bytes_sent -= head_len
+                start += 1
+            else:
+                views[start] = views[start][bytes_sent:]
+                bytes_sent = 0
+    return total_sent
+
+
+def fd_ancillary_data(fds):
+    """
+    Build the ancillary data for sendmsg that hands a list of open file descriptors to the other end of a Unix
+    Domain socket. The other end receives its own duplicates of the descriptors.
+
+    :param fds: The open file descriptors to send.
+    :type fds: list | tuple
+    :return: The ancillary data, ready to give to sendmsg or sendmsg_all.
+    :rtype: list
+    """
+    if not fds:
+        return []
+    return [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))]
+
+
+def fd_ancillary_buffer_size(max_fds=MAX_FDS_PER_MESSAGE):
+    """
+    Get the ancillary buffer size needed by recvmsg to receive up to max_fds file descriptors at once.
+
+    :param max_fds: The most file descriptors to make room for. Default: 253 (SCM_MAX_FD on Linux).
+    :type max_fds: int
+    :return: The ancillary buffer size, in bytes.
+    :rtype: int
+    """
+    return socket.CMSG_SPACE(max_fds * array.array('i').itemsize)
+
+
+def fds_from_ancillary_data(ancdata):
+    """
+    Pull every file descriptor out of the ancillary data returned by recvmsg. The caller owns the descriptors
+    and is responsible for closing them.
+
+    :param ancdata: The ancillary data returned by recvmsg or recvmsg_into.
+    :type ancdata: list
+    :return: The received file descriptors, in the order they were sent.
+    :rtype: list
+    """
+    fds = []
+    for cmsg_level, cmsg_type, cmsg_data in ancdata:
+        if cmsg_level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS:
+            fd_array = array.array('i')
+            fd_array.frombytes(cmsg_data[:len(cmsg_data) - (len(cmsg_data) % fd_array.itemsize)])
+            fds.extend(fd_array)
+    return fds
+
+
+class SocketPoller(object):
+    """
+    A reusable readiness check for a single socket. On platforms with poll(2) the socket is registered once when the
+    poller is built, and every check after that is a single poll syscall; unlike select(2), this keeps working for
+    file descriptors numbered above FD_SETSIZE (usually 1024) and doesn't scale with the descriptor number.
+    Platforms without poll(2) fall back to select(2).
+    """
+
+    if hasattr(select, 'poll'):
+        READ_EVENTS = select.POLLIN | select.POLLPRI | select.POLLHUP
+        FAULT_EVENTS = select.POLLERR | select.POLLNVAL
+
+    def __init__(self, sock):
+        self.socket = sock
+        if hasattr(select, 'poll'):
+            self.poller = select.poll()
+            self.poller.register(sock, self.READ_EVENTS)
+        else:
+            self.poller = None
+
+    def poll(self, timeout):
+        """
+        Wait for the socket to become readable.
+
+        :param timeout: The amount of time to wait in seconds. If 0, don't block; if None, wait indefinitely.
+        :type timeout: float | int | None
+        :return: A pair of booleans; (the socket is readable, the socket has faulted).
+        :rtype: (bool, bool)
+        """
+        if self.poller is None:
+            is_readable, _, is_faulted = map(bool, select.select([self.socket], [], [self.socket], timeout))
+            return is_readable, is_faulted
+        if timeout is not None:
+            timeout = max(timeout, 0) * 1000
+        event_mask = 0
+        for _, events in self.poller.poll(timeout):
+            event_mask |= events
+        is_readable = bool(event_mask & self.READ_EVENTS)
+        # A socket that errored out but still has something to read (like a reset from the remote end) is reported
+        # as readable, so the error surfaces from the following recv call as it would have with select.
+        is_faulted = bool(event_mask & select.POLLNVAL) or (bool(event_mask & self.FAULT_EVENTS) and not is_readable)
+        return is_readable, is_faulted
+
+
+class ConnectBackoff(object):
+    """
+    An exponential backoff schedule with jitter, used to space out connect retries. The first retries come after
+    sub-millisecond delays, so a child that starts just before its parent is ready connects almost immediately,
+    while a parent that takes longer isn't hammered with connection attempts. The jitter keeps a pool of children
+    started at the same moment from retrying in lockstep.
+    """
+
+    DEFAULT_INITIAL_DELAY = 0.0005
+    DEFAULT_MAX_DELAY = 0.25
+    DEFAULT_MULTIPLIER = 2
+    DEFAULT_JITTER = 0.5
+
+    def __init__(self, initial_delay=DEFAULT_INITIAL_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 multiplier=DEFAULT_MULTIPLIER, jitter=DEFAULT_JITTER):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delays(self):
+        """
+        Generate the (endless) sequence of delays to wait between attempts.
+
+        :return: A generator of delays, in seconds.
+        :rtype: generator
+        """
+        delay = self.initial_delay
+        while True:
+            yield delay * (1 - self.jitter * random.random())
+            delay = min(delay * self.multiplier, self.max_delay)
+
+
+class UnixSocketPathWatcher(object):
+    """
+    Wait for a Unix Domain socket path to appear on the filesystem with inotify(7), rather than repeatedly polling
+    for it. This is only available on Linux (and only if libc can be loaded with ctypes); check is_supported()
+    before using it.
+    """
+
+    IN_CREATE = 0x00000100
+    IN_MOVED_TO = 0x00000080
+
+    _libc = None
+
+    @classmethod
+    def _load_libc(cls):
+        if cls._libc is None:
+            if ctypes is None or not sys.platform.startswith('linux'):
+                cls._libc = False
+            else:
+                try:
+                    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                    libc.inotify_init1, libc.inotify_add_watch
+                    cls._libc = libc
+                except (OSError, AttributeError):
+                    cls._libc = False
+        return cls._libc
+
+    @classmethod
+    def is_supported(cls):
+        """
+        Check if inotify based path watching is available on this system.
+
+        :return: True if supported, False otherwise.
+        :rtype: bool
+        """
+        return bool(cls._load_libc())
+
+    def __init__(self, path):
+        libc = self._load_libc()
+        if not libc:
+            raise OSError(errno.ENOSYS, "inotify is not available on this system.")
+        self.path = path
+        self.inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.inotify_fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        directory = os.path.dirname(os.path.abspath(path))
+        if isinstance(directory, str):
+            directory = directory.encode(sys.getfilesystemencoding())
+        if libc.inotify_add_watch(self.inotify_fd, directory, self.IN_CREATE | self.IN_MOVED_TO) < 0:
+            err = ctypes.get_errno()
+            os.close(self.inotify_fd)
+            raise OSError(err, os.strerror(err))
+        self.poller = select.poll()
+        self.poller.register(self.inotify_fd, select.POLLIN)
+
+    def wait(self, timeout):
+        """
+        Wait for the path to exist.
+
+        :param timeout: The longest time to wait, in seconds.
+        :type timeout: int | float
+        :return: True if the path exists, False if it still doesn't after the timeout.
+        :rtype: bool
+        """
+        deadline = time.time() + timeout
+        while not os.path.exists(self.path):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if self.poller.poll(remaining * 1000):
+                try:
+                    # The events themselves don't matter, since the path is checked again anyway.
+                    os.read(self.inotify_fd, 4096)
+                except (BlockingIOError, InterruptedError):
+                    pass
+        return True
+
+    def close(self):
+        """
+        Release the inotify file descriptor.
+
+        :return: None
+        """
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+
 class RawDuctParent(object):
     """
     The RawDuctParent is a thin wrapper over top of a "server" socket, that uses the socket in an "anonymous" way.
@@ -156,9 +499,33 @@ class RawDuctParent(object):
         self.bind_address = bind_address
         self.listener_address = None
         self.listener_socket = None
+        self.listener_poller = None
         self.conn_socket = None
+        self.conn_poller = None
         self.socket_timeout = timeout
 
+    @classmethod
+    def from_connected_socket(cls, conn_socket, server_connection_socket_destructor=client_socket_destructor,
+                              timeout=DEFAULT_TIMEOUT):
+        """
+        Wrap an already connected socket (for instance one end of a socket.socketpair()) in a parent duct, skipping
+        the bind/listen steps entirely.
+
+        :param conn_socket: The connected socket.
+        :type conn_socket: socket.socket
+        :param server_connection_socket_destructor: The destructor to clean up the socket with on close.
+        :param timeout: The number of seconds to block a send/recv call waiting for completion.
+        :type timeout: int | float
+        :return: A new, connected RawDuctParent.
+        :rtype: ductworks.base_duct.RawDuctParent
+        """
+        duct = cls(bind_address=None, server_connection_socket_destructor=server_connection_socket_destructor,
+                   timeout=timeout)
+        conn_socket.settimeout(timeout)
+        duct.conn_socket = conn_socket
+        duct.listener_address = conn_socket.getsockname()
+        return duct
+
     def bind(self, listen_queue_depth=1):
         """
         Create and bind the listener socket, if this hasn't been done already.
@@ -194,8 +561,9 @@ class RawDuctParent(object):
             raise AlreadyConnectedException("Already connected to other end!")
         if self.listener_socket is None:
             self.bind()
-        listener_fd = self.listener_socket.fileno()
-        has_conn, _, is_faulted = map(bool, select.select([listener_fd], [], [listener_fd], timeout))
+        if self.listener_poller is None:
+            self.listener_poller = SocketPoller(self.listener_socket)
+        has_conn, is_faulted = self.listener_poller.poll(timeout)
         if is_faulted:
             self.server_listener_socket_destructor(self.listener_socket, shutdown=True)
             raise CommunicationFaultException("Bind socket faulted!")
@@ -204,6 +572,7 @@ class RawDuctParent(object):
             self.conn_socket.settimeout(self.socket_timeout)
             self.server_listener_socket_destructor(self.listener_socket, shutdown=True)
             self.listener_socket = None
+            self.listener_poller = None
         return bool(self.conn_socket)
 
     def send(self, byte_array, flags=None):
@@ -229,6 +598,27 @@ class RawDuctParent(object):
         else:
             return self.conn_socket.send(byte_array, flags)
 
+    def sendmsg_all(self, buffers, ancdata=None, flags=None):
+        """
+        Send a list of buffers to the other end of the duct as a single scatter/gather write. Unlike send(), this
+        keeps writing until every byte has been sent, and the buffers are handed to the kernel as-is rather than
+        being concatenated into one intermediate buffer first.
+
+        A NotConnectedException is raised if the duct hasn't been bound to the other end yet.
+
+        :param buffers: The bytes-like objects to send to the other end, in order.
+        :type buffers: list | tuple
+        :param ancdata: Optional ancillary data to be sent along with the first chunk of data.
+        :type ancdata: list | None
+        :param flags: Optional flags to be set on the socket sendmsg calls.
+        :type flags: int | None
+        :return: The total number of bytes sent.
+        :rtype: int
+        """
+        if self.conn_socket is None:
+            raise NotConnectedException("Must be connected to other end to send data!")
+        return sendmsg_all(self.conn_socket, buffers, ancdata, flags)
+
     def recv(self, buff_size, flags=None):
         """
         Receive up to buff_size bytes from the remote host.
@@ -277,6 +667,26 @@ class RawDuctParent(object):
         else:
             assert False
 
+    def recvmsg_into(self, buffers, ancbufsize=0, flags=None):
+        """
+        Receive data from the remote host directly into a list of buffers, along with any ancillary data, as a thin
+        wrapper over the underlying socket recvmsg_into call.
+
+        A NotConnectedException is raised if the duct hasn't been bound to the other end yet.
+
+        :param buffers: The writable buffers to receive data into, filled in order.
+        :type buffers: list
+        :param ancbufsize: The size of the buffer for ancillary data. Default: 0
+        :type ancbufsize: int
+        :param flags: Optional flags to be set on the socket recvmsg call.
+        :type flags: int | None
+        :return: A tuple of (number of bytes received, ancillary data, message flags, address).
+        :rtype: (int, list, int, object)
+        """
+        if self.conn_socket is None:
+            raise NotConnectedException("Must be connected to other end to receive data!")
+        return self.conn_socket.recvmsg_into(buffers, ancbufsize, flags or 0)
+
     def poll(self, timeout=60):
         """
         Poll to see if the socket has any data to read from the remote host.
@@ -289,11 +699,18 @@ class RawDuctParent(object):
         :type timeout: float | int
         :return: True if this data to read, False otherwise.
         """
-        if self.conn_socket is None:
+        conn_socket = self.conn_socket
+        if conn_socket is None:
             raise NotConnectedException("Must be connected to other end to poll for data!")
-        has_recv_data, _, is_faulted = map(bool, select.select([self.conn_socket], [], [self.conn_socket], timeout))
+        poller = self.conn_poller
+        if poller is None:
+            poller = self.conn_poller = SocketPoller(conn_socket)
+        has_recv_data, is_faulted = poller.poll(timeout)
         if is_faulted:
-            self.server_connection_socket_destructor(self.conn_socket, shutdown=True)
+            if self.conn_socket is None:
+                # The duct was closed by another thread while this one was polling.
+                raise NotConnectedException("Must be connected to other end to poll for data!")
+            self.server_connection_socket_destructor(conn_socket, shutdown=True)
             raise LocalSocketFault("Local socket has an error condition set!")
         return has_recv_data
 
@@ -322,9 +739,11 @@ class RawDuctParent(object):
         if self.listener_socket is not None:
             self.server_listener_socket_destructor(self.listener_socket, shutdown=True)
             self.listener_socket = None
+            self.listener_poller = None
         if self.conn_socket is not None:
             self.server_connection_socket_destructor(self.conn_socket, shutdown=shutdown)
             self.conn_socket = None
+            self.conn_poller = None
 
     def __del__(self):
         self.close()
@@ -338,6 +757,9 @@ class RawDuctChild(object):
     """
 
     DEFAULT_TIMEOUT = 30
+    DEFAULT_CONNECT_TIMEOUT = 10
+    # Deprecated: connect() used to retry this many times, this many seconds apart, by default. It now retries with a
+    # backoff until connect_timeout runs out, but passing these to it still retries on the old schedule.
     DEFAULT_CONNECT_RETRY_COUNT = 3
     DEFAULT_RETRY_DELAY = 3
 
@@ -347,37 +769,100 @@ class RawDuctChild(object):
         self.socket_destructor = socket_destructor
         self.connect_address = connect_address
         self.socket = None
+        self.poller = None
         self.socket_timeout = timeout
 
-    def connect(self, connect_retry_count=DEFAULT_CONNECT_RETRY_COUNT, connect_retry_delay=DEFAULT_RETRY_DELAY):
+    @classmethod
+    def from_connected_socket(cls, connected_socket, socket_destructor=client_socket_destructor,
+                              timeout=DEFAULT_TIMEOUT):
         """
-        Attempt to connect to another duct.
-
-        AlreadyConnectedException is raised if the connection has already been established.
-
-        :param connect_retry_count: The number of times to retry connecting if the connection is refused or if the
-            file system entry for the Unix Domain socket does not yet exist on disk. Default: 3
-        :type connect_retry_count: int
-        :param connect_retry_delay: The amount of time to sleep between successive connect retries in the event of
-            failure. Default: 3
-        :type connect_retry_delay: int | float
+        Wrap an already connected socket (for instance one end of a socket.socketpair()) in a child duct, skipping
+        the connect step entirely.
+
+        :param connected_socket: The connected socket.
+        :type connected_socket: socket.socket
+        :param socket_destructor: The destructor to clean up the socket with on close.
+        :param timeout: The number of seconds to block a send/recv call waiting for completion.
+        :type timeout: int | float
+        :return: A new, connected RawDuctChild.
+        :rtype: ductworks.base_duct.RawDuctChild
+        """
+        duct = cls(connect_address=None, socket_destructor=socket_destructor, timeout=timeout)
+        connected_socket.settimeout(timeout)
+        duct.socket = connected_socket
+        duct.connect_address = connected_socket.getpeername()
+        return duct
+
+    def connect(self, connect_retry_count=None, connect_retry_delay=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                backoff=None, wait_for_path=True):
+        """
+        Attempt to connect to another duct. If the connection is refused, or the file system entry for the Unix
+        Domain socket does not exist yet, the connect is retried with an exponential backoff (starting from sub
+        millisecond delays) until connect_timeout seconds have passed. While a Unix Domain socket path doesn't
+        exist yet, inotify is used (where available) to wake up as soon as it is created instead of sleeping.
+
+        AlreadyConnectedException is raised if the connection has already been established. If the connection
+        can't be made before the deadline, the last connection error is raised.
+
+        :param connect_retry_count: The maximum number of times to retry connecting. If None, retry until
+            connect_timeout runs out. Before the backoff was added, this was DEFAULT_CONNECT_RETRY_COUNT by default.
+            Default: None
+        :type connect_retry_count: int | None
+        :param connect_retry_delay: A fixed amount of time to sleep between successive connect retries. If None, use
+            the exponential backoff instead. Before the backoff was added, this was DEFAULT_RETRY_DELAY by default.
+            Default: None
+        :type connect_retry_delay: int | float | None
+        :param connect_timeout: The total amount of time to keep trying to connect, in seconds. If None, there is
+            no deadline. Default: 10
+        :type connect_timeout: int | float | None
+        :param backoff: The backoff schedule for retries. If None, a ConnectBackoff with default settings is used.
+            Default: None
+        :type backoff: ductworks.base_duct.ConnectBackoff | None
+        :param wait_for_path: If True, wait for a missing Unix Domain socket path with inotify where available.
+            Default: True
+        :type wait_for_path: bool
         :return: None
         """
         if self.socket is not None:
             raise AlreadyConnectedException("Already connected to other end!")
-        while True:
-            try:
-                self.socket = self.socket_constructor()
-                self.socket.settimeout(self.socket_timeout)
-                self.socket.connect(self.connect_address)
-                return
-            except socket.error as e:
-                self.socket = None
-                if e.errno == errno.ENOENT or e.errno == errno.ECONNREFUSED and connect_retry_count:
-                    connect_retry_count -= 1
-                    time.sleep(connect_retry_delay)
-                else:
-                    raise e
+        deadline = None if connect_timeout is None else time.time() + connect_timeout
+        delays = (backoff or ConnectBackoff()).delays()
+        path_watcher = None
+        try:
+            while True:
+                new_socket = self.socket_constructor()
+                try:
+                    new_socket.settimeout(self.socket_timeout)
+                    new_socket.connect(self.connect_address)
+                    self.socket = new_socket
+                    return
+                except socket.error as e:
+                    new_socket.close()
+                    if e.errno not in (errno.ENOENT, errno.ECONNREFUSED) or connect_retry_count == 0:
+                        raise e
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise e
+                    if connect_retry_count is not None:
+                        connect_retry_count -= 1
+                    delay = next(delays) if connect_retry_delay is None else connect_retry_delay
+                    if remaining is not None:
+                        delay = min(delay, remaining)
+                    if e.errno == errno.ENOENT and wait_for_path and path_watcher is None and \
+                            not is_abstract_namespace_address(self.connect_address) and \
+                            UnixSocketPathWatcher.is_supported():
+                        try:
+                            path_watcher = UnixSocketPathWatcher(self.connect_address)
+                        except OSError:
+                            # Most likely the directory doesn't exist either; fall back to sleeping.
+                            wait_for_path = False
+                    if e.errno == errno.ENOENT and path_watcher is not None:
+                        path_watcher.wait(ConnectBackoff.DEFAULT_MAX_DELAY if remaining is None else remaining)
+                    else:
+                        time.sleep(delay)
+        finally:
+            if path_watcher is not None:
+                path_watcher.close()
 
     def send(self, byte_array, flags=None):
         """
@@ -402,6 +887,27 @@ class RawDuctChild(object):
         else:
             return self.socket.send(byte_array, flags)
 
+    def sendmsg_all(self, buffers, ancdata=None, flags=None):
+        """
+        Send a list of buffers to the other end of the duct as a single scatter/gather write. Unlike send(), this
+        keeps writing until every byte has been sent, and the buffers are handed to the kernel as-is rather than
+        being concatenated into one intermediate buffer first.
+
+        A NotConnectedException is raised if the duct hasn't been bound to the other end yet.
+
+        :param buffers: The bytes-like objects to send to the other end, in order.
+        :type buffers: list | tuple
+        :param ancdata: Optional ancillary data to be sent along with the first chunk of data.
+        :type ancdata: list | None
+        :param flags: Optional flags to be set on the socket sendmsg calls.
+        :type flags: int | None
+        :return: The total number of bytes sent.
+        :rtype: int
+        """
+        if self.socket is None:
+            raise NotConnectedException("Must be connected to other end to send data!")
+        return sendmsg_all(self.socket, buffers, ancdata, flags)
+
     def recv(self, buff_size, flags=None):
         """
         Receive up to buff_size bytes from the remote host.
@@ -450,6 +956,26 @@ class RawDuctChild(object):
         else:
             assert False
 
+    def recvmsg_into(self, buffers, ancbufsize=0, flags=None):
+        """
+        Receive data from the remote host directly into a list of buffers, along with any ancillary data, as a thin
+        wrapper over the underlying socket recvmsg_into call.
+
+        A NotConnectedException is raised if the duct hasn't been bound to the other end yet.
+
+        :param buffers: The writable buffers to receive data into, filled in order.
+        :type buffers: list
+        :param ancbufsize: The size of the buffer for ancillary data. Default: 0
+        :type ancbufsize: int
+        :param flags: Optional flags to be set on the socket recvmsg call.
+        :type flags: int | None
+        :return: A tuple of (number of bytes received, ancillary data, message flags, address).
+        :rtype: (int, list, int, object)
+        """
+        if self.socket is None:
+            raise NotConnectedException("Must be connected to other end to receive data!")
+        return self.socket.recvmsg_into(buffers, ancbufsize, flags or 0)
+
     def poll(self, timeout=60):
         """
         Poll to see if the socket has any data to read from the remote host.
@@ -462,11 +988,18 @@ class RawDuctChild(object):
         :type timeout: float | int
         :return: True if this data to read, False otherwise.
         """
-        if self.socket is None:
+        conn_socket = self.socket
+        if conn_socket is None:
             raise NotConnectedException("Must be connected to other end to poll for data!")
-        has_recv_data, _, is_faulted = map(bool, select.select([self.socket], [], [self.socket], timeout))
+        poller = self.poller
+        if poller is None:
+            poller = self.poller = SocketPoller(conn_socket)
+        has_recv_data, is_faulted = poller.poll(timeout)
         if is_faulted:
-            self.socket_destructor(self.socket, shutdown=True)
+            if self.socket is None:
+                # The duct was closed by another thread while this one was polling.
+                raise NotConnectedException("Must be connected to other end to poll for data!")
+            self.socket_destructor(conn_socket, shutdown=True)
             raise LocalSocketFault("Local socket has an error condition set!")
         return has_recv_data
 
@@ -495,6 +1028,7 @@ class RawDuctChild(object):
         if self.socket is not None:
             self.socket_destructor(self.socket, shutdown=shutdown)
             self.socket = None
+            self.poller = None
 
     def __del__(self):
         self.close()
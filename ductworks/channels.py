@@ -0,0 +1,688 @@
+import struct
+import threading
+import time
+from collections import deque, OrderedDict
+
+try:
+    from pickle import PickleBuffer
+except ImportError:
+    PickleBuffer = None
+
+from ductworks.framing import MessageProtocolException, pack_frame_header, FRAME_FLAG_CHANNEL, FRAME_FLAG_PRIORITY
+from ductworks.serialization import serialized_buffers, serialized_length
+
+# The body of every FRAME_FLAG_CHANNEL frame starts with the channel id and the fragment flags, followed by the
+# fragment itself.
+CHANNEL_HEADER_FORMAT = '!HB'
+CHANNEL_HEADER_SIZE = struct.calcsize(CHANNEL_HEADER_FORMAT)
+MAX_CHANNEL_ID = 0xFFFF
+# More fragments of the same message follow on the channel.
+CHANNEL_FRAGMENT_MORE = 0x01
+# A fragment of a message sent without a channel (by a duct created with priority_lanes=True), received by recv().
+CHANNEL_FRAGMENT_PLAIN = 0x02
+# A chunk of a stream sent with send_stream() (always along with CHANNEL_FRAGMENT_PLAIN), handed to recv_stream() as
+# is rather than reassembled and deserialized. The chunk without CHANNEL_FRAGMENT_MORE ends the stream; one with
+# CHANNEL_FRAGMENT_ABORT ends it too, because the sender gave up partway.
+CHANNEL_FRAGMENT_STREAM = 0x04
+CHANNEL_FRAGMENT_ABORT = 0x08
+# On ducts with out_of_band=True, a channel message starts with the number of out-of-band buffers and the length of
+# each one, followed by the pickle stream and then the buffers.
+CHANNEL_BUFFER_COUNT_FORMAT = '!L'
+CHANNEL_BUFFER_COUNT_SIZE = struct.calcsize(CHANNEL_BUFFER_COUNT_FORMAT)
+CHANNEL_BUFFER_LENGTH_FORMAT = '!Q'
+CHANNEL_BUFFER_LENGTH_SIZE = struct.calcsize(CHANNEL_BUFFER_LENGTH_FORMAT)
+# The largest fragment channel messages are split into; messages on other channels can be sent between fragments.
+DEFAULT_CHANNEL_FRAGMENT_SIZE = 64 * 1024
+
+# How urgent a message is (see BaseMessageDuct.send); PRIORITY_HIGH messages are sent with FRAME_FLAG_PRIORITY.
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1
+# The most normal messages a duct reads ahead and keeps for recv() while waiting for a PRIORITY_HIGH one (see
+# BaseMessageDuct.poll).
+DEFAULT_MAX_READ_AHEAD = 1024
+
+
+class OutgoingChannelMessage(object):
+    """
+    A message queued up to be sent on a channel, split into fragments of at most fragment_size bytes as it is sent.
+    Messages sent without a channel by a duct created with priority_lanes=True are split up the same way, and have a
+    channel_id of None.
+    """
+
+    def __init__(self, channel_id, buffers, fragment_size, priority=PRIORITY_NORMAL):
+        self.channel_id = channel_id
+        self.priority = priority
+        self.fragments = self._split(buffers, fragment_size)
+        self.next_fragment = next(self.fragments)
+        self.fds_to_close = []
+        self.sent = False
+        self.frame_flags = FRAME_FLAG_CHANNEL
+        if priority == PRIORITY_HIGH:
+            self.frame_flags |= FRAME_FLAG_PRIORITY
+        self.fragment_flags = 0 if channel_id is not None else CHANNEL_FRAGMENT_PLAIN
+
+    @staticmethod
+    def _split(buffers, fragment_size):
+        fragment = []
+        room = fragment_size
+        split_any = False
+        for buff in buffers:
+            view = memoryview(buff)
+            if view.ndim != 1 or view.itemsize != 1:
+                view = view.cast('B')
+            while view:
+                chunk = view[:room]
+                fragment.append(chunk)
+                room -= len(chunk)
+                view = view[len(chunk):]
+                if not room:
+                    yield fragment
+                    split_any = True
+                    fragment = []
+                    room = fragment_size
+        # Always at least one fragment, even for an empty message.
+        if fragment or not split_any:
+            yield fragment
+
+    def next_frames(self):
+        """
+        Build the frame carrying the next fragment of the message.
+
+        :return: The (buffers, ancillary data) frames to write, and whether they carry the last fragment.
+        :rtype: (list, bool)
+        """
+        fragment = self.next_fragment
+        self.next_fragment = next(self.fragments, None)
+        is_last = self.next_fragment is None
+        fragment_flags = self.fragment_flags if is_last else self.fragment_flags | CHANNEL_FRAGMENT_MORE
+        channel_header = struct.pack(CHANNEL_HEADER_FORMAT, self.channel_id or 0, fragment_flags)
+        header = pack_frame_header(CHANNEL_HEADER_SIZE + serialized_length(fragment), self.frame_flags)
+        return [([header, channel_header] + fragment, None)], is_last
+
+
+class OutgoingFramedMessage(object):
+    """
+    A message queued up to be sent without a channel, already framed (as send() frames it, or as one chunk of a
+    stream), and written out whole. The descriptors in fds_to_close (duplicates of the ones sent, and shared memory
+    segments) are closed once it has been written.
+    """
+
+    def __init__(self, frames, fds_to_close, priority=PRIORITY_NORMAL):
+        self.channel_id = None
+        self.frames = frames
+        self.fds_to_close = fds_to_close
+        self.priority = priority
+        self.sent = False
+
+    def next_frames(self):
+        """
+        Get the frames of the message, all at once.
+
+        :return: The (buffers, ancillary data) frames to write, and True, since nothing more follows.
+        :rtype: (list, bool)
+        """
+        return self.frames, True
+
+
+class ChannelMultiplexer(object):
+    """
+    The ChannelMultiplexer carries the logical channels of a message duct (see BaseMessageDuct.channel), and the
+    priority lanes of its plain messages.
+
+    Sending threads queue their messages by channel, and whichever of them gets there first writes fragments for
+    every channel with something queued, one fragment per channel per round, until its own message is out; then
+    another waiting sender takes over. A small message on one channel therefore only ever waits behind one fragment
+    of a large message on another, rather than behind the whole message. Messages sent with PRIORITY_HIGH skip the
+    channel queues altogether: every round starts by writing all of them out whole, so they wait behind at most the
+    round already being written.
+
+    Receiving works the same way: one thread at a time reads frames off of the duct, reassembling fragments and
+    queueing each complete message for its channel (or for recv(), for messages sent without a channel), and wakes
+    the threads waiting on the other channels as their messages arrive.
+
+    :param duct: The duct to carry the channels over.
+    :type duct: BaseMessageDuct
+    :param fragment_size: The largest fragment to split channel messages into, in bytes.
+    :type fragment_size: int
+    :param max_read_ahead: The most normal messages to read ahead and keep for recv() while waiting for a
+        PRIORITY_HIGH message.
+    :type max_read_ahead: int
+    """
+
+    def __init__(self, duct, fragment_size=DEFAULT_CHANNEL_FRAGMENT_SIZE, max_read_ahead=DEFAULT_MAX_READ_AHEAD):
+        self.duct = duct
+        self.fragment_size = fragment_size
+        self.max_read_ahead = max_read_ahead
+        self.send_condition = threading.Condition()
+        # The queued messages of each channel, with the channels in the order they take turns.
+        self.outgoing = OrderedDict()
+        # Queued PRIORITY_HIGH messages, whatever their channel, in the order they were sent.
+        self.priority_outgoing = deque()
+        self.sending = False
+        self.send_error = None
+        self.recv_condition = threading.Condition()
+        self.receiving = False
+        # Threads waiting on recv_condition for the duct's recv lock (see wait_for_recv_lock), which whoever lets go
+        # of the lock has to wake up.
+        self.recv_lock_waiters = 0
+        # Complete messages received on each channel, and the fragments received so far of incomplete ones.
+        self.incoming = {}
+        self.partial_messages = {}
+        # Messages sent without a channel that were read while waiting for channel messages (or for a priority, by
+        # poll_plain), with their fds. The PRIORITY_HIGH ones are kept apart, and received first.
+        self.plain_messages = deque()
+        self.priority_messages = deque()
+        # Only one stream can be sent at a time; the chunks of the one being received wait here for recv_stream().
+        self.stream_lock = threading.Lock()
+        self.stream_chunks = deque()
+
+    def _fragment_size(self):
+        fragment_size = self.fragment_size
+        if self.duct.peer_max_frame_size is not None:
+            fragment_size = min(fragment_size, self.duct.peer_max_frame_size - CHANNEL_HEADER_SIZE)
+        return fragment_size
+
+    def _message_buffers(self, serialized_payload, out_of_band_buffers):
+        buffers = list(serialized_buffers(serialized_payload))
+        if self.duct.out_of_band:
+            out_of_band_buffers = [buff.raw() if isinstance(buff, PickleBuffer) else buff
+                                   for buff in out_of_band_buffers]
+            lengths = [struct.pack(CHANNEL_BUFFER_LENGTH_FORMAT, serialized_length(buff))
+                       for buff in [serialized_payload] + out_of_band_buffers]
+            buffers = [struct.pack(CHANNEL_BUFFER_COUNT_FORMAT, len(out_of_band_buffers))] + lengths + buffers + \
+                out_of_band_buffers
+        return buffers
+
+    def _complete_handshake(self):
+        duct = self.duct
+        send_lock = duct.send_lock
+        try:
+            if send_lock:
+                duct._acquire(send_lock)
+            if duct.handshake_pending:
+                duct._complete_handshake_for_send()
+        finally:
+            if send_lock:
+                send_lock.release()
+
+    def send(self, channel_id, payload, priority=PRIORITY_NORMAL):
+        """
+        Send a payload on a channel, returning once all of it has been written.
+
+        :param channel_id: The channel to send on.
+        :type channel_id: int
+        :param payload: A serializable Python object to send to the other duct.
+        :param priority: PRIORITY_NORMAL or PRIORITY_HIGH. Default: PRIORITY_NORMAL
+        :type priority: int
+        :return: None
+        """
+        if self.duct.handshake_pending:
+            self._complete_handshake()
+        buffers = self._message_buffers(*self.duct._serialize(payload))
+        self.send_messages([OutgoingChannelMessage(channel_id, buffers, self._fragment_size(), priority)])
+
+    @staticmethod
+    def _stream_chunk(chunk, fragment_flags):
+        channel_header = struct.pack(CHANNEL_HEADER_FORMAT, 0,
+                                     CHANNEL_FRAGMENT_PLAIN | CHANNEL_FRAGMENT_STREAM | fragment_flags)
+        header = pack_frame_header(CHANNEL_HEADER_SIZE + len(chunk), FRAME_FLAG_CHANNEL)
+        return OutgoingFramedMessage([([header, channel_header, chunk], None)], [])
+
+    def send_stream(self, chunks):
+        """
+        Send a stream of raw chunks, split into fragments, pulling each chunk from the iterable only once the one
+        before it has been written. If iterating the chunks raises an exception, the stream is aborted at the other
+        end, and the exception is raised here.
+
+        :param chunks: The chunks to send, as bytes-like objects.
+        :type chunks: iterable
+        :return: The number of bytes sent.
+        :rtype: int
+        """
+        if self.duct.handshake_pending:
+            self._complete_handshake()
+        fragment_size = self._fragment_size()
+        bytes_sent = 0
+        with self.stream_lock:
+            try:
+                for chunk in chunks:
+                    view = memoryview(chunk)
+                    if view.ndim != 1 or view.itemsize != 1:
+                        view = view.cast('B')
+                    # One fragment at a time, so that other messages can be sent in between.
+                    for start in range(0, len(view), fragment_size):
+                        self.send_messages([self._stream_chunk(view[start:start + fragment_size],
+                                                               CHANNEL_FRAGMENT_MORE)])
+                    bytes_sent += len(view)
+            except Exception:
+                # Unless the duct itself failed, in which case nothing more can be sent anyway.
+                if self.send_error is None:
+                    self.send_messages([self._stream_chunk(b'', CHANNEL_FRAGMENT_ABORT)])
+                raise
+            self.send_messages([self._stream_chunk(b'', 0)])
+        return bytes_sent
+
+    def send_messages(self, messages):
+        """
+        Queue up messages to be sent, returning once all of them have been written. The messages must all be for
+        the same channel (or none), with the same priority, and are written in order. Once queued, the descriptors
+        they hold are closed by whichever thread writes them out.
+
+        :param messages: The OutgoingChannelMessage and OutgoingFramedMessage instances to send.
+        :type messages: list
+        :return: None
+        """
+        last_message = messages[-1]
+        with self.send_condition:
+            if self.send_error is not None:
+                self._discard(messages)
+                raise self.send_error
+            # With nothing else waiting to go out, messages that aren't split up are written straight away.
+            write_now = not (self.sending or self.outgoing or self.priority_outgoing) and \
+                all(isinstance(message, OutgoingFramedMessage) for message in messages)
+            if not write_now:
+                for message in messages:
+                    if message.priority == PRIORITY_HIGH:
+                        self.priority_outgoing.append(message)
+                    else:
+                        self.outgoing.setdefault(message.channel_id, deque()).append(message)
+                while self.sending and not last_message.sent and self.send_error is None:
+                    self.send_condition.wait()
+                if self.send_error is not None:
+                    raise self.send_error
+                if last_message.sent:
+                    return
+            self.sending = True
+        try:
+            if write_now:
+                frames = []
+                fds_to_close = []
+                for message in messages:
+                    frames.extend(message.frames)
+                    fds_to_close.extend(message.fds_to_close)
+                if last_message.priority == PRIORITY_HIGH:
+                    self._write_frames(frames, fds_to_close, [], [])
+                else:
+                    self._write_frames([], [], frames, fds_to_close)
+                return
+            while not last_message.sent:
+                self._send_round()
+        finally:
+            with self.send_condition:
+                self.sending = False
+                self.send_condition.notify_all()
+
+    def _discard(self, messages):
+        for message in messages:
+            self.duct._close_fds(message.fds_to_close)
+
+    def _send_round(self):
+        priority_frames = []
+        priority_fds = []
+        frames = []
+        fds_to_close = []
+        finished_messages = []
+        with self.send_condition:
+            while self.priority_outgoing:
+                message = self.priority_outgoing.popleft()
+                is_last = False
+                while not is_last:
+                    message_frames, is_last = message.next_frames()
+                    priority_frames.extend(message_frames)
+                priority_fds.extend(message.fds_to_close)
+                finished_messages.append(message)
+            for channel_id, channel_queue in list(self.outgoing.items()):
+                message = channel_queue[0]
+                message_frames, is_last = message.next_frames()
+                frames.extend(message_frames)
+                if is_last:
+                    fds_to_close.extend(message.fds_to_close)
+                    finished_messages.append(channel_queue.popleft())
+                    if not channel_queue:
+                        del self.outgoing[channel_id]
+        # Written without holding the condition, so more messages can be queued up meanwhile.
+        self._write_frames(priority_frames, priority_fds, frames, fds_to_close)
+        with self.send_condition:
+            for message in finished_messages:
+                message.sent = True
+            self.send_condition.notify_all()
+
+    def _write_frames(self, priority_frames, priority_fds, frames, fds_to_close):
+        duct = self.duct
+        send_lock = duct.send_lock
+        try:
+            if send_lock:
+                duct._acquire(send_lock)
+            background_writer = duct.background_writer
+            if background_writer is None:
+                duct._send_frames(priority_frames + frames)
+            else:
+                # The writer closes the descriptors once it has sent them.
+                if priority_frames:
+                    background_writer.put(priority_frames, priority_fds, True, PRIORITY_HIGH)
+                    priority_fds = []
+                if frames:
+                    background_writer.put(frames, fds_to_close, True, partial=True)
+                    fds_to_close = []
+        except Exception as e:
+            # Part of a message may have been written, so nothing more can be sent on any channel.
+            with self.send_condition:
+                self.send_error = e
+                unsent_messages = list(self.priority_outgoing)
+                for channel_queue in self.outgoing.values():
+                    unsent_messages.extend(channel_queue)
+                self.priority_outgoing.clear()
+                self.outgoing.clear()
+                self.send_condition.notify_all()
+            self._discard(unsent_messages)
+            raise
+        finally:
+            if send_lock:
+                send_lock.release()
+            duct._close_fds(priority_fds + fds_to_close)
+
+    def receive_fragment(self, flags, frame_body):
+        """
+        Take in a channel frame read off of the duct, queueing up its message if it's the last fragment.
+
+        :param flags: The flags of the frame.
+        :type flags: int
+        :param frame_body: The body of the frame.
+        :type frame_body: bytearray
+        :return: None
+        """
+        channel_id, fragment_flags = struct.unpack_from(CHANNEL_HEADER_FORMAT, frame_body)
+        fragment = memoryview(frame_body)[CHANNEL_HEADER_SIZE:]
+        if fragment_flags & CHANNEL_FRAGMENT_STREAM:
+            # Streams are never reassembled; each chunk is handed out as is.
+            with self.recv_condition:
+                self.stream_chunks.append((fragment, fragment_flags))
+                self.recv_condition.notify_all()
+            return
+        # Fragments of plain messages are kept apart from those sent on channel 0.
+        channel_key = None if fragment_flags & CHANNEL_FRAGMENT_PLAIN else channel_id
+        partial_message = self.partial_messages.get(channel_key)
+        if partial_message is None and not fragment_flags & CHANNEL_FRAGMENT_MORE:
+            serialized_message = fragment
+        else:
+            if partial_message is None:
+                partial_message = self.partial_messages[channel_key] = bytearray()
+            # Copied in as each fragment arrives, rather than all at once at the end, which would hold up the
+            # other channels for as long as it takes to copy the whole message.
+            partial_message += fragment
+            max_frame_size = self.duct.max_frame_size
+            if max_frame_size is not None and len(partial_message) > max_frame_size:
+                del self.partial_messages[channel_key]
+                raise MessageProtocolException("Received a message over {} bytes {}, larger than the limit!".format(
+                    max_frame_size, "without a channel" if channel_key is None else "on channel {}".format(channel_id)))
+            if fragment_flags & CHANNEL_FRAGMENT_MORE:
+                return
+            serialized_message = self.partial_messages.pop(channel_key)
+        message = self.duct._deserialize_message(*self._split_message(serialized_message))
+        if channel_key is None:
+            self._queue_plain_message(flags, message)
+            return
+        with self.recv_condition:
+            self.incoming.setdefault(channel_id, deque()).append(message[0])
+            self.recv_condition.notify_all()
+
+    def _split_message(self, serialized_message):
+        if not self.duct.out_of_band:
+            return serialized_message, None, None
+        view = memoryview(serialized_message)
+        buffer_count, = struct.unpack_from(CHANNEL_BUFFER_COUNT_FORMAT, view)
+        offset = CHANNEL_BUFFER_COUNT_SIZE
+        lengths = []
+        for _ in range(buffer_count + 1):
+            lengths.append(struct.unpack_from(CHANNEL_BUFFER_LENGTH_FORMAT, view, offset)[0])
+            offset += CHANNEL_BUFFER_LENGTH_SIZE
+        buffers = []
+        for length in lengths:
+            buffers.append(view[offset:offset + length])
+            offset += length
+        return buffers[0], buffers[1:], None
+
+    def _queue_plain_message(self, flags, message):
+        with self.recv_condition:
+            if flags & FRAME_FLAG_PRIORITY:
+                self.priority_messages.append(message)
+            else:
+                self.plain_messages.append(message)
+            self.recv_condition.notify_all()
+
+    def has_plain_message(self):
+        """
+        Check for messages sent without a channel that have already been read off of the duct.
+
+        :return: True if there are any, False otherwise.
+        :rtype: bool
+        """
+        return bool(self.priority_messages or self.plain_messages)
+
+    def has_received_data(self):
+        """
+        Check for anything sent without a channel that has already been read off of the duct, whether messages for
+        recv() or stream chunks for recv_stream().
+
+        :return: True if there is any, False otherwise.
+        :rtype: bool
+        """
+        return bool(self.priority_messages or self.plain_messages or self.stream_chunks)
+
+    def next_plain_message(self):
+        """
+        Take the next message sent without a channel that has already been read off of the duct, high priority
+        messages first.
+
+        :return: The deserialized payload and its fds, or None if there are no such messages.
+        :rtype: (object, list) | NoneType
+        """
+        if not (self.priority_messages or self.plain_messages):
+            return None
+        with self.recv_condition:
+            if self.priority_messages:
+                return self.priority_messages.popleft()
+            return self.plain_messages.popleft()
+
+    def next_stream_chunk(self):
+        """
+        Take the next chunk of the stream being received, if it has already been read off of the duct.
+
+        :return: The chunk and its fragment flags, or None if no chunk has been read yet.
+        :rtype: (memoryview, int) | NoneType
+        """
+        if not self.stream_chunks:
+            return None
+        with self.recv_condition:
+            return self.stream_chunks.popleft()
+
+    def wait_for_recv_lock(self, timeout, ready):
+        """
+        Take the duct's recv lock, waiting for it if another thread holds it, unless ready() says there's no need to
+        first. ready() is called with recv_condition held, which whoever holds the lock notifies whenever it queues
+        something up, finishes the handshake, or lets go of the lock, so waiting never has to poll.
+
+        :param timeout: The longest to wait, in seconds. If None, wait as long as it takes.
+        :type timeout: float | int | None
+        :param ready: Checks if whatever the caller is waiting for has turned up.
+        :type ready: () -> bool
+        :return: True if the lock was taken, False if ready() said so or the wait timed out first.
+        :rtype: bool
+        """
+        recv_lock = self.duct.recv_lock
+        if recv_lock.acquire(False):
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        with self.recv_condition:
+            self.recv_lock_waiters += 1
+            try:
+                while not recv_lock.acquire(False):
+                    remaining = None if deadline is None else deadline - time.time()
+                    if ready() or (remaining is not None and remaining <= 0):
+                        return False
+                    self.recv_condition.wait(remaining)
+                return True
+            finally:
+                self.recv_lock_waiters -= 1
+
+    def notify_receivers(self):
+        """
+        Wake up any threads in wait_for_recv_lock(), after letting go of the duct's recv lock or finishing the
+        handshake.
+
+        :return: None
+        """
+        if self.recv_lock_waiters:
+            with self.recv_condition:
+                self.recv_condition.notify_all()
+
+    def _read_frame(self, timeout, ready):
+        duct = self.duct
+        recv_lock = duct.recv_lock
+        started = time.time()
+        # Someone else may be reading the duct (with recv(), say), and queue up what's waited for as it arrives.
+        if recv_lock and not self.wait_for_recv_lock(timeout, ready):
+            return False
+        if timeout is not None:
+            timeout = max(timeout - (time.time() - started), 0)
+        try:
+            if duct.handshake_pending:
+                duct._complete_handshake()
+            if not (duct.frame_reader.has_frame() or duct._poll_socket(timeout)):
+                return False
+            flags, frame_body = duct.frame_reader.read_frame()
+            if flags & FRAME_FLAG_CHANNEL:
+                self.receive_fragment(flags, frame_body)
+            else:
+                decoded_frame = (frame_body, None, None) if not flags else duct._decode_frame(flags, frame_body)
+                self._queue_plain_message(flags, duct._deserialize_message(*decoded_frame))
+            return True
+        finally:
+            if recv_lock:
+                duct._release_recv_lock()
+
+    def poll(self, channel_id, timeout=None):
+        """
+        Wait for a message to arrive on a channel, reading the duct (and queueing up messages for other channels)
+        meanwhile.
+
+        :param channel_id: The channel to wait on.
+        :type channel_id: int
+        :param timeout: The longest to wait, in seconds. If None, wait as long as it takes. Default: None
+        :type timeout: float | int | None
+        :return: True if a message is waiting on the channel, False otherwise.
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.recv_condition:
+            while True:
+                if self.incoming.get(channel_id):
+                    return True
+                if not self.receiving:
+                    self.receiving = True
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.recv_condition.wait(remaining)
+        try:
+            while True:
+                remaining = None if deadline is None else max(deadline - time.time(), 0)
+                self._read_frame(remaining, lambda: self.incoming.get(channel_id))
+                with self.recv_condition:
+                    if self.incoming.get(channel_id):
+                        return True
+                if remaining == 0:
+                    return False
+        finally:
+            with self.recv_condition:
+                self.receiving = False
+                self.recv_condition.notify_all()
+
+    def poll_plain(self, priority, timeout=None):
+        """
+        Wait for a message sent without a channel with the given priority, reading the duct (and queueing up the
+        messages of any other priority or channel) meanwhile. Waiting for a PRIORITY_HIGH message stops early once
+        max_read_ahead normal messages are queued up, until recv() takes some of them.
+
+        :param priority: PRIORITY_NORMAL or PRIORITY_HIGH.
+        :type priority: int
+        :param timeout: The longest to wait, in seconds. If None, wait as long as it takes. Default: None
+        :type timeout: float | int | None
+        :return: True if such a message is waiting, False otherwise.
+        :rtype: bool
+        """
+        plain_queue = self.priority_messages if priority == PRIORITY_HIGH else self.plain_messages
+        deadline = None if timeout is None else time.time() + timeout
+        while not plain_queue:
+            # Each message read ahead is deserialized and held on to, so a peer sending nothing but normal messages
+            # mustn't be able to make this buffer them up without end.
+            if priority == PRIORITY_HIGH and len(self.plain_messages) >= self.max_read_ahead:
+                return False
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            if not self._read_frame(remaining, lambda: plain_queue) and remaining == 0:
+                return False
+        return True
+
+    def recv(self, channel_id):
+        """
+        Receive a payload from a channel, waiting for one to arrive if none is present.
+
+        :param channel_id: The channel to receive from.
+        :type channel_id: int
+        :return: A deserialized Python object from the other end of the duct.
+        """
+        while True:
+            self.poll(channel_id)
+            with self.recv_condition:
+                channel_queue = self.incoming.get(channel_id)
+                if channel_queue:
+                    return channel_queue.popleft()
+
+
+class DuctChannel(object):
+    """
+    One logical channel of a message duct, as returned by BaseMessageDuct.channel(). Messages sent on a channel are
+    only ever received on the channel with the same id at the other end.
+
+    :param multiplexer: The multiplexer of the duct carrying the channel.
+    :type multiplexer: ChannelMultiplexer
+    :param channel_id: The channel's id.
+    :type channel_id: int
+    """
+
+    def __init__(self, multiplexer, channel_id):
+        self.multiplexer = multiplexer
+        self.channel_id = channel_id
+
+    def send(self, payload, priority=PRIORITY_NORMAL):
+        """
+        Send a payload on the channel. High priority messages are written ahead of any fragments still waiting to go
+        out, on every channel.
+
+        :param payload: A serializable Python object to send to the other duct.
+        :param priority: PRIORITY_NORMAL or PRIORITY_HIGH. Default: PRIORITY_NORMAL
+        :type priority: int
+        :return: None
+        """
+        self.multiplexer.send(self.channel_id, payload, priority)
+
+    def recv(self):
+        """
+        Receive a payload from the channel, waiting for one to arrive if none is present.
+
+        :return: A deserialized Python object from the other end of the duct.
+        """
+        return self.multiplexer.recv(self.channel_id)
+
+    def poll(self, timeout=60):
+        """
+        Check for a new message on the channel.
+
+        :param timeout: The amount of time to wait for a new message, if none is present. If None, wait as long as it
+            takes. Default: 60 seconds.
+        :type timeout: float | int | None
+        :return: True if a message is waiting, False otherwise.
+        :rtype: bool
+        """
+        return self.multiplexer.poll(self.channel_id, timeout)
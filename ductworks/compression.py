@@ -0,0 +1,193 @@
+import time
+import zlib
+from collections import Counter
+
+from ductworks.base_duct import DuctworksException
+
+# The compression methods message ducts can offer during the handshake, best first.
+SUPPORTED_COMPRESSION = ('zlib',)
+
+# zlib can only look back 32 KiB, so any dictionary past that size is wasted.
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+
+class CompressionException(DuctworksException):
+    """
+    This exception is thrown when a compressed frame can't be decompressed, for instance because the two ends of a
+    duct were given different dictionaries, or because it would decompress to more than the frame size limit.
+    """
+    pass
+
+
+class CompressionStats(object):
+    """
+    Running totals of how much compression has saved, and what it has cost, on one duct. The counters can be read
+    at any time, and reset() starts over.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Zero every counter.
+
+        :return: None
+        """
+        # Frames that were compressed, and their sizes before and after.
+        self.frames_compressed = 0
+        self.bytes_before_compression = 0
+        self.bytes_after_compression = 0
+        # Frames at or above the threshold that were sent uncompressed, since compressing didn't make them smaller.
+        self.frames_incompressible = 0
+        self.compress_time = 0.0
+        self.frames_decompressed = 0
+        self.decompress_time = 0.0
+
+    @property
+    def ratio(self):
+        """
+        The average compression ratio of the frames that were compressed, as uncompressed size over compressed size
+        (so 4.0 means frames shrank to a quarter of their size).
+
+        :return: The compression ratio, or None if nothing has been compressed yet.
+        :rtype: float | NoneType
+        """
+        if not self.bytes_after_compression:
+            return None
+        return float(self.bytes_before_compression) / self.bytes_after_compression
+
+    def __repr__(self):
+        return "CompressionStats(frames_compressed={}, ratio={}, compress_time={:.6f}, frames_decompressed={}, " \
+               "decompress_time={:.6f})".format(self.frames_compressed, self.ratio, self.compress_time,
+                                                self.frames_decompressed, self.decompress_time)
+
+
+class FrameCompressor(object):
+    """
+    The FrameCompressor compresses and decompresses individual frame bodies with zlib, optionally primed with a
+    preset dictionary (see train_compression_dictionary). Every frame is compressed independently, so frames can be
+    decompressed in any order, by any reader; the dictionary is what lets small frames still compress well.
+    """
+
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION, dictionary=None):
+        self.level = level
+        self.dictionary = dictionary
+        self.stats = CompressionStats()
+        self._compressor_template = None
+
+    @property
+    def dictionary_id(self):
+        """
+        The zlib (Adler-32) checksum of the dictionary, which is how both ends of a duct check that they were given
+        the same one.
+
+        :return: The dictionary id, or None if there is no dictionary.
+        :rtype: int | NoneType
+        """
+        if not self.dictionary:
+            return None
+        return zlib.adler32(self.dictionary)
+
+    def _new_compressor(self):
+        if not self.dictionary:
+            return zlib.compressobj(self.level)
+        # Priming a compressor with a dictionary isn't free, so prime one once and copy it for every frame.
+        if self._compressor_template is None:
+            self._compressor_template = zlib.compressobj(self.level, zlib.DEFLATED, zlib.MAX_WBITS,
+                                                         zdict=self.dictionary)
+        return self._compressor_template.copy()
+
+    def compress(self, buffers, uncompressed_len):
+        """
+        Compress a frame body, given as a list of bytes-like pieces.
+
+        :param buffers: The pieces of the frame body, in order.
+        :type buffers: list
+        :param uncompressed_len: The total length of the pieces.
+        :type uncompressed_len: int
+        :return: The compressed frame body, or None if compressing didn't make it any smaller.
+        :rtype: bytes | NoneType
+        """
+        started = time.time()
+        compressor = self._new_compressor()
+        compressed_pieces = [compressor.compress(buff) for buff in buffers]
+        compressed_pieces.append(compressor.flush())
+        compressed = b''.join(compressed_pieces)
+        stats = self.stats
+        stats.compress_time += time.time() - started
+        if len(compressed) >= uncompressed_len:
+            stats.frames_incompressible += 1
+            return None
+        stats.frames_compressed += 1
+        stats.bytes_before_compression += uncompressed_len
+        stats.bytes_after_compression += len(compressed)
+        return compressed
+
+    def decompress(self, compressed, max_size=None):
+        """
+        Decompress a frame body.
+
+        A CompressionException is raised if the frame body is corrupt, needs a different dictionary, or would
+        decompress to more than max_size bytes.
+
+        :param compressed: The compressed frame body.
+        :param max_size: The largest decompressed size to allow. If None, there is no limit. Default: None
+        :type max_size: int | NoneType
+        :return: The decompressed frame body.
+        :rtype: bytes
+        """
+        started = time.time()
+        if self.dictionary:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS, zdict=self.dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        try:
+            if max_size is None:
+                decompressed = decompressor.decompress(compressed)
+            else:
+                decompressed = decompressor.decompress(compressed, max_size + 1)
+                if len(decompressed) > max_size:
+                    raise CompressionException("Compressed frame expands past the {} byte frame size limit!"
+                                               "".format(max_size))
+        except zlib.error as e:
+            raise CompressionException("Couldn't decompress frame: {}".format(e))
+        if not decompressor.eof:
+            raise CompressionException("Compressed frame is truncated!")
+        self.stats.frames_decompressed += 1
+        self.stats.decompress_time += time.time() - started
+        return decompressed
+
+
+def train_compression_dictionary(samples, dictionary_size=MAX_DICTIONARY_SIZE, segment_size=16):
+    """
+    Build a preset zlib dictionary from sampled frame bodies. zlib has no real dictionary trainer, so this collects
+    the fixed-size segments that show up in more than one sample and packs them into a dictionary, with the most
+    common segments at the end, where zlib can reference them most cheaply. Give both ends of a duct the same
+    dictionary; it pays off most for many small, repetitive messages, such as JSON with the same keys every time.
+
+    :param samples: Serialized payloads, as sent over the duct, to learn from.
+    :type samples: list
+    :param dictionary_size: The largest dictionary to build. Default: 32 KiB (the most zlib can use).
+    :type dictionary_size: int
+    :param segment_size: The length of the segments to look for. Default: 16
+    :type segment_size: int
+    :return: The dictionary.
+    :rtype: bytes
+    """
+    dictionary_size = min(dictionary_size, MAX_DICTIONARY_SIZE)
+    segment_counts = Counter()
+    for sample in samples:
+        sample = bytes(sample)
+        # Count each segment once per sample, so one long repetitive sample can't crowd out everything else.
+        segment_counts.update(set(sample[offset:offset + segment_size]
+                                  for offset in range(max(len(sample) - segment_size + 1, 1))))
+    dictionary = b''
+    # Most common first, so they can be placed last.
+    for segment, count in segment_counts.most_common():
+        if count < 2 or len(dictionary) + len(segment) > dictionary_size:
+            break
+        if segment in dictionary:
+            continue
+        dictionary = segment + dictionary
+    return dictionary
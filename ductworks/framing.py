@@ -0,0 +1,467 @@
+import os
+import socket
+import struct
+from binascii import hexlify
+from collections import deque
+
+from ductworks.base_duct import DuctworksException, fd_ancillary_buffer_size, fds_from_ancillary_data
+from ductworks.metrics import clock
+
+
+MAGIC_BYTE = b'\x54'
+
+# Frames that carry any flags use an extended envelope, with a flags byte between the magic byte and the length.
+# Frames without flags always use the plain envelope, so they can be read by any message duct implementation.
+EXTENDED_MAGIC_BYTE = b'\x55'
+
+# The payload was too large to send inline; the frame body is a descriptor, and the payload itself is in a shared
+# memory segment passed alongside the frame.
+FRAME_FLAG_SHARED_MEMORY = 0x01
+# File descriptors were sent alongside the frame; the frame body starts with how many, followed by the payload.
+FRAME_FLAG_FILE_DESCRIPTORS = 0x02
+FILE_DESCRIPTOR_COUNT_FORMAT = '!H'
+FILE_DESCRIPTOR_COUNT_SIZE = struct.calcsize(FILE_DESCRIPTOR_COUNT_FORMAT)
+# The payload came with out-of-band buffers (see pickle5_serializer); the frame body starts with how many, followed
+# by the pickle stream, and each buffer follows in a frame of its own.
+FRAME_FLAG_OUT_OF_BAND = 0x04
+OUT_OF_BAND_COUNT_FORMAT = '!L'
+OUT_OF_BAND_COUNT_SIZE = struct.calcsize(OUT_OF_BAND_COUNT_FORMAT)
+
+# A control frame, exchanged by the message ducts themselves (such as the handshake) and never handed to the user.
+FRAME_FLAG_CONTROL = 0x08
+# The payload was compressed with zlib (see compression_threshold); it must be decompressed before deserializing.
+FRAME_FLAG_COMPRESSED = 0x10
+
+# A fragment of a message sent on a logical channel (see ductworks.channels). The frame body starts with the
+# channel id and the fragment flags, followed by the fragment itself.
+FRAME_FLAG_CHANNEL = 0x20
+
+# A message sent with PRIORITY_HIGH (see BaseMessageDuct.send); it was written ahead of any normal messages still
+# waiting to go out, and the receiver keeps it apart from them until it is received (see BaseMessageDuct.poll).
+FRAME_FLAG_PRIORITY = 0x40
+
+# The frame body is 4 GiB or more, so its length follows the flags byte as 64 bits rather than 32. This only concerns
+# the envelope, so parse_frame_header strips it from the flags it returns.
+FRAME_FLAG_WIDE_LENGTH = 0x80
+MAX_NARROW_FRAME_SIZE = 0xFFFFFFFF
+
+# Every flag this version of the message ducts knows how to read.
+SUPPORTED_FRAME_FLAGS = FRAME_FLAG_SHARED_MEMORY | FRAME_FLAG_FILE_DESCRIPTORS | FRAME_FLAG_OUT_OF_BAND |\
+    FRAME_FLAG_COMPRESSED | FRAME_FLAG_CHANNEL | FRAME_FLAG_PRIORITY | FRAME_FLAG_WIDE_LENGTH
+
+
+class MessageProtocolException(DuctworksException):
+    pass
+
+
+class RemoteDuctClosed(EOFError, DuctworksException):
+    pass
+
+
+def pack_frame_header(payload_len, flags=0):
+    """
+    Build the envelope header for a frame. Frames without flags get the plain header, everything else gets the
+    extended header; frame bodies of 4 GiB or more get the extended header with a 64 bit length.
+
+    :param payload_len: The length of the frame body, in bytes.
+    :type payload_len: int
+    :param flags: The FRAME_FLAG_* bits for the frame. Default: 0
+    :type flags: int
+    :return: The packed header.
+    :rtype: bytes
+    """
+    if payload_len > MAX_NARROW_FRAME_SIZE:
+        return struct.pack(FrameReader.WIDE_HEADER_FORMAT, EXTENDED_MAGIC_BYTE, flags | FRAME_FLAG_WIDE_LENGTH,
+                           payload_len)
+    if flags:
+        return struct.pack(FrameReader.EXTENDED_HEADER_FORMAT, EXTENDED_MAGIC_BYTE, flags, payload_len)
+    return struct.pack(FrameReader.HEADER_FORMAT, MAGIC_BYTE, payload_len)
+
+
+def parse_frame_header(buff, offset=0, end=None):
+    """
+    Parse the envelope header at the given offset of a buffer.
+
+    A MessageProtocolException is raised if the buffer doesn't start with a valid magic byte.
+
+    :param buff: The buffer holding the header.
+    :param offset: Where the header starts in the buffer. Default: 0
+    :type offset: int
+    :param end: Where the received data in the buffer ends. If None, the whole buffer holds data. Default: None
+    :type end: int | None
+    :return: The frame flags, the header size, and the payload length; or None if the buffer doesn't hold the whole
+        header yet.
+    :rtype: (int, int, int) | NoneType
+    """
+    available = (len(buff) if end is None else end) - offset
+    if available < FrameReader.HEADER_SIZE:
+        return None
+    leading_byte, payload_len = struct.unpack_from(FrameReader.HEADER_FORMAT, buff, offset)
+    if leading_byte == MAGIC_BYTE:
+        return 0, FrameReader.HEADER_SIZE, payload_len
+    if leading_byte == EXTENDED_MAGIC_BYTE:
+        if available < FrameReader.EXTENDED_HEADER_SIZE:
+            return None
+        _, flags, payload_len = struct.unpack_from(FrameReader.EXTENDED_HEADER_FORMAT, buff, offset)
+        if not flags & FRAME_FLAG_WIDE_LENGTH:
+            return flags, FrameReader.EXTENDED_HEADER_SIZE, payload_len
+        if available < FrameReader.WIDE_HEADER_SIZE:
+            return None
+        _, _, payload_len = struct.unpack_from(FrameReader.WIDE_HEADER_FORMAT, buff, offset)
+        return flags & ~FRAME_FLAG_WIDE_LENGTH, FrameReader.WIDE_HEADER_SIZE, payload_len
+    raise MessageProtocolException("Invalid magic byte at message envelope head! Expected: {}, got: {}"
+                                   "".format(hexlify(MAGIC_BYTE), hexlify(leading_byte)))
+
+
+class FrameReader(object):
+    """
+    The FrameReader is the receive engine shared by both message duct classes. Rather than reading each message
+    envelope piecemeal (a recv for the magic byte, another for the length, and more for the payload), it pulls
+    large chunks off of the socket duct into a single reusable buffer and splits out as many complete frames as the
+    buffer holds. Later reads are then served straight from the buffer without touching the socket at all.
+
+    Payloads larger than the buffer are received directly into their own preallocated bytearray, so they are never
+    copied through the read buffer.
+
+    If receive_fds is set, the socket is read with recvmsg, and any file descriptors that arrive as ancillary data
+    are queued up in received_fds, in order, for the frames that carry them to claim.
+
+    NOTE: Because the reader may consume bytes belonging to following messages, a duct shared between several
+    processes (for instance guarded by a multiprocessing.Lock) must disable read-ahead by using a buffer size of 0,
+    as message ducts given a lock do by default. Each read then only ever consumes exactly the bytes of the message
+    being received.
+    """
+
+    DEFAULT_BUFFER_SIZE = 64 * 1024
+    HEADER_FORMAT = '!cL'
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    EXTENDED_HEADER_FORMAT = '!cBL'
+    EXTENDED_HEADER_SIZE = struct.calcsize(EXTENDED_HEADER_FORMAT)
+    WIDE_HEADER_FORMAT = '!cBQ'
+    WIDE_HEADER_SIZE = struct.calcsize(WIDE_HEADER_FORMAT)
+
+    def __init__(self, socket_duct, buffer_size=DEFAULT_BUFFER_SIZE, receive_fds=False):
+        self.socket_duct = socket_duct
+        self.read_ahead = buffer_size > 0
+        self.buffer = bytearray(max(buffer_size, self.WIDE_HEADER_SIZE))
+        self.buffer_view = memoryview(self.buffer)
+        self.read_position = 0
+        self.fill_position = 0
+        # The number of buffered bytes needed before the next frame can make progress.
+        self.needed_bytes = self.HEADER_SIZE
+        # A payload too large for the read buffer, which is being received directly into its own buffer.
+        self.pending_payload = None
+        self.pending_payload_view = None
+        self.pending_flags = 0
+        self.receive_fds = receive_fds
+        self.ancillary_buffer_size = fd_ancillary_buffer_size() if receive_fds else 0
+        self.received_fds = deque()
+        # The largest frame body to accept, if limited (for instance as agreed on during a handshake).
+        self.max_frame_size = None
+        self.metrics = None
+
+    @property
+    def buffered_bytes(self):
+        """
+        The number of received bytes sitting in the read buffer that have not yet been handed out.
+
+        :return: The number of buffered bytes.
+        :rtype: int
+        """
+        return self.fill_position - self.read_position
+
+    def has_frame(self):
+        """
+        Check if a complete frame has already been received, i.e. if read_frame() can return without
+        touching the socket.
+
+        :return: True if a full frame is buffered, False otherwise.
+        :rtype: bool
+        """
+        if self.pending_payload is not None:
+            return not self.pending_payload_view
+        try:
+            header = parse_frame_header(self.buffer, self.read_position, self.fill_position)
+        except MessageProtocolException:
+            # Let the next read_frame() surface the error.
+            return True
+        if header is None:
+            return False
+        _, header_size, payload_len = header
+        return self.buffered_bytes >= header_size + payload_len
+
+    def _check_frame_size(self, payload_len):
+        if self.max_frame_size is not None and payload_len > self.max_frame_size:
+            raise MessageProtocolException("Received a {} byte frame, larger than the {} byte limit!"
+                                           "".format(payload_len, self.max_frame_size))
+
+    def _consume(self, num_bytes):
+        self.read_position += num_bytes
+        if self.read_position == self.fill_position:
+            self.read_position = self.fill_position = 0
+
+    def next_buffered_frame(self):
+        """
+        Split the next complete frame out of the data received so far, without touching the socket.
+
+        :return: The frame flags and raw (still serialized) payload of the frame, or None if no complete frame has
+            been received yet.
+        :rtype: (int, bytearray) | NoneType
+        """
+        if self.pending_payload is not None:
+            if self.pending_payload_view:
+                return None
+            frame = self.pending_flags, self.pending_payload
+            self.pending_payload = self.pending_payload_view = None
+            self.needed_bytes = self.HEADER_SIZE
+            return frame
+        header = parse_frame_header(self.buffer, self.read_position, self.fill_position)
+        if header is None:
+            # Each part of the header says whether there's more to it.
+            if self.buffered_bytes < self.HEADER_SIZE:
+                self.needed_bytes = self.HEADER_SIZE
+            elif self.buffered_bytes < self.EXTENDED_HEADER_SIZE:
+                self.needed_bytes = self.EXTENDED_HEADER_SIZE
+            else:
+                self.needed_bytes = self.WIDE_HEADER_SIZE
+            return None
+        flags, header_size, incoming_payload_len = header
+        self._check_frame_size(incoming_payload_len)
+        frame_len = header_size + incoming_payload_len
+        if frame_len <= len(self.buffer):
+            if self.buffered_bytes < frame_len:
+                self.needed_bytes = frame_len
+                return None
+            payload_start = self.read_position + header_size
+            serialized_payload = bytearray(self.buffer_view[payload_start:payload_start + incoming_payload_len])
+            self._consume(frame_len)
+            self.needed_bytes = self.HEADER_SIZE
+            return flags, serialized_payload
+        # Too big for the read buffer; take whatever part of the payload is already buffered and receive the
+        # rest straight into the payload's own buffer.
+        self._consume(header_size)
+        already_buffered = min(self.buffered_bytes, incoming_payload_len)
+        self.pending_flags = flags
+        self.pending_payload = bytearray(incoming_payload_len)
+        self.pending_payload_view = memoryview(self.pending_payload)
+        self.pending_payload_view[:already_buffered] = self.buffer_view[self.read_position:
+                                                                        self.read_position + already_buffered]
+        self._consume(already_buffered)
+        self.pending_payload_view = self.pending_payload_view[already_buffered:]
+        return self.next_buffered_frame()
+
+    def attach_metrics(self, metrics):
+        """
+        Start counting the socket reads made by this reader, the bytes they return, and the time they spend
+        blocked, in the given metrics. Readers without metrics don't pay for any of this.
+
+        :param metrics: The metrics to update.
+        :type metrics: ductworks.metrics.DuctMetrics
+        :return: None
+        """
+        recv_into = self._recv_into
+
+        def measured_recv_into(view):
+            started = clock()
+            num_bytes_received = recv_into(view)
+            metrics.blocking_time.record(clock() - started)
+            metrics.recv_calls += 1
+            metrics.bytes_received += num_bytes_received
+            return num_bytes_received
+        self.metrics = metrics
+        self._recv_into = measured_recv_into
+
+    def _recv_into(self, view):
+        if not self.receive_fds:
+            return self.socket_duct.recv_into(view)
+        num_bytes_received, ancdata, msg_flags, _ = self.socket_duct.recvmsg_into([view], self.ancillary_buffer_size)
+        self.received_fds.extend(fds_from_ancillary_data(ancdata))
+        if msg_flags & getattr(socket, 'MSG_CTRUNC', 0):
+            raise MessageProtocolException("Received more file descriptors than fit in the ancillary buffer!")
+        return num_bytes_received
+
+    def receive(self):
+        """
+        Perform a single receive on the socket duct, reading ahead as much as the buffer allows if read-ahead is
+        enabled. This only blocks if the socket duct has no data ready; it's safe to call on a non-blocking socket
+        once it polls as readable.
+
+        :return: The number of bytes received; 0 if the remote end has closed the connection.
+        :rtype: int
+        """
+        if self.pending_payload is not None:
+            num_bytes_received = self._recv_into(self.pending_payload_view)
+            self.pending_payload_view = self.pending_payload_view[num_bytes_received:]
+            return num_bytes_received
+        if self.read_position + self.needed_bytes > len(self.buffer) or \
+                (self.read_ahead and self.fill_position == len(self.buffer)):
+            # Slide the unread bytes back to the front of the buffer to make room.
+            buffered_bytes = self.buffered_bytes
+            self.buffer_view[:buffered_bytes] = self.buffer_view[self.read_position:self.fill_position]
+            self.read_position = 0
+            self.fill_position = buffered_bytes
+        if self.read_ahead:
+            read_limit = len(self.buffer)
+        else:
+            read_limit = self.read_position + self.needed_bytes
+        num_bytes_received = self._recv_into(self.buffer_view[self.fill_position:read_limit])
+        self.fill_position += num_bytes_received
+        return num_bytes_received
+
+    def read_frame(self):
+        """
+        Read one complete frame, blocking on the socket duct only if it hasn't already been received.
+
+        :return: The frame flags and raw (still serialized) payload of the frame.
+        :rtype: (int, bytearray)
+        """
+        while True:
+            frame = self.next_buffered_frame()
+            if frame is not None:
+                return frame
+            if not self.receive():
+                if self.buffered_bytes or self.pending_payload is not None:
+                    raise RemoteDuctClosed("Remote duct closed mid-message!")
+                raise RemoteDuctClosed("Remote duct closed.")
+
+    def claim_fd(self):
+        """
+        Take ownership of the next file descriptor received alongside the frames read so far.
+
+        A MessageProtocolException is raised if no descriptor has been received.
+
+        :return: The file descriptor, which the caller must close.
+        :rtype: int
+        """
+        try:
+            return self.received_fds.popleft()
+        except IndexError:
+            if not self.receive_fds:
+                raise MessageProtocolException("Received a frame carrying a file descriptor, but this duct wasn't "
+                                               "set up to receive file descriptors!")
+            raise MessageProtocolException("Received a frame carrying a file descriptor without the descriptor!")
+
+    def close(self):
+        """
+        Close any received file descriptors that were never claimed.
+
+        :return: None
+        """
+        while self.received_fds:
+            os.close(self.received_fds.popleft())
+
+
+class PacketFrameReader(FrameReader):
+    """
+    The PacketFrameReader is the receive engine for message ducts running over a SOCK_SEQPACKET socket. Frames use
+    the same envelope as on a streaming socket, but since the kernel preserves packet boundaries, any message that
+    fits in one packet is received whole by a single recv syscall, with no reassembly. Larger messages are sent as
+    a first packet carrying the envelope header followed by continuation packets, which are received directly into
+    the message's own preallocated buffer.
+    """
+
+    DEFAULT_PACKET_SIZE = 64 * 1024
+
+    def __init__(self, socket_duct, packet_size=DEFAULT_PACKET_SIZE, receive_fds=False):
+        super(PacketFrameReader, self).__init__(socket_duct, packet_size, receive_fds)
+        self.packet_size = packet_size
+        self.ready_payload = None
+        self.ready_flags = 0
+
+    @property
+    def buffered_bytes(self):
+        """
+        The number of received bytes that have not yet been handed out as part of a frame.
+
+        :return: The number of buffered bytes.
+        :rtype: int
+        """
+        if self.ready_payload is not None:
+            return len(self.ready_payload)
+        if self.pending_payload is not None:
+            return len(self.pending_payload) - len(self.pending_payload_view)
+        return 0
+
+    def has_frame(self):
+        """
+        Check if a complete frame has already been received, i.e. if read_frame() can return without
+        touching the socket.
+
+        :return: True if a full frame is buffered, False otherwise.
+        :rtype: bool
+        """
+        return self.ready_payload is not None
+
+    def next_buffered_frame(self):
+        """
+        Hand out the frame received so far, without touching the socket.
+
+        :return: The frame flags and raw (still serialized) payload of the frame, or None if no complete frame has
+            been received yet.
+        :rtype: (int, bytearray) | NoneType
+        """
+        if self.ready_payload is None:
+            return None
+        frame = self.ready_flags, self.ready_payload
+        self.ready_payload = None
+        return frame
+
+    def _recv_into(self, view):
+        # With MSG_TRUNC, Linux reports the full length of the packet even if it didn't fit in the buffer.
+        if self.receive_fds:
+            num_bytes_received, ancdata, _, _ = self.socket_duct.recvmsg_into([view], self.ancillary_buffer_size,
+                                                                              socket.MSG_TRUNC)
+            self.received_fds.extend(fds_from_ancillary_data(ancdata))
+        else:
+            num_bytes_received = self.socket_duct.recv_into(view, len(view), socket.MSG_TRUNC)
+        if num_bytes_received > len(view):
+            raise MessageProtocolException("Received a packet larger than the {} byte packet size! Both ends of the "
+                                           "duct must use the same packet size.".format(self.packet_size))
+        return num_bytes_received
+
+    def receive(self):
+        """
+        Receive a single packet from the socket duct.
+
+        :return: The number of bytes received; 0 if the remote end has closed the connection.
+        :rtype: int
+        """
+        if self.pending_payload is not None:
+            num_bytes_received = self._recv_into(self.pending_payload_view)
+            self.pending_payload_view = self.pending_payload_view[num_bytes_received:]
+            if not self.pending_payload_view:
+                self.ready_flags, self.ready_payload = self.pending_flags, self.pending_payload
+                self.pending_payload = self.pending_payload_view = None
+            return num_bytes_received
+        num_bytes_received = self._recv_into(self.buffer_view)
+        if num_bytes_received == 0:
+            return 0
+        header = parse_frame_header(self.buffer, 0, num_bytes_received)
+        if header is None:
+            raise MessageProtocolException("Received a packet too short to hold a message envelope!")
+        flags, header_size, incoming_payload_len = header
+        self._check_frame_size(incoming_payload_len)
+        packet_payload_len = num_bytes_received - header_size
+        serialized_payload = bytearray(incoming_payload_len)
+        serialized_payload[:packet_payload_len] = self.buffer_view[header_size:num_bytes_received]
+        if packet_payload_len == incoming_payload_len:
+            self.ready_flags, self.ready_payload = flags, serialized_payload
+        else:
+            self.pending_flags = flags
+            self.pending_payload = serialized_payload
+            self.pending_payload_view = memoryview(serialized_payload)[packet_payload_len:]
+        return num_bytes_received
+
+    def read_frame(self):
+        """
+        Read one complete frame, blocking on the socket duct only if it hasn't already been received.
+
+        :return: The frame flags and raw (still serialized) payload of the frame.
+        :rtype: (int, bytearray)
+        """
+        while self.ready_payload is None:
+            if not self.receive():
+                if self.pending_payload is not None:
+                    raise RemoteDuctClosed("Remote duct closed mid-message!")
+                raise RemoteDuctClosed("Remote duct closed.")
+        return self.next_buffered_frame()
@@ -1,70 +1,1089 @@
+import os
+import multiprocessing
+import select
+import socket
+import struct
+import subprocess
+import threading
+import time
+from zlib import Z_DEFAULT_COMPRESSION
+from collections import deque
+
 try:
-    import anyjson as json
+    from pickle import PickleBuffer
 except ImportError:
-    import json
-import struct
-import codecs
-from binascii import hexlify
+    PickleBuffer = None
+
+try:
+    from multiprocessing.synchronize import SemLock
+except ImportError:
+    # Platforms without working semaphores have no multiprocessing locks.
+    SemLock = None
 from tempfile import NamedTemporaryFile
 
-from ductworks.base_duct import RawDuctParent, RawDuctChild, tcp_socket_constructor,\
-    tcp_socket_listener_destructor, DuctworksException
+from ductworks.base_duct import RawDuctParent, RawDuctChild, SocketPoller, tcp_socket_constructor,\
+    tcp_socket_listener_destructor, unix_domain_seqpacket_socket_constructor,\
+    unix_domain_seqpacket_socket_listener_destructor, random_abstract_namespace_address,\
+    ABSTRACT_NAMESPACE_SUPPORTED, DuctworksException, fd_ancillary_data, MAX_FDS_PER_MESSAGE
+from ductworks.shared_memory import create_shared_memory_segment, map_shared_memory_segment,\
+    pack_shared_memory_descriptor, unpack_shared_memory_descriptor
+from ductworks.compression import FrameCompressor
+from ductworks.metrics import DuctMetrics, DEFAULT_METRICS_REGISTRY, clock
+# The framing, codecs and channels live in modules of their own, but everything in them can still be imported from
+# here too.
+from ductworks.framing import MAGIC_BYTE, EXTENDED_MAGIC_BYTE, FRAME_FLAG_SHARED_MEMORY, FRAME_FLAG_FILE_DESCRIPTORS, \
+    FILE_DESCRIPTOR_COUNT_FORMAT, FILE_DESCRIPTOR_COUNT_SIZE, FRAME_FLAG_OUT_OF_BAND, OUT_OF_BAND_COUNT_FORMAT, \
+    OUT_OF_BAND_COUNT_SIZE, FRAME_FLAG_CONTROL, FRAME_FLAG_COMPRESSED, FRAME_FLAG_CHANNEL, FRAME_FLAG_PRIORITY, \
+    FRAME_FLAG_WIDE_LENGTH, MAX_NARROW_FRAME_SIZE, SUPPORTED_FRAME_FLAGS, MessageProtocolException, RemoteDuctClosed, \
+    pack_frame_header, parse_frame_header, FrameReader, PacketFrameReader  # noqa: F401
+from ductworks.serialization import HANDSHAKE_VERSION, serialized_buffers, serialized_length, \
+    serializer_with_encoder_constructor, deserializer_with_decoder_constructor, default_serializer, \
+    default_deserializer, PICKLE5_SUPPORTED, pickle5_serializer, pickle5_deserializer, PAYLOAD_TAG_RAW, \
+    PAYLOAD_TAG_TEXT, PAYLOAD_TAG_STRUCTURED, tagged_serializer_constructor, tagged_deserializer_constructor, \
+    tagged_serializer, tagged_deserializer, Codec, CODECS, register_codec, DEFAULT_CODEC_PREFERENCE, \
+    NegotiatedOptions, handshake_hello, negotiate_options  # noqa: F401
+from ductworks.channels import CHANNEL_HEADER_FORMAT, CHANNEL_HEADER_SIZE, MAX_CHANNEL_ID, CHANNEL_FRAGMENT_MORE, \
+    CHANNEL_FRAGMENT_PLAIN, CHANNEL_FRAGMENT_STREAM, CHANNEL_FRAGMENT_ABORT, CHANNEL_BUFFER_COUNT_FORMAT, \
+    CHANNEL_BUFFER_COUNT_SIZE, CHANNEL_BUFFER_LENGTH_FORMAT, CHANNEL_BUFFER_LENGTH_SIZE, \
+    DEFAULT_CHANNEL_FRAGMENT_SIZE, PRIORITY_NORMAL, PRIORITY_HIGH, DEFAULT_MAX_READ_AHEAD, OutgoingChannelMessage, \
+    OutgoingFramedMessage, ChannelMultiplexer, DuctChannel  # noqa: F401
+
+
+# What a duct with a write queue does when a message is sent while the queue is full: wait for room, throw away the
+# oldest queued message to make room, or raise a WriteQueueFull exception.
+WRITE_QUEUE_BLOCK = 'block'
+WRITE_QUEUE_DROP_OLDEST = 'drop-oldest'
+WRITE_QUEUE_RAISE = 'raise'
+WRITE_QUEUE_POLICIES = (WRITE_QUEUE_BLOCK, WRITE_QUEUE_DROP_OLDEST, WRITE_QUEUE_RAISE)
+
+# The type of the locks made by threading.Lock(), which can't be made directly on every version of Python.
+THREAD_LOCK_TYPE = type(threading.Lock())
+
+# The environment variable spawn_with_duct() uses to tell a child process which inherited descriptor is its duct.
+DUCT_FD_ENVIRONMENT_VARIABLE = 'DUCTWORKS_DUCT_FD'
+
+
+class WriteQueueFull(DuctworksException):
+    """
+    This exception is thrown when a message can't be queued for sending because the duct's write queue is full.
+    """
+    pass
 
 
-MAGIC_BYTE = b'\x54'
+class BackgroundWriter(object):
+    """
+    The BackgroundWriter holds the bounded outbound queue of a duct created with a write_queue_size, along with the
+    thread that writes it out. Senders only serialize and frame their message and queue it up; the writer thread
+    takes everything queued since its last write and sends it all together, as few scatter/gather writes as
+    possible, so a slow peer stalls the writer thread rather than the senders.
 
+    Messages sent with PRIORITY_HIGH are kept in a queue of their own, which doesn't count towards the limit and is
+    always written out first. Fragments of the messages split up by the channel multiplexer always wait for room,
+    whatever the policy, and are never dropped, since losing part of a message would corrupt the stream.
 
-class MessageProtocolException(DuctworksException):
-    pass
+    If a write fails (for instance because the other end closed), the writer stops, throws away everything still
+    queued, and the error is raised from the next send or flush.
 
+    Payloads are serialized before send() returns, but buffers sent as-is (such as raw bytes with the tagged codec,
+    or out-of-band pickle buffers) must not be changed until the duct has been flushed.
+    """
 
-class RemoteDuctClosed(EOFError, DuctworksException):
-    pass
+    def __init__(self, send_frames, max_queued, policy=WRITE_QUEUE_BLOCK):
+        if policy not in WRITE_QUEUE_POLICIES:
+            raise ValueError("Unknown write queue policy {!r}! Expected one of {}".format(
+                policy, WRITE_QUEUE_POLICIES))
+        self.send_frames = send_frames
+        self.max_queued = max(max_queued, 1)
+        self.policy = policy
+        # Each entry is one message: its frames, and the descriptors to close once it has been sent.
+        self.queue = deque()
+        self.priority_queue = deque()
+        self.condition = threading.Condition()
+        # Messages taken off the queue by the writer thread, but not yet fully written.
+        self.in_flight = 0
+        self.messages_dropped = 0
+        self.error = None
+        self.closing = False
+        self.thread = threading.Thread(target=self._run, name='ductworks-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    @staticmethod
+    def _close_fds(fds):
+        for fd in fds:
+            os.close(fd)
+
+    def _check_error(self):
+        if self.error is not None:
+            raise self.error
+        if self.closing:
+            raise MessageProtocolException("Can't send on a closed duct!")
+
+    def put(self, frames, fds_to_close, block=True, priority=PRIORITY_NORMAL, partial=False):
+        """
+        Queue up a message's frames for the writer thread, following the queue's policy if it is full. Once queued,
+        the writer owns the descriptors in fds_to_close, and closes them after the message is written (or dropped).
+        High priority messages are queued ahead of everything else, and never wait for room.
+
+        A WriteQueueFull exception is raised if the message can't be queued.
+
+        :param frames: The message's (buffers, ancillary data) frames.
+        :type frames: list
+        :param fds_to_close: Descriptors to close once the message has been written.
+        :type fds_to_close: list
+        :param block: If False, raise WriteQueueFull rather than wait for room, even with the block policy.
+        :type block: bool
+        :param priority: PRIORITY_NORMAL or PRIORITY_HIGH. Default: PRIORITY_NORMAL
+        :type priority: int
+        :param partial: If True, the frames are only part of a message, and must be neither refused nor dropped.
+            Default: False
+        :type partial: bool
+        :return: None
+        """
+        with self.condition:
+            self._check_error()
+            if priority == PRIORITY_HIGH:
+                self.priority_queue.append((frames, fds_to_close, partial))
+                self.condition.notify_all()
+                return
+            while len(self.queue) >= self.max_queued:
+                if self.policy == WRITE_QUEUE_DROP_OLDEST and self._drop_oldest():
+                    continue
+                if (self.policy == WRITE_QUEUE_RAISE or not block) and not partial:
+                    raise WriteQueueFull("The write queue already holds {} messages!".format(len(self.queue)))
+                self.condition.wait()
+                self._check_error()
+            self.queue.append((frames, fds_to_close, partial))
+            self.condition.notify_all()
+
+    def _drop_oldest(self):
+        for index, (_, dropped_fds, partial) in enumerate(self.queue):
+            if not partial:
+                del self.queue[index]
+                self._close_fds(dropped_fds)
+                self.messages_dropped += 1
+                return True
+        return False
+
+    def flush(self, timeout=None):
+        """
+        Wait for every queued message to be written to the socket.
 
+        :param timeout: The longest to wait, in seconds. If None, wait as long as it takes. Default: None
+        :type timeout: float | int | None
+        :return: True if everything was written, False if the timeout ran out first.
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while (self.queue or self.priority_queue or self.in_flight) and self.error is None:
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+            if self.error is not None:
+                raise self.error
+            return True
 
-def serializer_with_encoder_constructor(serialization_func, encoder_type='utf-8', encoder_error_mode='strict'):
-    """
-    Wrap a serialization function with string encoding. This is important for JSON, as it serializes objects into
-    strings (potentially unicode), NOT bytestreams. An extra encoding step is needed to get to a bytestream.
-
-    :param serialization_func: The base serialization function.
-    :param encoder_type: The encoder type. Default: 'utf-8'
-    :param encoder_error_mode: The encode error mode. Default: 'strict'.
-    :return: The serializer function wrapped with specified encoder.
-    :rtype: T -> bytes | bytearray | str
+    def close(self):
+        """
+        Stop the writer thread once it has written everything already queued.
+
+        :return: None
+        """
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not (self.queue or self.priority_queue) and not self.closing:
+                    self.condition.wait()
+                if not (self.queue or self.priority_queue):
+                    return
+                batch = list(self.priority_queue) + list(self.queue)
+                self.priority_queue.clear()
+                self.queue.clear()
+                self.in_flight = len(batch)
+                # There's room in the queue again.
+                self.condition.notify_all()
+            frames = []
+            fds_to_close = []
+            for message_frames, message_fds, _ in batch:
+                frames.extend(message_frames)
+                fds_to_close.extend(message_fds)
+            try:
+                self.send_frames(frames)
+            except Exception as e:
+                with self.condition:
+                    self.error = e
+                    self.in_flight = 0
+                    for queue in (self.priority_queue, self.queue):
+                        while queue:
+                            self._close_fds(queue.popleft()[1])
+                    self.condition.notify_all()
+                return
+            finally:
+                self._close_fds(fds_to_close)
+            with self.condition:
+                self.in_flight = 0
+                self.condition.notify_all()
+
+
+def lock_like(lock):
     """
-    encoder = codecs.getencoder(encoder_type)
+    Make a new lock of the same kind as the given one, which message ducts given a single lock hold around receives
+    while the given lock is held around sends. Thread locks and multiprocessing locks can always be recreated, and
+    so can any other kind of lock made without arguments. A multiprocessing lock made this way is shared with child
+    processes the same way the given one is, as long as both are made before the processes are started.
 
-    def serialize(payload):
-        serialized, _ = encoder(serialization_func(payload), encoder_error_mode)
-        return serialized
-    return serialize
+    :param lock: The lock to match.
+    :return: A new lock of the same kind, or None if one can't be made.
+    """
+    if SemLock is not None and isinstance(lock, SemLock):
+        return type(lock)(ctx=multiprocessing.get_context())
+    if isinstance(lock, THREAD_LOCK_TYPE):
+        return threading.Lock()
+    try:
+        return type(lock)()
+    except TypeError:
+        return None
 
 
-def deserializer_with_decoder_constructor(deserialization_func, decoder_type='utf-8', decoder_error_mode='replace'):
+class BaseMessageDuct(object):
     """
-    Wrap a deserialization function with string encoding. This is important for JSON, as it expects to operate on
-    strings (potentially unicode), NOT bytetsteams. A decoding steps is needed in between.
-
-    :param deserialization_func: The base deserialization function.
-    :param decoder_type: The decoder type. Default: 'utf-8'
-    :param decoder_error_mode: The decode error mode. Default: 'replace'.
-    :return: The deserializer function wrapped with specified decoder.
-    :rtype: bytes | bytearray | str -> T
+    The BaseMessageDuct holds the behavior shared by both ends of a message duct: the message envelope framing for
+    send and recv, polling, and cleanup. It is not meant to be instantiated directly; use the MessageDuctParent
+    and MessageDuctChild classes instead.
+
+    :param socket_duct: The raw socket duct to carry the frames over.
+    :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+    :param deserialize: The deserialization function for received messages. Default: Encoded JSON.
+    :param lock: A lock to hold around sends, alongside a new lock of the same kind (see lock_like) to hold around
+        receives, or a (send lock, recv lock) pair. Default: None
+    :param recv_buffer_size: The size of the read-ahead buffer, or 0 to never read past the message being received.
+        Default: 64 KiB, or 0 if a lock is given.
+    :type recv_buffer_size: int | None
+    :param packet_size: The largest packet, for ducts over SOCK_SEQPACKET sockets. Default: None
+    :type packet_size: int | None
+    :param shared_memory_threshold: Send payloads of at least this many bytes through an anonymous shared memory
+        segment rather than the socket. Unix Domain sockets only, and both ends must be given one. Default: None
+    :type shared_memory_threshold: int | None
+    :param receive_fds: Whether to receive file descriptors sent with send_fds(). Default: False
+    :type receive_fds: bool
+    :param out_of_band: Whether the codec keeps buffers out of band, like pickle5_serializer. Default: False
+    :type out_of_band: bool
+    :param handshake: Whether to agree on a codec, compression and frame size limit with the other end, which must
+        be created with handshake=True too. The agreement is kept in negotiated_options. Default: False
+    :type handshake: bool
+    :param codecs: The names of the codecs to offer during the handshake, fastest first. Only list pickle5 or
+        marshal if the other end is trusted. Default: DEFAULT_CODEC_PREFERENCE
+    :type codecs: tuple
+    :param max_frame_size: The largest frame to accept, in bytes. Default: None
+    :type max_frame_size: int | None
+    :param compression_threshold: Compress frames of at least this many bytes with zlib. Either end can read
+        compressed frames. Default: None
+    :type compression_threshold: int | None
+    :param compression_level: The zlib compression level. Default: Z_DEFAULT_COMPRESSION
+    :type compression_level: int
+    :param compression_dictionary: A preset dictionary (see ductworks.compression.train_compression_dictionary),
+        which both ends must be given. Default: None
+    :type compression_dictionary: bytes | None
+    :param metrics: True, or a ductworks.metrics.DuctMetrics, to keep counters and timings of the duct's traffic.
+        Default: None
+    :param send_lock: The lock to hold around sends, instead of one from lock. Default: None
+    :param recv_lock: The lock to hold around receives, instead of one from lock. Default: None
+    :param write_queue_size: Send in the background, through a BackgroundWriter with room for this many messages.
+        Ducts with a write queue must be closed, to stop the writer thread. Default: None
+    :type write_queue_size: int | None
+    :param write_queue_policy: What send() does while the write queue is full: WRITE_QUEUE_BLOCK,
+        WRITE_QUEUE_DROP_OLDEST or WRITE_QUEUE_RAISE. Default: WRITE_QUEUE_BLOCK
+    :type write_queue_policy: str
+    :param channel_fragment_size: The largest fragment to split messages sent on a channel() into, in bytes.
+        Default: 64 KiB
+    :type channel_fragment_size: int
+    :param priority_lanes: Whether to split large plain messages into fragments too, so PRIORITY_HIGH messages can
+        cut in between them. Default: False
+    :type priority_lanes: bool
+    :param max_read_ahead: The most normal messages poll() reads ahead and keeps for recv() while waiting for a
+        PRIORITY_HIGH message. Default: 1024
+    :type max_read_ahead: int
     """
-    decoder = codecs.getdecoder(decoder_type)
 
-    def deserialize(payload):
-        decoded, _ = decoder(payload, decoder_error_mode)
-        return deserialization_func(decoded)
-    return deserialize
+    # Whose order of preference wins when the two ends negotiate during the handshake.
+    leads_handshake = False
+
+    def __init__(self, socket_duct, serialize=default_serializer, deserialize=default_deserializer, lock=None,
+                 recv_buffer_size=None, packet_size=None, shared_memory_threshold=None,
+                 receive_fds=False, out_of_band=False, handshake=False, codecs=DEFAULT_CODEC_PREFERENCE,
+                 max_frame_size=None, compression_threshold=None, compression_level=Z_DEFAULT_COMPRESSION,
+                 compression_dictionary=None, metrics=None, send_lock=None, recv_lock=None, write_queue_size=None,
+                 write_queue_policy=WRITE_QUEUE_BLOCK, channel_fragment_size=DEFAULT_CHANNEL_FRAGMENT_SIZE,
+                 priority_lanes=False, max_read_ahead=DEFAULT_MAX_READ_AHEAD):
+        self.socket_duct = socket_duct
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.lock = lock
+        if isinstance(lock, tuple):
+            lock_send_side, lock_recv_side = lock
+        else:
+            lock_send_side = lock_recv_side = lock
+            if lock is not None and recv_lock is None:
+                lock_recv_side = lock_like(lock) or lock
+        self.send_lock = send_lock if send_lock is not None else lock_send_side
+        self.recv_lock = recv_lock if recv_lock is not None else lock_recv_side
+        # Only set for ducts running over a SOCK_SEQPACKET socket, where it is the largest packet ever sent.
+        self.packet_size = packet_size
+        self.shared_memory_threshold = shared_memory_threshold
+        # If set, serialize returns a (payload, buffers) tuple and deserialize takes them as two arguments.
+        self.out_of_band = out_of_band
+        receive_fds = receive_fds or shared_memory_threshold is not None
+        if packet_size:
+            self.frame_reader = PacketFrameReader(socket_duct, packet_size, receive_fds=receive_fds)
+        else:
+            if recv_buffer_size is None:
+                # A locked duct may be shared between processes, and one reading ahead would buffer up frames meant
+                # for whichever process reads next.
+                recv_buffer_size = 0 if self.recv_lock else FrameReader.DEFAULT_BUFFER_SIZE
+            self.frame_reader = FrameReader(socket_duct, recv_buffer_size, receive_fds=receive_fds)
+        self.max_frame_size = max_frame_size
+        self.frame_reader.max_frame_size = max_frame_size
+        self.compression_threshold = compression_threshold
+        self.frame_compressor = FrameCompressor(compression_level, compression_dictionary)
+        # Only unregistered on close if this duct created them.
+        self.owns_metrics = metrics is True
+        if metrics is True:
+            metrics = DuctMetrics(registry=DEFAULT_METRICS_REGISTRY)
+        self.metrics = metrics or None
+        if self.metrics is not None:
+            self.frame_reader.attach_metrics(self.metrics)
+        self.background_writer = None
+        if write_queue_size:
+            self.background_writer = BackgroundWriter(self._send_frames, write_queue_size, write_queue_policy)
+        self.channel_multiplexer = ChannelMultiplexer(self, channel_fragment_size, max_read_ahead)
+        # If set, plain messages are sent through the channel multiplexer too, split into fragments.
+        self.priority_lanes = priority_lanes
+        # The largest frame the other end accepts, once known from the handshake.
+        self.peer_max_frame_size = None
+        self.handshake = handshake
+        self.codecs = tuple(codecs)
+        self.negotiated_options = None
+        # Set once this end's hello has been sent, until the other end's hello has been read.
+        self.handshake_pending = False
+        if handshake and self._is_connected():
+            self._send_hello()
+
+    def _is_connected(self):
+        return False
+
+    def _send_hello(self):
+        hello = handshake_hello(self.codecs, self.frame_compressor.dictionary_id, self.max_frame_size)
+        self._send_frames((((pack_frame_header(len(hello), FRAME_FLAG_CONTROL), hello), None),))
+        self.handshake_pending = True
+
+    def _negotiate(self, peer_hello):
+        negotiated_options = negotiate_options(self.codecs, peer_hello, self.leads_handshake,
+                                               self.frame_compressor.dictionary_id, self.max_frame_size)
+        if negotiated_options.compression is None:
+            self.compression_threshold = None
+        self.peer_max_frame_size = peer_hello.get('max_frame_size')
+        return negotiated_options
+
+    def _complete_handshake(self):
+        flags, hello = self.frame_reader.read_frame()
+        if flags != FRAME_FLAG_CONTROL:
+            raise MessageProtocolException("Expected a handshake from the other end, but got a regular message! "
+                                           "Both ends must be created with handshake=True.")
+        negotiated_options = self._negotiate(default_deserializer(hello))
+        self.serialize = negotiated_options.codec.serialize
+        self.deserialize = negotiated_options.codec.deserialize
+        self.out_of_band = negotiated_options.codec.out_of_band
+        self.negotiated_options = negotiated_options
+        self.handshake_pending = False
+        self.channel_multiplexer.notify_receivers()
+
+    def _complete_handshake_for_send(self):
+        recv_lock = self.recv_lock
+        if not recv_lock or recv_lock is self.send_lock:
+            self._complete_handshake()
+            return
+        # The other end's hello is read on the receive side. A receiver holding that side reads the hello first
+        # thing, so wait for it to do so rather than for its lock, which it may then hold waiting for a message.
+        if self.channel_multiplexer.wait_for_recv_lock(None, lambda: not self.handshake_pending):
+            try:
+                if self.handshake_pending:
+                    self._complete_handshake()
+            finally:
+                self._release_recv_lock()
+
+    @property
+    def compression_stats(self):
+        """
+        How much compressing frames has saved on this duct, and how long compressing and decompressing took.
+
+        :return: The running compression statistics for this duct.
+        :rtype: ductworks.compression.CompressionStats
+        """
+        return self.frame_compressor.stats
+
+    def fileno(self):
+        """
+        Get the file descriptor for the connection socket in the socket duct.
+        This is useful for integrating into other event loops.
+
+        :return: The connection file descriptor.
+        :rtype: int
+        """
+        return self.socket_duct.fileno()
+
+    def poll(self, timeout=60, priority=None):
+        """
+        Poll the underlying socket duct to check for new messages.
+
+        Given a priority, only messages sent with that priority count: messages are read off of the duct (and kept,
+        in order, for recv()) until one turns up. Waiting for a PRIORITY_HIGH message this way lets a worker busy with
+        a backlog of bulk messages notice a cancellation right away, and recv() then returns it first. Once
+        max_read_ahead normal messages are kept, it stops reading and returns False, until recv() takes some.
+
+        :param timeout: The amount of time to wait for a new message, if none is present. Default: 60 seconds.
+        :type timeout: int
+        :param priority: If given, PRIORITY_NORMAL or PRIORITY_HIGH; only wait for messages sent with that priority.
+            Default: None
+        :type priority: int | NoneType
+        :return: True if a message is waiting, False otherwise.
+        :rtype: bool
+        """
+        if priority is not None:
+            return self.channel_multiplexer.poll_plain(priority, timeout)
+        if self.channel_multiplexer.has_received_data():
+            return True
+        if self.handshake_pending:
+            started = time.time()
+            if not (self.frame_reader.has_frame() or self._poll_socket(timeout)):
+                return False
+            self._complete_handshake()
+            timeout = max(timeout - (time.time() - started), 0)
+        if self.frame_reader.has_frame():
+            return True
+        return self._poll_socket(timeout)
+
+    def _poll_socket(self, timeout):
+        metrics = self.metrics
+        if metrics is None:
+            return self.socket_duct.poll(timeout)
+        started = clock()
+        try:
+            return self.socket_duct.poll(timeout)
+        finally:
+            metrics.blocking_time.record(clock() - started)
+
+    def _acquire(self, lock):
+        metrics = self.metrics
+        if metrics is None:
+            lock.acquire()
+            return
+        started = clock()
+        lock.acquire()
+        metrics.lock_wait_time.record(clock() - started)
+
+    def _release_recv_lock(self):
+        self.recv_lock.release()
+        # Threads waiting on the channel multiplexer for the lock aren't blocked on the lock itself.
+        self.channel_multiplexer.notify_receivers()
+
+    def _sendmsg(self, buffers, ancdata):
+        bytes_sent = self.socket_duct.sendmsg_all(buffers, ancdata)
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.send_calls += 1
+            metrics.bytes_sent += bytes_sent
+
+    def _send_packets(self, buffers, ancdata=None):
+        """
+        Send a single message over a SOCK_SEQPACKET socket; one packet if it fits, otherwise a first packet with the
+        envelope header followed by as many continuation packets as needed.
+        """
+        packet = []
+        room = self.packet_size
+        for buff in buffers:
+            view = memoryview(buff)
+            if view.ndim != 1 or view.itemsize != 1:
+                view = view.cast('B')
+            while view:
+                chunk = view[:room]
+                packet.append(chunk)
+                room -= len(chunk)
+                view = view[len(chunk):]
+                if not room:
+                    self._sendmsg(packet, ancdata)
+                    ancdata = None
+                    packet = []
+                    room = self.packet_size
+        if packet:
+            self._sendmsg(packet, ancdata)
+
+    def _send_frames(self, frames):
+        """
+        Send a list of (buffers, ancillary data) frames. On a streaming socket, consecutive frames are coalesced into
+        as few scatter/gather writes as possible; a frame carrying ancillary data always starts a new write, so that
+        its descriptors arrive no later than its first byte.
+        """
+        if self.packet_size:
+            for buffers, ancdata in frames:
+                self._send_packets(buffers, ancdata)
+            return
+        batch = []
+        batch_ancdata = None
+        for buffers, ancdata in frames:
+            if ancdata and batch:
+                self._sendmsg(batch, batch_ancdata)
+                batch = []
+            if not batch:
+                batch_ancdata = ancdata
+            batch.extend(buffers)
+        if batch:
+            # Hand the headers and payloads to the kernel as a scatter/gather list, rather than copying
+            # the (potentially very large) payloads into a new buffer behind the headers.
+            self._sendmsg(batch, batch_ancdata)
+
+    def _use_shared_memory(self, payload_len):
+        threshold = self.shared_memory_threshold
+        return threshold is not None and payload_len >= max(threshold, 1)
+
+    def _use_compression(self, payload_len):
+        threshold = self.compression_threshold
+        return threshold is not None and payload_len >= max(threshold, 1)
+
+    def _serialize(self, payload):
+        metrics = self.metrics
+        if metrics is not None:
+            started = clock()
+        if self.out_of_band:
+            serialized = self.serialize(payload)
+        else:
+            serialized = self.serialize(payload), None
+        if metrics is not None:
+            metrics.serialize_time.record(clock() - started)
+            metrics.messages_sent += 1
+        return serialized
+
+    def _check_peer_frame_size(self, frame_body_len):
+        if self.peer_max_frame_size is not None and frame_body_len > self.peer_max_frame_size:
+            raise MessageProtocolException("Can't send a {} byte frame; the other end only accepts up to {} bytes!"
+                                           "".format(frame_body_len, self.peer_max_frame_size))
+
+    def _build_frame(self, serialized_payload, out_of_band_buffer_count=None, fds=None, open_segments=None,
+                     flags=0):
+        payload_len = serialized_length(serialized_payload)
+        use_shared_memory = self._use_shared_memory(payload_len)
+        use_compression = not use_shared_memory and self._use_compression(payload_len)
+        if not (fds or flags) and out_of_band_buffer_count is None and not use_shared_memory and not use_compression:
+            self._check_peer_frame_size(payload_len)
+            if isinstance(serialized_payload, list):
+                return [pack_frame_header(payload_len)] + serialized_payload, None
+            return (pack_frame_header(payload_len), serialized_payload), None
+        frame_body = list(serialized_buffers(serialized_payload))
+        ancillary_fds = [fd if isinstance(fd, int) else fd.fileno() for fd in fds or ()]
+        if len(ancillary_fds) > MAX_FDS_PER_MESSAGE:
+            raise MessageProtocolException("Can't send more than {} file descriptors with one message!"
+                                           "".format(MAX_FDS_PER_MESSAGE))
+        if use_compression:
+            compressed_payload = self.frame_compressor.compress(frame_body, payload_len)
+            if compressed_payload is not None:
+                frame_body = [compressed_payload]
+                flags |= FRAME_FLAG_COMPRESSED
+        if use_shared_memory:
+            segment_fd = create_shared_memory_segment(frame_body)
+            open_segments.append(segment_fd)
+            ancillary_fds.append(segment_fd)
+            frame_body = [pack_shared_memory_descriptor(payload_len)]
+            flags |= FRAME_FLAG_SHARED_MEMORY
+        if out_of_band_buffer_count is not None:
+            frame_body.insert(0, struct.pack(OUT_OF_BAND_COUNT_FORMAT, out_of_band_buffer_count))
+            flags |= FRAME_FLAG_OUT_OF_BAND
+        if fds:
+            frame_body.insert(0, struct.pack(FILE_DESCRIPTOR_COUNT_FORMAT, len(fds)))
+            flags |= FRAME_FLAG_FILE_DESCRIPTORS
+        frame_body_len = serialized_length(frame_body)
+        self._check_peer_frame_size(frame_body_len)
+        header = pack_frame_header(frame_body_len, flags)
+        return [header] + frame_body, fd_ancillary_data(ancillary_fds)
+
+    def _append_message_frames(self, frames, serialized_payload, out_of_band_buffers, fds, open_segments, flags=0):
+        if out_of_band_buffers is None:
+            frames.append(self._build_frame(serialized_payload, None, fds, open_segments, flags))
+            return
+        # The pickle stream goes first, followed by one frame per buffer, each sent straight from the memory
+        # the buffer already lives in.
+        frames.append(self._build_frame(serialized_payload, len(out_of_band_buffers), fds, open_segments, flags))
+        for out_of_band_buffer in out_of_band_buffers:
+            if isinstance(out_of_band_buffer, PickleBuffer):
+                out_of_band_buffer = out_of_band_buffer.raw()
+            frames.append(self._build_frame(out_of_band_buffer, open_segments=open_segments))
+
+    def _send_message(self, payload, fds=None, block=True):
+        serialized_payload, out_of_band_buffers = self._serialize(payload)
+        open_segments = []
+        background_writer = self.background_writer
+        try:
+            if background_writer is not None and fds:
+                # The caller may close its descriptors as soon as we return, long before the writer sends them.
+                fds = [os.dup(fd if isinstance(fd, int) else fd.fileno()) for fd in fds]
+                open_segments.extend(fds)
+            frames = []
+            self._append_message_frames(frames, serialized_payload, out_of_band_buffers, fds, open_segments)
+            if background_writer is None:
+                self._send_frames(frames)
+            else:
+                background_writer.put(frames, open_segments, block)
+                # The writer closes them once they've been sent.
+                open_segments = []
+        finally:
+            # The other end holds its own descriptors for the segments from here on.
+            self._close_fds(open_segments)
+
+    def _outgoing_message(self, payload, fds=None, priority=PRIORITY_NORMAL):
+        serialized_payload, out_of_band_buffers = self._serialize(payload)
+        payload_len = serialized_length(serialized_payload)
+        multiplexer = self.channel_multiplexer
+        fragment_size = multiplexer._fragment_size()
+        # Only messages too large for a single fragment are worth splitting up.
+        if priority != PRIORITY_HIGH and not fds and not self._use_shared_memory(payload_len) and \
+                not self._use_compression(payload_len) and \
+                payload_len + sum(serialized_length(buff) for buff in out_of_band_buffers or ()) > fragment_size:
+            return OutgoingChannelMessage(None, multiplexer._message_buffers(serialized_payload, out_of_band_buffers),
+                                          fragment_size)
+        # Queued messages may be written well after send returns (by another thread, or the writer thread), by
+        # which point the caller may have closed its descriptors.
+        open_segments = []
+        try:
+            if fds:
+                fds = [os.dup(fd if isinstance(fd, int) else fd.fileno()) for fd in fds]
+                open_segments.extend(fds)
+            frames = []
+            self._append_message_frames(frames, serialized_payload, out_of_band_buffers, fds, open_segments,
+                                        FRAME_FLAG_PRIORITY if priority == PRIORITY_HIGH else 0)
+        except Exception:
+            self._close_fds(open_segments)
+            raise
+        return OutgoingFramedMessage(frames, open_segments, priority)
+
+    def _send_queued(self, payloads, fds=None, priority=PRIORITY_NORMAL):
+        multiplexer = self.channel_multiplexer
+        if self.handshake_pending:
+            multiplexer._complete_handshake()
+        messages = []
+        try:
+            for payload in payloads:
+                messages.append(self._outgoing_message(payload, fds, priority))
+        except Exception:
+            multiplexer._discard(messages)
+            raise
+        if messages:
+            multiplexer.send_messages(messages)
+        return len(messages)
+
+    def _decode_frame(self, flags, frame_body):
+        if flags & ~SUPPORTED_FRAME_FLAGS:
+            raise MessageProtocolException("Received a frame with unsupported flags: {:#04x}".format(flags))
+        fds = []
+        out_of_band_buffers = None
+        try:
+            if flags & FRAME_FLAG_FILE_DESCRIPTORS:
+                fd_count, = struct.unpack_from(FILE_DESCRIPTOR_COUNT_FORMAT, frame_body)
+                for _ in range(fd_count):
+                    fds.append(self.frame_reader.claim_fd())
+                frame_body = memoryview(frame_body)[FILE_DESCRIPTOR_COUNT_SIZE:]
+            if flags & FRAME_FLAG_OUT_OF_BAND:
+                buffer_count, = struct.unpack_from(OUT_OF_BAND_COUNT_FORMAT, frame_body)
+                frame_body = memoryview(frame_body)[OUT_OF_BAND_COUNT_SIZE:]
+                out_of_band_buffers = []
+                for _ in range(buffer_count):
+                    # Each buffer arrives as a frame of its own; ones larger than the read buffer are received
+                    # straight into their own preallocated bytearray.
+                    out_of_band_buffer, _, _ = self._read_payload()
+                    out_of_band_buffers.append(out_of_band_buffer)
+            if flags & FRAME_FLAG_SHARED_MEMORY:
+                frame_body = map_shared_memory_segment(self.frame_reader.claim_fd(),
+                                                       unpack_shared_memory_descriptor(frame_body))
+            if flags & FRAME_FLAG_COMPRESSED:
+                frame_body = self.frame_compressor.decompress(frame_body, self.max_frame_size)
+        except Exception:
+            self._close_fds(fds)
+            raise
+        return frame_body, out_of_band_buffers, fds
+
+    def _read_payload(self):
+        flags, serialized_payload = self.frame_reader.read_frame()
+        if not flags:
+            return serialized_payload, None, None
+        return self._decode_frame(flags, serialized_payload)
+
+    def _read_message(self, block=True):
+        multiplexer = self.channel_multiplexer
+        frame_reader = self.frame_reader
+        while True:
+            message = multiplexer.next_plain_message()
+            if message is not None:
+                return message
+            if multiplexer.stream_chunks:
+                raise MessageProtocolException("A stream sent with send_stream() is next; receive it with "
+                                               "recv_stream()!")
+            flags, serialized_payload = frame_reader.read_frame()
+            if not flags:
+                return self._deserialize_message(serialized_payload, None, None)
+            if not flags & FRAME_FLAG_CHANNEL:
+                return self._deserialize_message(*self._decode_frame(flags, serialized_payload))
+            multiplexer.receive_fragment(flags, serialized_payload)
+            if not (block or multiplexer.has_plain_message() or frame_reader.has_frame() or self.socket_duct.poll(0)):
+                return None
+
+    def _deserialize_message(self, serialized_payload, out_of_band_buffers, fds):
+        metrics = self.metrics
+        try:
+            if metrics is not None:
+                started = clock()
+            if self.out_of_band:
+                payload = self.deserialize(serialized_payload, out_of_band_buffers or [])
+            elif out_of_band_buffers is not None:
+                raise MessageProtocolException("Received a message with out-of-band buffers, but this duct wasn't "
+                                               "created with out_of_band=True!")
+            else:
+                payload = self.deserialize(serialized_payload)
+            if metrics is not None:
+                metrics.deserialize_time.record(clock() - started)
+                metrics.messages_received += 1
+            return payload, fds
+        except Exception:
+            if fds:
+                self._close_fds(fds)
+            raise
+
+    @staticmethod
+    def _close_fds(fds):
+        for fd in fds:
+            os.close(fd)
+
+    def send(self, payload, priority=PRIORITY_NORMAL):
+        """
+        Send a payload to the other end, if connected. PRIORITY_HIGH payloads are written ahead of anything else
+        still waiting to be sent (by other threads, on channels, or in the write queue), and the other end can
+        poll() for them on their own.
+
+        :param payload: A serializable Python object to send to the other duct.
+        :param priority: PRIORITY_NORMAL or PRIORITY_HIGH. Default: PRIORITY_NORMAL
+        :type priority: int
+        :return: None
+        :rtype: NoneType
+        """
+        if priority == PRIORITY_HIGH or self.priority_lanes:
+            self._send_queued([payload], priority=priority)
+            return
+        send_lock = self.send_lock
+        try:
+            if send_lock:
+                self._acquire(send_lock)
+            if self.handshake_pending:
+                self._complete_handshake_for_send()
+            self._send_message(payload)
+        finally:
+            if send_lock:
+                send_lock.release()
+
+    def send_nowait(self, payload):
+        """
+        Queue a payload to be sent to the other end by the writer thread, without ever waiting for room in the
+        queue. Only for ducts created with a write_queue_size.
+
+        A WriteQueueFull exception is raised if the queue is full (unless the duct's write_queue_policy is
+        WRITE_QUEUE_DROP_OLDEST, in which case the oldest queued message is thrown away instead).
+
+        :param payload: A serializable Python object to send to the other duct.
+        :return: None
+        :rtype: NoneType
+        """
+        if self.background_writer is None:
+            raise MessageProtocolException("send_nowait() needs a duct created with a write_queue_size!")
+        send_lock = self.send_lock
+        try:
+            if send_lock:
+                self._acquire(send_lock)
+            if self.handshake_pending:
+                self._complete_handshake_for_send()
+            self._send_message(payload, block=False)
+        finally:
+            if send_lock:
+                send_lock.release()
+
+    def flush(self, timeout=None):
+        """
+        Wait for every message queued so far to be written to the socket. Ducts without a write queue have nothing
+        to flush, since their sends write straight to the socket.
+
+        :param timeout: The longest to wait, in seconds. If None, wait as long as it takes. Default: None
+        :type timeout: float | int | None
+        :return: True if everything was written, False if the timeout ran out first.
+        :rtype: bool
+        """
+        if self.background_writer is None:
+            return True
+        return self.background_writer.flush(timeout)
+
+    def send_fds(self, payload, fds, priority=PRIORITY_NORMAL):
+        """
+        Send a payload to the other end along with a list of open file descriptors, such as files, sockets, or
+        memfds. The other end receives its own duplicates of the descriptors with recv_fds(), and the caller may
+        close its copies as soon as send_fds() returns. Only works over Unix Domain sockets, and the other end must
+        have been created with receive_fds=True.
+
+        :param payload: A serializable Python object to send to the other duct.
+        :param fds: The file descriptors to send, as integers or objects with a fileno() method. At most 253.
+        :type fds: list | tuple
+        :param priority: PRIORITY_NORMAL or PRIORITY_HIGH, as for send(). Default: PRIORITY_NORMAL
+        :type priority: int
+        :return: None
+        :rtype: NoneType
+        """
+        if priority == PRIORITY_HIGH or self.priority_lanes:
+            self._send_queued([payload], fds, priority)
+            return
+        send_lock = self.send_lock
+        try:
+            if send_lock:
+                self._acquire(send_lock)
+            if self.handshake_pending:
+                self._complete_handshake_for_send()
+            self._send_message(payload, fds)
+        finally:
+            if send_lock:
+                send_lock.release()
+
+    def recv(self):
+        """
+        Receive a payload from the other end, if connected and data is present. If the payload was sent with file
+        descriptors, they are closed; use recv_fds() to keep them.
+
+        :return: A deserialized Python object from the other end of the duct.
+        """
+        recv_lock = self.recv_lock
+        try:
+            if recv_lock:
+                self._acquire(recv_lock)
+            if self.handshake_pending:
+                self._complete_handshake()
+            payload, fds = self._read_message()
+            if fds:
+                self._close_fds(fds)
+            return payload
+        finally:
+            if recv_lock:
+                self._release_recv_lock()
+
+    def recv_fds(self):
+        """
+        Receive a payload from the other end along with any file descriptors sent with it by send_fds(). The
+        caller owns the returned descriptors and must close them (for instance with os.close, or by wrapping them
+        with os.fdopen or socket.socket(fileno=...)).
+
+        :return: The deserialized Python object from the other end of the duct, and a list of the file descriptors
+            sent with it (empty if it was sent with plain send()).
+        :rtype: (object, list)
+        """
+        recv_lock = self.recv_lock
+        try:
+            if recv_lock:
+                self._acquire(recv_lock)
+            if self.handshake_pending:
+                self._complete_handshake()
+            payload, fds = self._read_message()
+            return payload, fds or []
+        finally:
+            if recv_lock:
+                self._release_recv_lock()
+
+    def send_many(self, payloads):
+        """
+        Send a batch of payloads to the other end, if connected. Every payload is framed exactly as send() would
+        frame it (so the other end may receive them with recv() one at a time), but the whole batch is written with
+        as few syscalls as possible while holding the lock once.
+
+        :param payloads: An iterable of serializable Python objects to send to the other duct.
+        :return: The number of payloads sent.
+        :rtype: int
+        """
+        if self.priority_lanes:
+            return self._send_queued(payloads)
+        send_lock = self.send_lock
+        open_segments = []
+        try:
+            if send_lock:
+                self._acquire(send_lock)
+            if self.handshake_pending:
+                self._complete_handshake_for_send()
+            num_sent = 0
+            if self.background_writer is not None:
+                # Queued one by one, so the queue's limit and policy apply to each message.
+                for payload in payloads:
+                    self._send_message(payload)
+                    num_sent += 1
+                return num_sent
+            frames = []
+            for payload in payloads:
+                serialized_payload, out_of_band_buffers = self._serialize(payload)
+                self._append_message_frames(frames, serialized_payload, out_of_band_buffers, None, open_segments)
+                num_sent += 1
+            self._send_frames(frames)
+            return num_sent
+        finally:
+            self._close_fds(open_segments)
+            if send_lock:
+                send_lock.release()
+
+    def recv_many(self, max_count=None, timeout=0):
+        """
+        Receive every payload that is already available from the other end, without blocking for more. If nothing
+        is available, wait up to timeout seconds for a first message to arrive.
+
+        :param max_count: The maximum number of payloads to return. If None, there is no limit. Default: None
+        :type max_count: int | None
+        :param timeout: The amount of time to wait for a first message if none is present. If 0, recv_many() does
+            not block. Default: 0
+        :type timeout: int | float
+        :return: A list of deserialized Python objects from the other end of the duct; empty if none arrived.
+        :rtype: list
+        """
+        received_payloads = []
+        if not self.poll(timeout):
+            return received_payloads
+        recv_lock = self.recv_lock
+        try:
+            if recv_lock:
+                self._acquire(recv_lock)
+            frame_reader = self.frame_reader
+            multiplexer = self.channel_multiplexer
+            while max_count is None or len(received_payloads) < max_count:
+                if received_payloads and not (multiplexer.has_plain_message() or frame_reader.has_frame() or
+                                              self.socket_duct.poll(0)):
+                    break
+                # Don't block if all that was left were frames for channels.
+                message = self._read_message(block=False)
+                if message is None:
+                    break
+                payload, fds = message
+                if fds:
+                    self._close_fds(fds)
+                received_payloads.append(payload)
+            return received_payloads
+        finally:
+            if recv_lock:
+                self._release_recv_lock()
+
+    def send_stream(self, chunks):
+        """
+        Send a stream of raw bytes to the other end, to be received with recv_stream(). The chunks are pulled from
+        the iterable one at a time, and each is written out (in fragments of at most channel_fragment_size bytes)
+        before the next is pulled, so a stream of any length, such as a file read a few megabytes at a time, is sent
+        without ever holding more than one chunk in memory. Other messages may be sent in between the fragments,
+        by other threads or on channels; streams sent by several threads at once are sent one after the other.
+
+        Each chunk must be left unchanged until the next one is pulled. If iterating the chunks raises an exception,
+        the other end's recv_stream() raises a MessageProtocolException, and the exception is raised here.
+
+        :param chunks: An iterable of bytes-like objects.
+        :type chunks: iterable
+        :return: The number of bytes sent.
+        :rtype: int
+        """
+        return self.channel_multiplexer.send_stream(chunks)
+
+    def recv_stream(self):
+        """
+        Receive a stream sent with send_stream() by the other end, as an iterator over its chunks. Chunks are
+        handed out as they arrive, as memoryviews of at most the sender's channel_fragment_size bytes (however large
+        the chunks it sent were), so a stream of any length is received without holding more than one chunk in
+        memory. Messages sent with send() that arrive before or during the stream are kept for recv(), and recv()
+        raises a MessageProtocolException while a stream is next.
+
+        The iterator raises a MessageProtocolException if the other end aborted the stream partway.
+
+        :return: An iterator over the chunks of the stream.
+        :rtype: generator
+        """
+        while True:
+            chunk, fragment_flags = self._read_stream_chunk()
+            if fragment_flags & CHANNEL_FRAGMENT_ABORT:
+                raise MessageProtocolException("The other end aborted the stream!")
+            if chunk:
+                yield chunk
+            if not fragment_flags & CHANNEL_FRAGMENT_MORE:
+                return
+
+    def _read_stream_chunk(self):
+        multiplexer = self.channel_multiplexer
+        recv_lock = self.recv_lock
+        try:
+            if recv_lock:
+                self._acquire(recv_lock)
+            if self.handshake_pending:
+                self._complete_handshake()
+            while True:
+                stream_chunk = multiplexer.next_stream_chunk()
+                if stream_chunk is not None:
+                    return stream_chunk
+                flags, serialized_payload = self.frame_reader.read_frame()
+                if flags & FRAME_FLAG_CHANNEL:
+                    multiplexer.receive_fragment(flags, serialized_payload)
+                    continue
+                decoded_frame = (serialized_payload, None, None) if not flags else \
+                    self._decode_frame(flags, serialized_payload)
+                multiplexer._queue_plain_message(flags, self._deserialize_message(*decoded_frame))
+        finally:
+            if recv_lock:
+                self._release_recv_lock()
+
+    def channel(self, channel_id):
+        """
+        Get a logical channel of this duct. Each channel has its own queue of received messages, and messages sent
+        on a channel are only received by the channel with the same id at the other end (never by recv()), so
+        several independent streams of messages can share one connection. Messages are split into fragments of at
+        most channel_fragment_size bytes, and the fragments of messages on different channels are interleaved, so
+        a large message on one channel doesn't hold up small ones on the others.
+
+        Channel messages can't carry file descriptors, and are never sent through shared memory or compressed.
+
+        :param channel_id: The channel's id, from 0 to 65535.
+        :type channel_id: int
+        :return: The channel.
+        :rtype: DuctChannel
+        """
+        if not 0 <= channel_id <= MAX_CHANNEL_ID:
+            raise ValueError("Channel ids must be from 0 to {}, not {}!".format(MAX_CHANNEL_ID, channel_id))
+        return DuctChannel(self.channel_multiplexer, channel_id)
 
+    def close(self):
+        """
+        Close the underlying socket duct, and release any shared memory segments received but never read. If the
+        duct has a write queue, everything already queued is written out first.
+        :return: None
+        """
+        if self.background_writer is not None:
+            self.background_writer.close()
+        self.socket_duct.close()
+        self.frame_reader.close()
+        if self.owns_metrics:
+            DEFAULT_METRICS_REGISTRY.unregister(self.metrics)
 
-default_serializer = serializer_with_encoder_constructor(json.dumps)
-default_deserializer = deserializer_with_decoder_constructor(json.loads)
+    def __del__(self):
+        self.close()
 
 
-class MessageDuctParent(object):
+class MessageDuctParent(BaseMessageDuct):
     """
     The MessageDuctParent is an abstraction over the SocketDuctParent and provides an interface compatible
     with Python's multiprocessing.Connection (created by multiprocessing.Pipe). The Message Duct, much like
@@ -86,7 +1105,8 @@ class MessageDuctParent(object):
     as using the anonymous POSIX thread locking (threading.Lock) to eliminate race conditions when the duct is shared
     between competing threads, to using multiprocessing.Lock, a wrapper around flock(2), or a named POSIX locks library
     to synchronize access between local processes. It is even conceivable to bolt-in distributed lock systems, like
-    etcd.
+    etcd. Since one process may otherwise buffer up part of a message another process then reads, ducts given a lock
+    don't read ahead unless given a recv_buffer_size; ducts only ever shared between threads can safely be given one.
 
     Finally, the Message Duct retains the full power of the underlying Socket Duct to pick and choose the connection
     constructor and destructor, which means that both TCP and stream-oriented Unix Domain Sockets are provided and
@@ -98,11 +1118,10 @@ class MessageDuctParent(object):
     to begin communication.
     """
 
-    def __init__(self, socket_duct, serialize=default_serializer, deserialize=default_deserializer, lock=None):
-        self.socket_duct = socket_duct
-        self.serialize = serialize
-        self.deserialize = deserialize
-        self.lock = lock
+    leads_handshake = True
+
+    def _is_connected(self):
+        return self.socket_duct.conn_socket is not None
 
     @property
     def bind_address(self):
@@ -125,47 +1144,51 @@ class MessageDuctParent(object):
         """
         return self.socket_duct.listener_address
 
-    def fileno(self):
-        """
-        Get the file descriptor for the connection socket in the socket duct.
-        This is useful for integrating into other event loops.
-
-        :return: The connection file descriptor.
-        :rtype: int
-        """
-        return self.socket_duct.fileno()
-
     @classmethod
     def psuedo_anonymous_parent_duct(cls, bind_address=None, serialize=default_serializer,
                                      deserialize=default_deserializer, lock=None,
-                                     timeout=RawDuctParent.DEFAULT_TIMEOUT):
+                                     timeout=RawDuctParent.DEFAULT_TIMEOUT,
+                                     recv_buffer_size=None, abstract_namespace=False,
+                                     **kwargs):
         """
         Create a new psuedo-anonymous parent message duct with Unix Domain sockets.
 
         :param bind_address: The (filesystem) address to listen on, if any. If None a new random address will be
             chosen. Default: None.
         :type bind_address: basestring | None
+        :param abstract_namespace: If True and no bind address is given, pick a random address in the Linux
+            abstract namespace instead of the filesystem, so binding and connecting never touch the disk. Other
+            platforms fall back to a filesystem address. Default: False
+        :type abstract_namespace: bool
         :param serialize: The serialization function for sending messages. Default: Encoded JSON.
         :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
-        :param lock: A lock object to lock send/recv calls.
+        :param lock: A lock object to lock send calls, alongside a new lock of the same kind for recv calls (see
+            lock_like), or a (send lock, recv lock) pair.
         :param timeout: The number of seconds to block a send/recv call waiting for completion.
         :type timeout: int | float
+        :param recv_buffer_size: The size of the read-ahead buffer used to receive messages, or 0 to never read
+            past the message being received. Default: 64 KiB, or 0 if a lock is given.
+        :type recv_buffer_size: int | None
+        :param kwargs: Any other arguments to give to the message duct constructor, such as shared_memory_threshold.
         :return: A new MessageDuctParent.
         :rtype: ductworks.message_duct.MessageDuctParent
         """
-        if bind_address is None:
+        if bind_address is None and abstract_namespace and ABSTRACT_NAMESPACE_SUPPORTED:
+            bind_address = random_abstract_namespace_address()
+        elif bind_address is None:
             tmp = NamedTemporaryFile()
             bind_address = tmp.name
             tmp.close()
         return cls(
             RawDuctParent(bind_address=bind_address, timeout=timeout),
-            serialize=serialize, deserialize=deserialize, lock=lock
+            serialize=serialize, deserialize=deserialize, lock=lock, recv_buffer_size=recv_buffer_size, **kwargs
         )
 
     @classmethod
     def psuedo_anonymous_tcp_parent_duct(cls, bind_address='localhost', bind_port=0, serialize=default_serializer,
                                          deserialize=default_deserializer, lock=None,
-                                         timeout=RawDuctParent.DEFAULT_TIMEOUT):
+                                         timeout=RawDuctParent.DEFAULT_TIMEOUT,
+                                         recv_buffer_size=None, **kwargs):
         """
         Create a new psuedo-anonymous parent message duct with TCP sockets.
 
@@ -175,9 +1198,14 @@ class MessageDuctParent(object):
         :type bind_port: int
         :param serialize: The serialization function for sending messages. Default: Encoded JSON.
         :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
-        :param lock: A lock object to lock send/recv calls.
+        :param lock: A lock object to lock send calls, alongside a new lock of the same kind for recv calls (see
+            lock_like), or a (send lock, recv lock) pair.
         :param timeout: The number of seconds to block a send/recv call waiting for completion.
         :type timeout: int | float
+        :param recv_buffer_size: The size of the read-ahead buffer used to receive messages, or 0 to never read
+            past the message being received. Default: 64 KiB, or 0 if a lock is given.
+        :type recv_buffer_size: int | None
+        :param kwargs: Any other arguments to give to the message duct constructor, such as shared_memory_threshold.
         :return: A new MessageDuctParent.
         :rtype: ductworks.message_duct.MessageDuctParent
         """
@@ -189,7 +1217,52 @@ class MessageDuctParent(object):
                 server_listener_socket_destructor=tcp_socket_listener_destructor,
                 timeout=timeout
             ),
-            serialize=serialize, deserialize=deserialize, lock=lock
+            serialize=serialize, deserialize=deserialize, lock=lock, recv_buffer_size=recv_buffer_size, **kwargs
+        )
+
+    @classmethod
+    def psuedo_anonymous_seqpacket_parent_duct(cls, bind_address=None, serialize=default_serializer,
+                                               deserialize=default_deserializer, lock=None,
+                                               timeout=RawDuctParent.DEFAULT_TIMEOUT,
+                                               packet_size=PacketFrameReader.DEFAULT_PACKET_SIZE,
+                                               abstract_namespace=False, **kwargs):
+        """
+        Create a new psuedo-anonymous parent message duct with Unix Domain sequenced-packet (SOCK_SEQPACKET)
+        sockets. Each message that fits in a single packet is sent and received with one syscall apiece. The child
+        must be created with psuedo_anonymous_seqpacket_child_duct and the same packet size.
+
+        :param bind_address: The (filesystem) address to listen on, if any. If None a new random address will be
+            chosen. Default: None.
+        :type bind_address: basestring | None
+        :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+        :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
+        :param lock: A lock object to lock send calls, alongside a new lock of the same kind for recv calls (see
+            lock_like), or a (send lock, recv lock) pair.
+        :param timeout: The number of seconds to block a send/recv call waiting for completion.
+        :type timeout: int | float
+        :param packet_size: The largest packet to send; larger messages are split across packets. Default: 64 KiB.
+        :type packet_size: int
+        :param abstract_namespace: If True and no bind address is given, pick a random address in the Linux
+            abstract namespace instead of the filesystem. Default: False
+        :type abstract_namespace: bool
+        :param kwargs: Any other arguments to give to the message duct constructor, such as shared_memory_threshold.
+        :return: A new MessageDuctParent.
+        :rtype: ductworks.message_duct.MessageDuctParent
+        """
+        if bind_address is None and abstract_namespace and ABSTRACT_NAMESPACE_SUPPORTED:
+            bind_address = random_abstract_namespace_address()
+        elif bind_address is None:
+            tmp = NamedTemporaryFile()
+            bind_address = tmp.name
+            tmp.close()
+        return cls(
+            RawDuctParent(
+                bind_address=bind_address,
+                server_listener_socket_constructor=unix_domain_seqpacket_socket_constructor,
+                server_listener_socket_destructor=unix_domain_seqpacket_socket_listener_destructor,
+                timeout=timeout
+            ),
+            serialize=serialize, deserialize=deserialize, lock=lock, packet_size=packet_size, **kwargs
         )
 
     def bind(self):
@@ -202,124 +1275,36 @@ class MessageDuctParent(object):
 
     def listen(self):
         """
-        Listen on the underyling socket duct.
-        :return: None
-        :rtype: NoneType
-        """
-        return self.socket_duct.listen()
-
-    def poll(self, timeout=60):
-        """
-        Poll the underlying socket duct to check for new messages.
-        :param timeout: The amount of time to wait for a new message, if none is present. Default: 60 seconds.
-        :type timeout: int
-        :return: True if a message is waiting, False otherwise.
-        :rtype: bool
-        """
-        return self.socket_duct.poll(timeout)
-
-    def send(self, payload):
-        """
-        Send a payload to the other end, if connected.
-
-        :param payload: A serializable Python object to send to the other duct.
+        Listen on the underyling socket duct, and send the handshake if enabled.
         :return: None
         :rtype: NoneType
         """
-        send_lock = self.lock
-        try:
-            if send_lock:
-                send_lock.acquire()
-            serialized_payload = self.serialize(payload)
-            payload_len = len(serialized_payload)
-            full_message = bytearray(struct.pack('!cL', MAGIC_BYTE, payload_len))
-            full_message.extend(serialized_payload)
-            full_message_view = memoryview(full_message)
-            while full_message_view:
-                bytes_sent = self.socket_duct.send(full_message_view)
-                full_message_view = full_message_view[bytes_sent:]
-        finally:
-            if send_lock:
-                send_lock.release()
-
-    def recv(self):
-        """
-        Receive a payload from the other end, if connected and data is present.
-
-        :return: A deserialized Python object from the other end of the duct.
-        """
-        recv_lock = self.lock
-        try:
-            if recv_lock:
-                recv_lock.acquire()
-            leading_byte = self.socket_duct.recv(1)
-            if not leading_byte:
-                raise RemoteDuctClosed("Remote duct closed.")
-            elif leading_byte != MAGIC_BYTE:
-                raise MessageProtocolException("Invalid magic byte at message envelope head! Expected: {}, got: {}"
-                                               "".format(hexlify(MAGIC_BYTE), hexlify(leading_byte)))
-            raw_payload_len = bytearray(struct.calcsize('!L'))
-            raw_payload_len_view = memoryview(raw_payload_len)
-            while raw_payload_len_view:
-                num_bytes_received = self.socket_duct.recv_into(raw_payload_len_view)
-                if num_bytes_received == 0:
-                    raise RemoteDuctClosed("Remote duct closed mid-message!")
-                raw_payload_len_view = raw_payload_len_view[num_bytes_received:]
-            incoming_payload_len, = struct.unpack('!L', bytes(raw_payload_len))
-            serialized_payload = bytearray(incoming_payload_len)
-            serialized_payload_view = memoryview(serialized_payload)
-            while serialized_payload_view:
-                num_bytes_received = self.socket_duct.recv_into(serialized_payload_view)
-                if num_bytes_received == 0:
-                    raise RemoteDuctClosed("Remote duct closed mid-message!")
-                serialized_payload_view = serialized_payload_view[num_bytes_received:]
-            return self.deserialize(serialized_payload)
-        finally:
-            if recv_lock:
-                recv_lock.release()
-
-    def close(self):
-        """
-        Close the underlying socket duct.
-        :return: None
-        """
-        self.socket_duct.close()
-
-    def __del__(self):
-        self.close()
+        listening = self.socket_duct.listen()
+        if self.handshake and self._is_connected():
+            self._send_hello()
+        return listening
 
 
-class MessageDuctChild(object):
+class MessageDuctChild(BaseMessageDuct):
     """
     The MessageDuctChild is an abstraction over the SocketDuctChild and provides an interface compatible
     with Python's multiprocessing.Connection (created by multiprocessing.Pipe).
 
     This side must connect to a listening MessageDuctParent in order to begin communication.
     """
-    def __init__(self, socket_duct, serialize=default_serializer, deserialize=default_deserializer, lock=None):
-        self.socket_duct = socket_duct
-        self.serialize = serialize
-        self.deserialize = deserialize
-        self.lock = lock
 
     @property
     def connect_address(self):
         return self.socket_duct.connect_address
 
-    def fileno(self):
-        """
-        Get the file descriptor for the connection socket in the socket duct.
-        This is useful for integrating into other event loops.
-
-        :return: The connection file descriptor.
-        :rtype: int
-        """
-        return self.socket_duct.fileno()
+    def _is_connected(self):
+        return self.socket_duct.socket is not None
 
     @classmethod
     def psuedo_anonymous_child_duct(cls, connect_address, serialize=default_serializer,
                                     deserialize=default_deserializer, lock=None,
-                                    timeout=RawDuctChild.DEFAULT_TIMEOUT):
+                                    timeout=RawDuctChild.DEFAULT_TIMEOUT,
+                                    recv_buffer_size=None, **kwargs):
         """
         Create a new psuedo-anonymous child message duct with Unix Domain sockets. The connect_address parameter
         should be sourced from the parent duct by getting its listener_address property.
@@ -328,9 +1313,14 @@ class MessageDuctChild(object):
         :type connect_address: basestring
         :param serialize: The serialization function for sending messages. Default: Encoded JSON.
         :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
-        :param lock: A lock object to lock send/recv calls.
+        :param lock: A lock object to lock send calls, alongside a new lock of the same kind for recv calls (see
+            lock_like), or a (send lock, recv lock) pair.
         :param timeout: The number of seconds to block a send/recv call waiting for completion.
         :type timeout: int | float
+        :param recv_buffer_size: The size of the read-ahead buffer used to receive messages, or 0 to never read
+            past the message being received. Default: 64 KiB, or 0 if a lock is given.
+        :type recv_buffer_size: int | None
+        :param kwargs: Any other arguments to give to the message duct constructor, such as shared_memory_threshold.
         :return: A new MessageParentDuct.
         :rtype: ductworks.message_duct.MessageDuctChild
         """
@@ -338,13 +1328,14 @@ class MessageDuctChild(object):
             RawDuctChild(
                 connect_address, timeout=timeout
             ),
-            serialize=serialize, deserialize=deserialize, lock=lock
+            serialize=serialize, deserialize=deserialize, lock=lock, recv_buffer_size=recv_buffer_size, **kwargs
         )
 
     @classmethod
     def psuedo_anonymous_tcp_child_duct(cls, connect_address, connect_port, serialize=default_serializer,
                                         deserialize=default_deserializer, lock=None,
-                                        timeout=RawDuctChild.DEFAULT_TIMEOUT):
+                                        timeout=RawDuctChild.DEFAULT_TIMEOUT,
+                                        recv_buffer_size=None, **kwargs):
         """
         Create a new psuedo-anonymous child message duct with Unix Domain sockets. The connect_address and
         connect_port parameters should be sourced from the parent duct by getting its listener_address property.
@@ -355,9 +1346,14 @@ class MessageDuctChild(object):
         :type connect_port: int
         :param serialize: The serialization function for sending messages. Default: Encoded JSON.
         :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
-        :param lock: A lock object to lock send/recv calls.
+        :param lock: A lock object to lock send calls, alongside a new lock of the same kind for recv calls (see
+            lock_like), or a (send lock, recv lock) pair.
         :param timeout: The number of seconds to block a send/recv call waiting for completion.
         :type timeout: int | float
+        :param recv_buffer_size: The size of the read-ahead buffer used to receive messages, or 0 to never read
+            past the message being received. Default: 64 KiB, or 0 if a lock is given.
+        :type recv_buffer_size: int | None
+        :param kwargs: Any other arguments to give to the message duct constructor, such as shared_memory_threshold.
         :return: A new MessageParentDuct.
         :rtype: ductworks.message_duct.MessageDuctChild
         """
@@ -368,98 +1364,87 @@ class MessageDuctChild(object):
                 socket_constructor=tcp_socket_constructor,
                 timeout=timeout
             ),
-            serialize=serialize, deserialize=deserialize, lock=lock
+            serialize=serialize, deserialize=deserialize, lock=lock, recv_buffer_size=recv_buffer_size, **kwargs
         )
 
-    def connect(self):
-        """
-        Call connect() on the underlying socket duct.
-        :return: None
-        """
-        return self.socket_duct.connect()
-
-    def poll(self, timeout=60):
-        """
-        Poll the underlying socket duct to check for new messages.
-        :param timeout: The amount of time to wait for a new message, if none is present. Default: 60 seconds.
-        :type timeout: int
-        :return: True if a message is waiting, False otherwise.
-        :rtype: bool
-        """
-        return self.socket_duct.poll(timeout)
-
-    def send(self, payload):
+    @classmethod
+    def psuedo_anonymous_seqpacket_child_duct(cls, connect_address, serialize=default_serializer,
+                                              deserialize=default_deserializer, lock=None,
+                                              timeout=RawDuctChild.DEFAULT_TIMEOUT,
+                                              packet_size=PacketFrameReader.DEFAULT_PACKET_SIZE, **kwargs):
         """
-        Send a payload to the other end, if connected.
+        Create a new psuedo-anonymous child message duct with Unix Domain sequenced-packet (SOCK_SEQPACKET)
+        sockets, to connect to a parent made with psuedo_anonymous_seqpacket_parent_duct.
 
-        :param payload: A serializable Python object to send to the other duct.
-        :return: None
+        :param connect_address: The filesystem address to connect to. Get this from parent_duct.listener_address.
+        :type connect_address: basestring
+        :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+        :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
+        :param lock: A lock object to lock send calls, alongside a new lock of the same kind for recv calls (see
+            lock_like), or a (send lock, recv lock) pair.
+        :param timeout: The number of seconds to block a send/recv call waiting for completion.
+        :type timeout: int | float
+        :param packet_size: The largest packet to send; larger messages are split across packets. Must match the
+            parent's packet size. Default: 64 KiB.
+        :type packet_size: int
+        :param kwargs: Any other arguments to give to the message duct constructor, such as shared_memory_threshold.
+        :return: A new MessageDuctChild.
+        :rtype: ductworks.message_duct.MessageDuctChild
         """
-        send_lock = self.lock
-        try:
-            if send_lock:
-                send_lock.acquire()
-            serialized_payload = self.serialize(payload)
-            payload_len = len(serialized_payload)
-            full_message = bytearray(struct.pack('!cL', MAGIC_BYTE, payload_len))
-            full_message.extend(serialized_payload)
-            full_message_view = memoryview(full_message)
-            while full_message_view:
-                bytes_sent = self.socket_duct.send(full_message_view)
-                full_message_view = full_message_view[bytes_sent:]
-        finally:
-            if send_lock:
-                send_lock.release()
+        return cls(
+            RawDuctChild(
+                connect_address,
+                socket_constructor=unix_domain_seqpacket_socket_constructor,
+                timeout=timeout
+            ),
+            serialize=serialize, deserialize=deserialize, lock=lock, packet_size=packet_size, **kwargs
+        )
 
-    def recv(self):
+    @classmethod
+    def from_inherited_fd(cls, fd=None, serialize=default_serializer, deserialize=default_deserializer, lock=None,
+                          timeout=RawDuctChild.DEFAULT_TIMEOUT, recv_buffer_size=None,
+                          **kwargs):
         """
-        Receive a payload from the other end, if connected and data is present.
+        Create an already connected child message duct from a socket file descriptor inherited from the parent
+        process, as set up by spawn_with_duct(). No connect() call is needed.
 
-        :return: A deserialized Python object from the other end of the duct.
+        :param fd: The inherited socket file descriptor. If None, it is read from the environment variable named by
+            DUCT_FD_ENVIRONMENT_VARIABLE. Default: None
+        :type fd: int | None
+        :param serialize: The serialization function for sending messages. Default: Encoded JSON.
+        :param deserialize: The deserialization function for sending messages. Default: Encoded JSON.
+        :param lock: A lock object to lock send calls, alongside a new lock of the same kind for recv calls (see
+            lock_like), or a (send lock, recv lock) pair.
+        :param timeout: The number of seconds to block a send/recv call waiting for completion.
+        :type timeout: int | float
+        :param recv_buffer_size: The size of the read-ahead buffer used to receive messages, or 0 to never read
+            past the message being received. Default: 64 KiB, or 0 if a lock is given.
+        :type recv_buffer_size: int | None
+        :param kwargs: Any other arguments to give to the message duct constructor, such as shared_memory_threshold.
+        :return: A new, connected MessageDuctChild.
+        :rtype: ductworks.message_duct.MessageDuctChild
         """
-        recv_lock = self.lock
-        try:
-            if recv_lock:
-                recv_lock.acquire()
-            leading_byte = self.socket_duct.recv(1)
-            if not leading_byte:
-                raise RemoteDuctClosed("Remote duct closed.")
-            elif leading_byte != MAGIC_BYTE:
-                raise MessageProtocolException("Invalid magic byte at message envelope head! Expected: {}, got: {}"
-                                               "".format(hexlify(MAGIC_BYTE), hexlify(leading_byte)))
-            raw_payload_len = bytearray(struct.calcsize('!L'))
-            raw_payload_len_view = memoryview(raw_payload_len)
-            while raw_payload_len_view:
-                num_bytes_received = self.socket_duct.recv_into(raw_payload_len_view)
-                if num_bytes_received == 0:
-                    raise RemoteDuctClosed("Remote duct closed mid-message!")
-                raw_payload_len_view = raw_payload_len_view[num_bytes_received:]
-            incoming_payload_len, = struct.unpack('!L', bytes(raw_payload_len))
-            serialized_payload = bytearray(incoming_payload_len)
-            serialized_payload_view = memoryview(serialized_payload)
-            while serialized_payload_view:
-                num_bytes_received = self.socket_duct.recv_into(serialized_payload_view)
-                if num_bytes_received == 0:
-                    raise RemoteDuctClosed("Remote duct closed mid-message!")
-                serialized_payload_view = serialized_payload_view[num_bytes_received:]
-            return self.deserialize(serialized_payload)
-        finally:
-            if recv_lock:
-                recv_lock.release()
+        if fd is None:
+            fd = int(os.environ[DUCT_FD_ENVIRONMENT_VARIABLE])
+        return cls(
+            RawDuctChild.from_connected_socket(socket.socket(fileno=fd), timeout=timeout),
+            serialize=serialize, deserialize=deserialize, lock=lock, recv_buffer_size=recv_buffer_size, **kwargs
+        )
 
-    def close(self):
+    def connect(self):
         """
-        Close the underlying socket duct.
+        Call connect() on the underlying socket duct, and send the handshake if enabled.
         :return: None
         """
-        self.socket_duct.close()
-
-    def __del__(self):
-        self.close()
+        connected = self.socket_duct.connect()
+        if self.handshake:
+            self._send_hello()
+        return connected
 
 
 def create_psuedo_anonymous_duct_pair(serialize=default_serializer, deserialize=default_deserializer,
-                                      parent_lock=None, child_lock=None):
+                                      parent_lock=None, child_lock=None,
+                                      recv_buffer_size=None, **kwargs):
     """
     Create an already connected pair of anonymous ducts. This is very similar to how multiprocess.Pipe(True) functions.
 
@@ -467,18 +1452,182 @@ def create_psuedo_anonymous_duct_pair(serialize=default_serializer, deserialize=
     :param deserialize: The deserializer funtion for the pair. Defaults to encoded JSON.
     :param parent_lock: An optional lock object to give to the "parent" duct.
     :param child_lock: An optional lock object to give to the "child" duct.
+    :param recv_buffer_size: The size of the read-ahead buffer used by each duct to receive messages. Default: 64 KiB,
+        or 0 for a duct given a lock.
+    :param kwargs: Any other arguments to give to the constructor of both message ducts, such as
+        shared_memory_threshold.
     :return: A parent/child pair of ducts.
     :rtype: (ductworks.message_duct.MessageDuctParent, ductworks.message_duct.MesssageDuctChild)
     """
 
     parent = MessageDuctParent.psuedo_anonymous_parent_duct(
-        serialize=serialize, deserialize=deserialize, lock=parent_lock
+        serialize=serialize, deserialize=deserialize, lock=parent_lock, recv_buffer_size=recv_buffer_size, **kwargs
     )
     parent.bind()
     listener_address = parent.listener_address
     child = MessageDuctChild.psuedo_anonymous_child_duct(
-        listener_address, serialize=serialize, deserialize=deserialize, lock=child_lock
+        listener_address, serialize=serialize, deserialize=deserialize, lock=child_lock,
+        recv_buffer_size=recv_buffer_size, **kwargs
     )
     child.connect()
     parent.listen()
     return parent, child
+
+
+def create_anonymous_duct_pair(serialize=default_serializer, deserialize=default_deserializer,
+                               parent_lock=None, child_lock=None, recv_buffer_size=None,
+                               timeout=RawDuctParent.DEFAULT_TIMEOUT, **kwargs):
+    """
+    Create an already connected pair of truly anonymous ducts from a single socket.socketpair() call. Unlike
+    create_psuedo_anonymous_duct_pair, there is no listener, no filesystem address, and no connect/accept round
+    trip, which makes this the fastest way to build a duct pair that will be shared by fork(2) or handed to a
+    child process as an inherited file descriptor.
+
+    :param serialize: The serializer function for the pair. Defaults to encoded JSON.
+    :param deserialize: The deserializer funtion for the pair. Defaults to encoded JSON.
+    :param parent_lock: An optional lock object to give to the "parent" duct.
+    :param child_lock: An optional lock object to give to the "child" duct.
+    :param recv_buffer_size: The size of the read-ahead buffer used by each duct to receive messages. Default: 64 KiB,
+        or 0 for a duct given a lock.
+    :param timeout: The number of seconds to block a send/recv call waiting for completion.
+    :type timeout: int | float
+    :param kwargs: Any other arguments to give to the constructor of both message ducts, such as
+        shared_memory_threshold.
+    :return: A parent/child pair of ducts.
+    :rtype: (ductworks.message_duct.MessageDuctParent, ductworks.message_duct.MesssageDuctChild)
+    """
+    parent_socket, child_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    parent = MessageDuctParent(
+        RawDuctParent.from_connected_socket(parent_socket, timeout=timeout),
+        serialize=serialize, deserialize=deserialize, lock=parent_lock, recv_buffer_size=recv_buffer_size, **kwargs
+    )
+    child = MessageDuctChild(
+        RawDuctChild.from_connected_socket(child_socket, timeout=timeout),
+        serialize=serialize, deserialize=deserialize, lock=child_lock, recv_buffer_size=recv_buffer_size, **kwargs
+    )
+    return parent, child
+
+
+def create_anonymous_seqpacket_duct_pair(serialize=default_serializer, deserialize=default_deserializer,
+                                         parent_lock=None, child_lock=None,
+                                         packet_size=PacketFrameReader.DEFAULT_PACKET_SIZE,
+                                         timeout=RawDuctParent.DEFAULT_TIMEOUT, **kwargs):
+    """
+    Create an already connected pair of anonymous ducts over a SOCK_SEQPACKET socket pair, so that each message
+    which fits in a single packet is sent and received with one syscall apiece.
+
+    :param serialize: The serializer function for the pair. Defaults to encoded JSON.
+    :param deserialize: The deserializer funtion for the pair. Defaults to encoded JSON.
+    :param parent_lock: An optional lock object to give to the "parent" duct.
+    :param child_lock: An optional lock object to give to the "child" duct.
+    :param packet_size: The largest packet to send; larger messages are split across packets. Default: 64 KiB.
+    :param timeout: The number of seconds to block a send/recv call waiting for completion.
+    :type timeout: int | float
+    :param kwargs: Any other arguments to give to the constructor of both message ducts, such as
+        shared_memory_threshold.
+    :return: A parent/child pair of ducts.
+    :rtype: (ductworks.message_duct.MessageDuctParent, ductworks.message_duct.MesssageDuctChild)
+    """
+    parent_socket, child_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    parent = MessageDuctParent(
+        RawDuctParent.from_connected_socket(parent_socket, timeout=timeout),
+        serialize=serialize, deserialize=deserialize, lock=parent_lock, packet_size=packet_size, **kwargs
+    )
+    child = MessageDuctChild(
+        RawDuctChild.from_connected_socket(child_socket, timeout=timeout),
+        serialize=serialize, deserialize=deserialize, lock=child_lock, packet_size=packet_size, **kwargs
+    )
+    return parent, child
+
+
+def spawn_with_duct(argv, serialize=default_serializer, deserialize=default_deserializer, lock=None,
+                    recv_buffer_size=None, timeout=RawDuctParent.DEFAULT_TIMEOUT,
+                    env=None, duct_kwargs=None, **popen_kwargs):
+    """
+    Start a subprocess that inherits one end of an already connected duct pair. The child end is passed down as an
+    open file descriptor (via pass_fds), and its number is placed in the child's environment under
+    DUCT_FD_ENVIRONMENT_VARIABLE, so the child only needs to call MessageDuctChild.from_inherited_fd(). There is no
+    listener, no socket path, and no connect/retry handshake.
+
+    :param argv: The program arguments for the subprocess, as given to subprocess.Popen.
+    :type argv: list
+    :param serialize: The serialization function for the parent duct. Default: Encoded JSON.
+    :param deserialize: The deserialization function for the parent duct. Default: Encoded JSON.
+    :param lock: A lock object to lock send/recv calls on the parent duct.
+    :param recv_buffer_size: The size of the read-ahead buffer used by the parent duct. Default: 64 KiB, or 0 if a
+        lock is given.
+    :type recv_buffer_size: int | None
+    :param timeout: The number of seconds to block a send/recv call on the parent duct waiting for completion.
+    :type timeout: int | float
+    :param env: The environment for the subprocess. If None, the current environment is used. Default: None
+    :type env: dict | None
+    :param duct_kwargs: Any other arguments to give to the parent duct's constructor, such as
+        shared_memory_threshold. Default: None
+    :type duct_kwargs: dict | None
+    :param popen_kwargs: Any other arguments to give to subprocess.Popen.
+    :return: The subprocess and the parent end of its duct.
+    :rtype: (subprocess.Popen, ductworks.message_duct.MessageDuctParent)
+    """
+    parent_socket, child_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        child_fd = child_socket.fileno()
+        child_env = dict(os.environ if env is None else env)
+        child_env[DUCT_FD_ENVIRONMENT_VARIABLE] = str(child_fd)
+        pass_fds = tuple(popen_kwargs.pop('pass_fds', ())) + (child_fd,)
+        proc = subprocess.Popen(argv, env=child_env, pass_fds=pass_fds, **popen_kwargs)
+    except Exception:
+        parent_socket.close()
+        raise
+    finally:
+        # The child has its own copy now; keeping ours open would stop the parent from ever seeing EOF.
+        child_socket.close()
+    parent = MessageDuctParent(
+        RawDuctParent.from_connected_socket(parent_socket, timeout=timeout),
+        serialize=serialize, deserialize=deserialize, lock=lock, recv_buffer_size=recv_buffer_size,
+        **(duct_kwargs or {})
+    )
+    return proc, parent
+
+
+def wait(ducts, timeout=None):
+    """
+    Wait until at least one of the given ducts has something ready to read, much like
+    multiprocessing.connection.wait. Message ducts that already hold a fully received message, in their read buffer
+    or queued up by their channel multiplexer (see BaseMessageDuct.poll), count as ready even if their socket has
+    nothing more to read, and in that case wait() doesn't block at all.
+    Everything else is checked with a single poll(2) call, so this works for any number of ducts and for file
+    descriptors numbered above FD_SETSIZE.
+
+    :param ducts: The message ducts, raw socket ducts, or other objects with a fileno() method to wait on.
+    :type ducts: list
+    :param timeout: The amount of time to wait in seconds. If 0, don't block; if None, wait indefinitely.
+        Default: None
+    :type timeout: float | int | None
+    :return: The ducts that are ready to read (or have reached EOF).
+    :rtype: list
+    """
+    ready = []
+    pending = {}
+    for duct in ducts:
+        frame_reader = getattr(duct, 'frame_reader', None)
+        multiplexer = getattr(duct, 'channel_multiplexer', None)
+        if (frame_reader is not None and frame_reader.has_frame()) or \
+                (multiplexer is not None and multiplexer.has_received_data()):
+            ready.append(duct)
+        else:
+            pending.setdefault(duct.fileno(), []).append(duct)
+    if not pending:
+        return ready
+    if ready:
+        timeout = 0
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        for fd in pending:
+            poller.register(fd, SocketPoller.READ_EVENTS)
+        events = poller.poll(None if timeout is None else max(timeout, 0) * 1000)
+        ready_fds = [fd for fd, _ in events]
+    else:
+        ready_fds, _, _ = select.select(list(pending), [], [], timeout)
+    for fd in ready_fds:
+        ready.extend(pending[fd])
+    return ready
@@ -0,0 +1,240 @@
+import time
+import threading
+from weakref import WeakValueDictionary
+
+# The highest resolution clock available, for timing things that take microseconds.
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class LatencyHistogram(object):
+    """
+    A cheap histogram of durations, in seconds. Durations are counted in power of two buckets of nanoseconds, so
+    recording one is a few integer operations, and the percentiles it reports are the upper edge of the bucket they
+    fall in (never more than twice the true value).
+    """
+
+    # Enough buckets for anything up to 2 ** 48 nanoseconds, about three days.
+    BUCKET_COUNT = 49
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every recorded duration.
+
+        :return: None
+        """
+        self.buckets = [0] * self.BUCKET_COUNT
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration):
+        """
+        Record a duration.
+
+        :param duration: The duration, in seconds.
+        :type duration: float
+        :return: None
+        """
+        index = int(duration * 1e9).bit_length()
+        if index >= self.BUCKET_COUNT:
+            index = self.BUCKET_COUNT - 1
+        self.buckets[index] += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    @property
+    def count(self):
+        """
+        The number of durations recorded.
+
+        :return: The number of durations.
+        :rtype: int
+        """
+        return sum(self.buckets)
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile of the recorded durations.
+
+        :param fraction: The percentile, as a fraction; 0.99 for the 99th percentile.
+        :type fraction: float
+        :return: The upper bound of the percentile, in seconds, or None if nothing has been recorded.
+        :rtype: float | NoneType
+        """
+        count = self.count
+        if not count:
+            return None
+        rank = max(1, int(round(fraction * count)))
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min((1 << index) / 1e9, self.max)
+        return self.max
+
+    def snapshot(self):
+        """
+        Take a copy of the histogram's current state.
+
+        :return: The count, total, mean, max and estimated p50/p99/p999 durations (in seconds), and the non-empty
+            buckets as a mapping of their upper edge (in seconds) to their count.
+        :rtype: dict
+        """
+        count = self.count
+        return {
+            'count': count,
+            'total': self.total,
+            'mean': self.total / count if count else None,
+            'max': self.max,
+            'p50': self.percentile(0.50),
+            'p99': self.percentile(0.99),
+            'p999': self.percentile(0.999),
+            'buckets': dict(((1 << index) / 1e9, bucket_count)
+                            for index, bucket_count in enumerate(self.buckets) if bucket_count),
+        }
+
+
+class DuctMetrics(object):
+    """
+    The counters and timing histograms for one message duct (or several, if they're given the same DuctMetrics).
+    Ducts created with metrics=True get their own, registered in the default MetricsRegistry.
+
+    Counters:
+
+    - messages_sent, messages_received: Messages sent and received, including every message of a batch.
+    - bytes_sent, bytes_received: Bytes written to and read from the socket, including envelopes.
+    - send_calls, recv_calls: Socket writes and reads. A write the kernel only partly accepted is resumed within
+      the same call, so on a congested socket the true number of syscalls may be higher than send_calls.
+
+    Histograms (see LatencyHistogram), all in seconds:
+
+    - serialize_time, deserialize_time: Time spent in the serialization functions.
+    - lock_wait_time: Time spent waiting to acquire the duct's lock.
+    - blocking_time: Time spent in socket reads and in poll(), which is where a duct waits on the other end.
+
+    The metrics are updated without a lock of their own, so they are exact for a duct used from one thread at a
+    time (or guarded by a lock), and may very occasionally miss an update otherwise.
+    """
+
+    HISTOGRAMS = ('serialize_time', 'deserialize_time', 'lock_wait_time', 'blocking_time')
+
+    def __init__(self, name=None, registry=None):
+        self.name = name
+        for histogram in self.HISTOGRAMS:
+            setattr(self, histogram, LatencyHistogram())
+        self.reset()
+        if registry is not None:
+            registry.register(self)
+
+    def reset(self):
+        """
+        Zero every counter and histogram.
+
+        :return: None
+        """
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.send_calls = 0
+        self.recv_calls = 0
+        for histogram in self.HISTOGRAMS:
+            getattr(self, histogram).reset()
+
+    def snapshot(self):
+        """
+        Take a copy of every counter and histogram.
+
+        :return: The counters by name, and the histogram snapshots (see LatencyHistogram.snapshot) by name.
+        :rtype: dict
+        """
+        snapshot = {
+            'name': self.name,
+            'messages_sent': self.messages_sent,
+            'messages_received': self.messages_received,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'send_calls': self.send_calls,
+            'recv_calls': self.recv_calls,
+        }
+        for histogram in self.HISTOGRAMS:
+            snapshot[histogram] = getattr(self, histogram).snapshot()
+        return snapshot
+
+    def __repr__(self):
+        return "DuctMetrics(name={!r}, messages_sent={}, messages_received={}, bytes_sent={}, bytes_received={})" \
+               "".format(self.name, self.messages_sent, self.messages_received, self.bytes_sent, self.bytes_received)
+
+
+class MetricsRegistry(object):
+    """
+    A collection of the DuctMetrics of every live duct, so they can all be scraped in one go. The registry only
+    holds weak references; a duct's metrics leave the registry when the duct is closed or garbage collected.
+    """
+
+    def __init__(self):
+        self._metrics = WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def register(self, metrics):
+        """
+        Add a DuctMetrics to the registry. Metrics without a name are given a unique one; registering metrics under
+        a name that is already taken replaces the old ones.
+
+        :param metrics: The metrics to add.
+        :type metrics: DuctMetrics
+        :return: None
+        """
+        with self._lock:
+            if metrics.name is None:
+                self._next_id += 1
+                metrics.name = 'duct-{}'.format(self._next_id)
+            self._metrics[metrics.name] = metrics
+
+    def unregister(self, metrics):
+        """
+        Remove a DuctMetrics from the registry, if it is in it.
+
+        :param metrics: The metrics to remove.
+        :type metrics: DuctMetrics
+        :return: None
+        """
+        with self._lock:
+            if self._metrics.get(metrics.name) is metrics:
+                del self._metrics[metrics.name]
+
+    def metrics(self):
+        """
+        Get every registered DuctMetrics.
+
+        :return: The registered metrics, by name.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._metrics.items())
+
+    def snapshot(self):
+        """
+        Take a snapshot of every registered DuctMetrics.
+
+        :return: The snapshots (see DuctMetrics.snapshot), by name.
+        :rtype: dict
+        """
+        return dict((name, metrics.snapshot()) for name, metrics in self.metrics().items())
+
+    def reset(self):
+        """
+        Reset every registered DuctMetrics.
+
+        :return: None
+        """
+        for metrics in self.metrics().values():
+            metrics.reset()
+
+
+# The registry ducts created with metrics=True register themselves in.
+DEFAULT_METRICS_REGISTRY = MetricsRegistry()
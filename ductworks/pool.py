@@ -0,0 +1,380 @@
+import os
+import sys
+import traceback
+from collections import deque, OrderedDict
+
+from ductworks.base_duct import DuctworksException
+from ductworks.message_duct import MessageDuctChild, RemoteDuctClosed, spawn_with_duct, wait
+from ductworks.serialization import CODECS
+
+# How the pool picks the worker for the next task: the one with the fewest tasks outstanding, or each in turn.
+SCHEDULE_LEAST_LOADED = 'least-loaded'
+SCHEDULE_ROUND_ROBIN = 'round-robin'
+SCHEDULING_POLICIES = (SCHEDULE_LEAST_LOADED, SCHEDULE_ROUND_ROBIN)
+
+# The codecs the pool offers its workers. Tasks carry their function, which only pickle can send (by reference).
+DEFAULT_POOL_CODECS = ('pickle5',)
+
+# The kinds of message exchanged between the pool and its workers, always sent as [kind, task id, value].
+TASK_MESSAGE = 'task'
+RESULT_MESSAGE = 'result'
+ERROR_MESSAGE = 'error'
+STOP_MESSAGE = 'stop'
+
+
+class TaskFailed(DuctworksException):
+    """
+    This exception is thrown when a task raised an exception in its worker. The worker's traceback is kept in
+    remote_traceback.
+    """
+
+    def __init__(self, message, remote_traceback=None):
+        super(TaskFailed, self).__init__(message)
+        self.remote_traceback = remote_traceback
+
+
+class WorkerCrashed(DuctworksException):
+    """
+    This exception is thrown when a task was running on a worker that died every time it was tried.
+    """
+    pass
+
+
+class PoolWorker(object):
+    """
+    One worker subprocess of a DuctPool, along with the parent end of its duct and the tasks sent to it that
+    haven't been answered yet.
+    """
+
+    def __init__(self, proc, duct):
+        self.proc = proc
+        self.duct = duct
+        # The tasks dispatched to the worker and not yet answered, in the order they were sent, by task id.
+        self.outstanding = OrderedDict()
+        # The ids of tasks still running for a map the caller has stopped iterating; their results are dropped.
+        self.abandoned = set()
+        self.tasks_completed = 0
+
+    def load(self):
+        """
+        Get the number of tasks sent to the worker that it hasn't answered yet, abandoned or not.
+
+        :return: The number of unanswered tasks.
+        :rtype: int
+        """
+        return len(self.outstanding) + len(self.abandoned)
+
+    def stop(self, timeout=None):
+        """
+        Ask the worker to exit once it has finished its outstanding tasks, and wait for it to do so.
+
+        :param timeout: The longest to wait for the worker to exit before killing it. If None, wait as long as it
+            takes. Default: None
+        :type timeout: float | int | None
+        :return: None
+        """
+        try:
+            self.duct.send([STOP_MESSAGE, None, None])
+        except Exception:
+            # Already gone.
+            pass
+        try:
+            self.proc.wait(timeout)
+        except Exception:
+            self.proc.kill()
+            self.proc.wait()
+        self.duct.close()
+
+    def kill(self):
+        """
+        Kill the worker right away.
+
+        :return: None
+        """
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.duct.close()
+
+
+class DuctPool(object):
+    """
+    The DuctPool runs tasks on a fixed number of subprocess workers, much like multiprocessing.Pool, except that the
+    workers are separate programs started with fork+exec, each with a message duct of its own. Tasks are dispatched
+    to the least loaded worker (or round robin), and each worker is kept up to prefetch tasks ahead, so it never
+    sits idle waiting for the pool to send its next task. Each worker's share of tasks is sent in one write, and
+    each result is sent back as soon as its task is done.
+
+    A worker that dies is replaced by a new one, and the tasks it hadn't finished are tried again elsewhere, up to
+    max_retries times each; after that, the task fails with WorkerCrashed.
+
+    Task functions are sent by reference (pickled as their module and name), so they must be importable in the
+    workers, which by default run as "python -m ductworks.pool" from the pool's working directory. A DuctPool isn't
+    thread-safe, and only one map or imap_unordered call can be iterated at a time.
+
+    :param processes: The number of workers. Default: The number of CPUs.
+    :type processes: int | None
+    :param executable: The Python interpreter to run the workers with, for instance one from another virtualenv
+        (ductworks must be installed there too). Default: The current interpreter.
+    :type executable: str | None
+    :param scheduling: SCHEDULE_LEAST_LOADED or SCHEDULE_ROUND_ROBIN. Default: SCHEDULE_LEAST_LOADED
+    :type scheduling: str
+    :param prefetch: The most tasks to send each worker before it has answered the first. Default: 2
+    :type prefetch: int
+    :param max_retries: How many times to retry a task after the worker running it died. Default: 1
+    :type max_retries: int
+    :param worker_argv: The program arguments to start each worker with, instead of running ductworks.pool with
+        the executable; the worker must end up calling worker_main(). Default: None
+    :type worker_argv: list | None
+    :param codecs: The codecs to offer the workers during the handshake. Default: pickle5
+    :type codecs: tuple
+    :param popen_kwargs: Any other arguments to give to subprocess.Popen for each worker, such as env or cwd.
+    """
+
+    def __init__(self, processes=None, executable=None, scheduling=SCHEDULE_LEAST_LOADED, prefetch=2,
+                 max_retries=1, worker_argv=None, codecs=DEFAULT_POOL_CODECS, **popen_kwargs):
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError("Unknown scheduling policy {!r}! Expected one of {}".format(
+                scheduling, SCHEDULING_POLICIES))
+        self.processes = processes or os.cpu_count() or 1
+        self.worker_argv = worker_argv or [executable or sys.executable, '-m', 'ductworks.pool']
+        self.scheduling = scheduling
+        self.prefetch = max(prefetch, 1)
+        self.max_retries = max_retries
+        self.codecs = codecs
+        self.popen_kwargs = popen_kwargs
+        self.workers_restarted = 0
+        self._next_task_id = 0
+        self._next_worker = 0
+        # Tasks taken back from a dead worker, to be dispatched again before any new ones.
+        self._retry_queue = deque()
+        # Tasks that have failed, but haven't been reported yet.
+        self._failed_tasks = deque()
+        self.workers = []
+        try:
+            for _ in range(self.processes):
+                self.workers.append(self._start_worker())
+        except Exception:
+            self.terminate()
+            raise
+
+    def _start_worker(self):
+        proc, duct = spawn_with_duct(self.worker_argv, duct_kwargs={'handshake': True, 'codecs': self.codecs},
+                                     **self.popen_kwargs)
+        return PoolWorker(proc, duct)
+
+    def _replace_worker(self, worker):
+        # Anything the dead worker hadn't answered is tried again on another worker, unless it's out of retries.
+        for task in worker.outstanding.values():
+            task[3] += 1
+            if task[3] > self.max_retries:
+                self._failed_tasks.append((task, WorkerCrashed(
+                    "The worker running the task died {} times! Exit code: {}".format(task[3], worker.proc.poll())
+                )))
+            else:
+                self._retry_queue.append(task)
+        worker.outstanding.clear()
+        worker.abandoned.clear()
+        worker.kill()
+        self.workers[self.workers.index(worker)] = self._start_worker()
+        self.workers_restarted += 1
+
+    def _pick_worker(self):
+        if self.scheduling == SCHEDULE_ROUND_ROBIN:
+            # Strictly in turn, even if that means waiting on a busy worker while another sits idle.
+            worker = self.workers[self._next_worker]
+            if worker.load() >= self.prefetch:
+                return None
+            self._next_worker = (self._next_worker + 1) % len(self.workers)
+            return worker
+        worker = min(self.workers, key=PoolWorker.load)
+        return worker if worker.load() < self.prefetch else None
+
+    def _dispatch(self, worker, tasks):
+        # The tasks are already in the worker's outstanding tasks, so they're taken back if it turns out to be dead.
+        try:
+            worker.duct.send_many([TASK_MESSAGE, task_id, [func, arg]] for task_id, func, arg, _ in tasks)
+        except (EOFError, OSError):
+            self._replace_worker(worker)
+
+    def _next_task(self, tasks, func):
+        if self._retry_queue:
+            return self._retry_queue.popleft()
+        try:
+            arg = next(tasks)
+        except StopIteration:
+            return None
+        self._next_task_id += 1
+        return [self._next_task_id, func, arg, 0]
+
+    def _collect(self, timeout=None):
+        completed = []
+        while self._failed_tasks:
+            task, error = self._failed_tasks.popleft()
+            completed.append((task, False, error))
+        busy_workers = [worker for worker in self.workers if worker.load()]
+        if not busy_workers:
+            return completed
+        ready_ducts = wait([worker.duct for worker in busy_workers], timeout)
+        for worker in busy_workers:
+            if worker.duct not in ready_ducts:
+                continue
+            try:
+                messages = worker.duct.recv_many()
+            except (EOFError, OSError):
+                self._replace_worker(worker)
+                continue
+            for kind, task_id, value in messages:
+                task = worker.outstanding.pop(task_id, None)
+                if task is None:
+                    worker.abandoned.discard(task_id)
+                    continue
+                worker.tasks_completed += 1
+                completed.append((task, kind == RESULT_MESSAGE, value))
+        return completed
+
+    def _run(self, func, iterable):
+        """
+        Run func on every item of iterable, yielding (task number, succeeded, result or error) as tasks finish.
+        """
+        tasks = iter(iterable)
+        first_task_id = self._next_task_id + 1
+        exhausted = False
+        try:
+            while True:
+                # Hand out as many tasks as the workers can take, then send each worker its share in one write.
+                assigned = OrderedDict()
+                while not exhausted or self._retry_queue:
+                    worker = self._pick_worker()
+                    if worker is None:
+                        break
+                    task = self._next_task(tasks, func)
+                    if task is None:
+                        exhausted = True
+                        break
+                    worker.outstanding[task[0]] = task
+                    assigned.setdefault(worker, []).append(task)
+                for worker, worker_tasks in assigned.items():
+                    self._dispatch(worker, worker_tasks)
+                if exhausted and not self._retry_queue and not self._failed_tasks and \
+                        not any(worker.outstanding for worker in self.workers):
+                    return
+                for task, succeeded, value in self._collect():
+                    yield task[0] - first_task_id, succeeded, value
+        finally:
+            # If the caller stopped early, or a task failed, don't wait for whatever is still running: its results
+            # are dropped as they come in, and the workers take new tasks as soon as they have room again.
+            self._retry_queue.clear()
+            for worker in self.workers:
+                worker.abandoned.update(worker.outstanding)
+                worker.outstanding.clear()
+            self._failed_tasks.clear()
+
+    @staticmethod
+    def _task_error(value):
+        if isinstance(value, DuctworksException):
+            return value
+        message, remote_traceback = value
+        return TaskFailed(message, remote_traceback)
+
+    def imap_unordered(self, func, iterable):
+        """
+        Run func on every item of iterable across the workers, yielding the results in whatever order they finish.
+
+        If a task raises an exception, a TaskFailed exception (or WorkerCrashed, if its worker kept dying) is raised
+        when its result would have been yielded, and the tasks still running are abandoned (as they are if the
+        generator is closed early); the pool doesn't wait for them.
+
+        :param func: The function to call with each item. Must be importable by the workers.
+        :param iterable: The items to call func with; only read as fast as the workers can take them.
+        :return: A generator of the results.
+        """
+        for _, succeeded, value in self._run(func, iterable):
+            if not succeeded:
+                raise self._task_error(value)
+            yield value
+
+    def map(self, func, iterable):
+        """
+        Run func on every item of iterable across the workers, and wait for all of the results.
+
+        :param func: The function to call with each item. Must be importable by the workers.
+        :param iterable: The items to call func with.
+        :return: The results, in the same order as the items.
+        :rtype: list
+        """
+        results = {}
+        for task_number, succeeded, value in self._run(func, iterable):
+            if not succeeded:
+                raise self._task_error(value)
+            results[task_number] = value
+        return [results[task_number] for task_number in range(len(results))]
+
+    def close(self, timeout=None):
+        """
+        Stop every worker, letting each finish what it's running first.
+
+        :param timeout: The longest to wait for each worker before killing it. If None, wait as long as it takes.
+        :type timeout: float | int | None
+        :return: None
+        """
+        for worker in self.workers:
+            worker.stop(timeout)
+        self.workers = []
+
+    def terminate(self):
+        """
+        Kill every worker right away.
+
+        :return: None
+        """
+        for worker in self.workers:
+            worker.kill()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+def worker_main(duct=None):
+    """
+    Run a DuctPool worker: answer tasks from the pool until told to stop or the pool goes away.
+
+    :param duct: The duct to the pool. Default: The duct inherited from the pool, with the handshake enabled.
+    :type duct: ductworks.message_duct.MessageDuctChild | None
+    :return: None
+    """
+    if duct is None:
+        # Tasks can take any amount of time to arrive, so never time out waiting for one. The pool started this
+        # worker, so it is trusted with whichever codec it picks, unsafe ones included.
+        duct = MessageDuctChild.from_inherited_fd(timeout=None, handshake=True, codecs=tuple(CODECS))
+    try:
+        while True:
+            try:
+                # Take whatever the pool has already sent in one go.
+                messages = [duct.recv()]
+                messages.extend(duct.recv_many())
+            except RemoteDuctClosed:
+                return
+            for kind, task_id, task in messages:
+                if kind == STOP_MESSAGE:
+                    return
+                # The next task may take any amount of time, so never hold on to a result until it's done.
+                func, arg = task
+                try:
+                    result = [RESULT_MESSAGE, task_id, func(arg)]
+                except Exception as e:
+                    result = [ERROR_MESSAGE, task_id, ["{}: {}".format(type(e).__name__, e), traceback.format_exc()]]
+                duct.send(result)
+    finally:
+        duct.close()
+
+
+if __name__ == '__main__':
+    worker_main()
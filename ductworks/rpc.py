@@ -0,0 +1,490 @@
+import asyncio
+import itertools
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+
+from ductworks.base_duct import DuctworksException, NotConnectedException, LocalSocketFault
+from ductworks.message_duct import RemoteDuctClosed
+
+# The kinds of message exchanged between RPC clients and servers. Requests are sent as
+# [CALL_MESSAGE, request id, method, args, kwargs] (with a request id of None for notifications, which get no reply),
+# and every response as [kind, request id, value].
+CALL_MESSAGE = 'call'
+REPLY_MESSAGE = 'reply'
+ERROR_MESSAGE = 'error'
+STREAM_ITEM_MESSAGE = 'item'
+STREAM_END_MESSAGE = 'end'
+
+# How long the client's reader thread, and a server, wait in poll() at a time while their duct is idle.
+READER_POLL_INTERVAL = 0.1
+
+
+class RpcError(DuctworksException):
+    """
+    This exception is thrown when a remote method raised an exception, or doesn't exist. The server's traceback is
+    kept in remote_traceback.
+    """
+
+    def __init__(self, message, remote_traceback=None):
+        super(RpcError, self).__init__(message)
+        self.remote_traceback = remote_traceback
+
+
+class RpcRegistry(object):
+    """
+    The RpcRegistry maps method names to the functions an RpcServer calls for them. Streaming methods return (or
+    yield) an iterable, and each of its items is sent to the caller as soon as it is produced.
+    """
+
+    def __init__(self):
+        self.methods = {}
+
+    def register(self, func=None, name=None, streaming=False):
+        """
+        Register a function as a remote method. May also be used as a decorator, with or without arguments.
+
+        :param func: The function to call for the method.
+        :param name: The name of the method. Default: The function's __name__.
+        :type name: str | None
+        :param streaming: Whether the function returns an iterable of items to stream back. Default: False
+        :type streaming: bool
+        :return: The function, unchanged.
+        """
+        if func is None:
+            return lambda decorated_func: self.register(decorated_func, name, streaming)
+        self.methods[name or func.__name__] = (func, streaming)
+        return func
+
+    def lookup(self, name):
+        """
+        Find a registered method.
+
+        An RpcError is raised if no method is registered under the name.
+
+        :param name: The name of the method.
+        :type name: str
+        :return: The function and whether it is a streaming method.
+        :rtype: (function, bool)
+        """
+        try:
+            return self.methods[name]
+        except KeyError:
+            raise RpcError("Unknown method {!r}!".format(name))
+
+
+def _error_value(e):
+    return ["{}: {}".format(type(e).__name__, e), traceback.format_exc()]
+
+
+class RpcServer(object):
+    """
+    The RpcServer answers calls arriving on a message duct with the methods in its registry. Calls are handled one
+    at a time, in the order they arrive, but a client doesn't have to wait for one reply before making its next call:
+    everything already received is handled as a batch, and each reply is sent back as soon as it is ready.
+
+    :param duct: The connected message duct to serve calls from.
+    :type duct: ductworks.message_duct.BaseMessageDuct
+    :param registry: The methods to serve.
+    :type registry: RpcRegistry
+    """
+
+    def __init__(self, duct, registry):
+        self.duct = duct
+        self.registry = registry
+
+    def serve_forever(self):
+        """
+        Answer calls until the duct is closed, at either end.
+
+        :return: None
+        """
+        while True:
+            try:
+                # Waiting with poll() rather than in recv(), so an idle client doesn't trip the socket timeout.
+                requests = self.duct.recv_many(timeout=READER_POLL_INTERVAL)
+                if requests:
+                    self.handle_batch(requests)
+            except RemoteDuctClosed:
+                return
+            except (NotConnectedException, LocalSocketFault):
+                # Closing the duct locally, from another thread, stops the server just the same.
+                if not self.duct._is_connected():
+                    return
+                raise
+
+    def handle_batch(self, requests):
+        """
+        Handle a batch of requests, sending the replies back.
+
+        :param requests: The requests, as received from the duct.
+        :type requests: list
+        :return: None
+        """
+        # Replies are produced lazily: pulling the next one runs the next call, or the streaming method up to its
+        # next item, either of which may take any amount of time. So each reply is sent before the next is pulled,
+        # or the client would wait on calls that are already done.
+        for reply in itertools.chain.from_iterable(self._responses(*request[1:]) for request in requests):
+            if reply[1] is None:
+                # A notification; nobody is waiting on the outcome.
+                continue
+            self.duct.send(reply)
+
+    def _responses(self, request_id, method, args, kwargs):
+        try:
+            func, streaming = self.registry.lookup(method)
+            if not streaming:
+                yield [REPLY_MESSAGE, request_id, func(*args, **kwargs)]
+                return
+            for item in func(*args, **kwargs):
+                yield [STREAM_ITEM_MESSAGE, request_id, item]
+            yield [STREAM_END_MESSAGE, request_id, None]
+        except Exception as e:
+            yield [ERROR_MESSAGE, request_id, _error_value(e)]
+
+
+class RpcStream(object):
+    """
+    An iterator over the items of a streaming response, as they arrive. If the remote method fails partway through,
+    the items sent before the failure are yielded, and then the RpcError is raised.
+    """
+
+    _END = object()
+
+    def __init__(self):
+        self._items = queue.Queue()
+
+    def _put(self, item):
+        self._items.put(item)
+
+    def _end(self, error=None):
+        self._items.put((self._END, error))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self._items.get()
+        if isinstance(item, tuple) and len(item) == 2 and item[0] is self._END:
+            # Leave the end marker in place, so iterating again stops (or fails) again.
+            self._items.put(item)
+            if item[1] is not None:
+                raise item[1]
+            raise StopIteration
+        return item
+
+
+class RpcClient(object):
+    """
+    The RpcClient calls methods of an RpcServer at the other end of a message duct. Every call is tagged with an id,
+    so any number of calls may be outstanding at once: call_async() returns a future right after sending the request,
+    and a single reader thread resolves each future when its reply arrives. Pipelining calls this way keeps the duct
+    busy in both directions, instead of leaving it idle for a round trip after every call.
+
+    The client may be used from any number of threads. It must be the only user of its duct.
+
+    :param duct: The connected message duct to the server.
+    :type duct: ductworks.message_duct.BaseMessageDuct
+    """
+
+    def __init__(self, duct):
+        self.duct = duct
+        self._request_ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        # Futures, and the RpcStreams of streaming calls, by request id.
+        self._pending = {}
+        self._closing = False
+        self.error = None
+        # The other end's hello is read by the reader thread; requests are held back until it has been.
+        self._ready = threading.Event()
+        self._reader = threading.Thread(target=self._read_replies, name='ductworks-rpc-reader')
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _read_replies(self):
+        duct = self.duct
+        try:
+            while duct.handshake_pending and not self._closing:
+                duct.poll(READER_POLL_INTERVAL)
+            self._ready.set()
+            while not self._closing:
+                for kind, request_id, value in duct.recv_many(timeout=READER_POLL_INTERVAL):
+                    self._route(kind, request_id, value)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                self._closing = True
+            error = self.error or RemoteDuctClosed("The RPC client was closed.")
+            if isinstance(error, EOFError):
+                error = RemoteDuctClosed("The RPC server closed the connection!")
+            for waiter in pending.values():
+                if isinstance(waiter, RpcStream):
+                    waiter._end(error)
+                else:
+                    waiter.set_exception(error)
+
+    def _route(self, kind, request_id, value):
+        with self._pending_lock:
+            if kind == STREAM_ITEM_MESSAGE:
+                waiter = self._pending.get(request_id)
+            else:
+                waiter = self._pending.pop(request_id, None)
+        if waiter is None:
+            return
+        if kind == STREAM_ITEM_MESSAGE:
+            waiter._put(value)
+        elif kind == STREAM_END_MESSAGE:
+            waiter._end()
+        elif kind == REPLY_MESSAGE:
+            waiter.set_result(value)
+        else:
+            error = RpcError(*value)
+            if isinstance(waiter, RpcStream):
+                waiter._end(error)
+            else:
+                waiter.set_exception(error)
+
+    def _send_requests(self, requests):
+        # Each request is a (request id, method, args, kwargs, waiter) tuple; all of them are written at once.
+        if not self._ready.is_set():
+            self._ready.wait()
+        with self._pending_lock:
+            if self._closing:
+                raise self.error or RemoteDuctClosed("The RPC client is closed!")
+            for request_id, _, _, _, waiter in requests:
+                if waiter is not None:
+                    self._pending[request_id] = waiter
+        try:
+            with self._send_lock:
+                self.duct.send_many([CALL_MESSAGE, request_id, method, list(args), kwargs]
+                                    for request_id, method, args, kwargs, _ in requests)
+        except Exception:
+            with self._pending_lock:
+                for request in requests:
+                    self._pending.pop(request[0], None)
+            raise
+        return [request[4] for request in requests]
+
+    def call_async(self, method, *args, **kwargs):
+        """
+        Call a remote method without waiting for the reply.
+
+        :param method: The name of the method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: A future for the method's result; its exception is an RpcError if the method failed, or a
+            RemoteDuctClosed if the connection was lost before the reply arrived.
+        :rtype: concurrent.futures.Future
+        """
+        return self._send_requests([(next(self._request_ids), method, args, kwargs, Future())])[0]
+
+    def call_many(self, calls):
+        """
+        Call a batch of remote methods without waiting for the replies, writing every request to the duct at once.
+        This is the cheapest way to pipeline calls: the server is woken up once for the whole batch, rather than
+        once per call.
+
+        :param calls: The calls to make, as (method, args) or (method, args, kwargs) tuples.
+        :return: A future for the result of each call, in the same order as the calls.
+        :rtype: list
+        """
+        return self._send_requests([(next(self._request_ids), call[0], call[1], call[2] if len(call) > 2 else {},
+                                     Future()) for call in calls])
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call a remote method and wait for its result.
+
+        An RpcError is raised if the method failed.
+
+        :param method: The name of the method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: The method's result.
+        """
+        return self.call_async(method, *args, **kwargs).result()
+
+    def stream(self, method, *args, **kwargs):
+        """
+        Call a streaming remote method, without waiting for any of its items.
+
+        :param method: The name of the streaming method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: An iterator over the items, as they arrive.
+        :rtype: RpcStream
+        """
+        return self._send_requests([(next(self._request_ids), method, args, kwargs, RpcStream())])[0]
+
+    def notify(self, method, *args, **kwargs):
+        """
+        Call a remote method without asking for its result at all; the server sends no reply, even if it fails.
+
+        :param method: The name of the method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: None
+        """
+        self._send_requests([(None, method, args, kwargs, None)])
+
+    def close(self):
+        """
+        Stop the reader thread and close the duct. Calls still waiting for a reply fail with RemoteDuctClosed.
+
+        :return: None
+        """
+        self._closing = True
+        if self._reader is not threading.current_thread():
+            self._reader.join()
+        self.duct.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+class AsyncRpcClient(object):
+    """
+    The AsyncRpcClient is the asyncio counterpart of RpcClient, for an async duct from ductworks.async_duct. Replies
+    are routed to their callers by a single reader task on the duct's event loop.
+
+    :param duct: The connected async message duct to the server.
+    :type duct: ductworks.async_duct.BaseAsyncMessageDuct
+    """
+
+    def __init__(self, duct):
+        self.duct = duct
+        self._request_ids = itertools.count(1)
+        self._pending = {}
+        self.error = None
+        self._reader = asyncio.ensure_future(self._read_replies())
+
+    async def _read_replies(self):
+        try:
+            while True:
+                kind, request_id, value = await self.duct.recv()
+                if kind == STREAM_ITEM_MESSAGE:
+                    waiter = self._pending.get(request_id)
+                else:
+                    waiter = self._pending.pop(request_id, None)
+                if waiter is None:
+                    continue
+                if kind == STREAM_ITEM_MESSAGE:
+                    waiter.put_nowait(value)
+                elif kind == STREAM_END_MESSAGE:
+                    waiter.put_nowait((RpcStream._END, None))
+                elif kind == REPLY_MESSAGE:
+                    waiter.set_result(value)
+                elif isinstance(waiter, asyncio.Queue):
+                    waiter.put_nowait((RpcStream._END, RpcError(*value)))
+                else:
+                    waiter.set_exception(RpcError(*value))
+        except Exception as e:
+            self.error = e
+        finally:
+            pending, self._pending = self._pending, {}
+            if self.error is None:
+                error = RemoteDuctClosed("The RPC client was closed.")
+            elif isinstance(self.error, EOFError):
+                error = RemoteDuctClosed("The RPC server closed the connection!")
+            else:
+                error = self.error
+            for waiter in pending.values():
+                if isinstance(waiter, asyncio.Queue):
+                    waiter.put_nowait((RpcStream._END, error))
+                elif not waiter.done():
+                    waiter.set_exception(error)
+
+    async def _send_request(self, method, args, kwargs, waiter):
+        if self._reader.done():
+            raise self.error or RemoteDuctClosed("The RPC client is closed!")
+        request_id = next(self._request_ids)
+        self._pending[request_id] = waiter
+        try:
+            await self.duct.send([CALL_MESSAGE, request_id, method, list(args), kwargs])
+        except Exception:
+            self._pending.pop(request_id, None)
+            raise
+        return waiter
+
+    async def call_async(self, method, *args, **kwargs):
+        """
+        Call a remote method, returning once the request has been sent rather than once the reply arrives.
+
+        :param method: The name of the method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: A future for the method's result.
+        :rtype: asyncio.Future
+        """
+        return await self._send_request(method, args, kwargs, asyncio.get_running_loop().create_future())
+
+    async def call(self, method, *args, **kwargs):
+        """
+        Call a remote method and wait for its result.
+
+        An RpcError is raised if the method failed.
+
+        :param method: The name of the method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: The method's result.
+        """
+        return await (await self.call_async(method, *args, **kwargs))
+
+    async def stream(self, method, *args, **kwargs):
+        """
+        Call a streaming remote method, yielding its items as they arrive.
+
+        :param method: The name of the streaming method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: An async generator of the items.
+        """
+        items = await self._send_request(method, args, kwargs, asyncio.Queue())
+        while True:
+            item = await items.get()
+            if isinstance(item, tuple) and len(item) == 2 and item[0] is RpcStream._END:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+
+    async def notify(self, method, *args, **kwargs):
+        """
+        Call a remote method without asking for its result at all; the server sends no reply, even if it fails.
+
+        :param method: The name of the method to call.
+        :type method: str
+        :param args: The positional arguments for the method.
+        :param kwargs: The keyword arguments for the method.
+        :return: None
+        """
+        await self.duct.send([CALL_MESSAGE, None, method, list(args), kwargs])
+
+    async def close(self):
+        """
+        Stop the reader task and close the duct. Calls still waiting for a reply fail with RemoteDuctClosed.
+
+        :return: None
+        """
+        self._reader.cancel()
+        try:
+            await self._reader
+        except BaseException:
+            pass
+        await self.duct.close()
@@ -0,0 +1,319 @@
+try:
+    import anyjson as json
+except ImportError:
+    import json
+import codecs
+import marshal
+import pickle
+
+try:
+    from pickle import PickleBuffer
+except ImportError:
+    PickleBuffer = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from ductworks.compression import SUPPORTED_COMPRESSION
+from ductworks.framing import MessageProtocolException
+
+
+# The version of the handshake exchanged by ducts created with handshake=True. Peers with different major versions
+# refuse to talk to each other.
+HANDSHAKE_VERSION = 1
+
+
+def serialized_buffers(serialized_payload):
+    """
+    Serializers may return either a single bytes-like object, or a list of bytes-like objects that together make up
+    the payload. A list is sent back to back as a scatter/gather write, without ever joining the pieces. This
+    returns the payload as a list either way.
+
+    :param serialized_payload: The output of a serializer.
+    :type serialized_payload: bytes | bytearray | memoryview | list
+    :return: The pieces of the payload, in order.
+    :rtype: list
+    """
+    if isinstance(serialized_payload, list):
+        return serialized_payload
+    return [serialized_payload]
+
+
+def serialized_length(serialized_payload):
+    """
+    Get the length in bytes of the output of a serializer, which may be a single bytes-like object or a list of them.
+
+    :param serialized_payload: The output of a serializer.
+    :type serialized_payload: bytes | bytearray | memoryview | list
+    :return: The total length of the payload, in bytes.
+    :rtype: int
+    """
+    if isinstance(serialized_payload, list):
+        return sum(serialized_length(buff) for buff in serialized_payload)
+    if isinstance(serialized_payload, (bytes, bytearray)):
+        return len(serialized_payload)
+    return memoryview(serialized_payload).nbytes
+
+
+def serializer_with_encoder_constructor(serialization_func, encoder_type='utf-8', encoder_error_mode='strict'):
+    """
+    Wrap a serialization function with string encoding. This is important for JSON, as it serializes objects into
+    strings (potentially unicode), NOT bytestreams. An extra encoding step is needed to get to a bytestream.
+
+    :param serialization_func: The base serialization function.
+    :param encoder_type: The encoder type. Default: 'utf-8'
+    :param encoder_error_mode: The encode error mode. Default: 'strict'.
+    :return: The serializer function wrapped with specified encoder.
+    :rtype: T -> bytes | bytearray | str
+    """
+    encoder = codecs.getencoder(encoder_type)
+
+    def serialize(payload):
+        serialized, _ = encoder(serialization_func(payload), encoder_error_mode)
+        return serialized
+    return serialize
+
+
+def deserializer_with_decoder_constructor(deserialization_func, decoder_type='utf-8', decoder_error_mode='replace'):
+    """
+    Wrap a deserialization function with string encoding. This is important for JSON, as it expects to operate on
+    strings (potentially unicode), NOT bytetsteams. A decoding steps is needed in between.
+
+    :param deserialization_func: The base deserialization function.
+    :param decoder_type: The decoder type. Default: 'utf-8'
+    :param decoder_error_mode: The decode error mode. Default: 'replace'.
+    :return: The deserializer function wrapped with specified decoder.
+    :rtype: bytes | bytearray | str -> T
+    """
+    decoder = codecs.getdecoder(decoder_type)
+
+    def deserialize(payload):
+        decoded, _ = decoder(payload, decoder_error_mode)
+        return deserialization_func(decoded)
+    return deserialize
+
+
+default_serializer = serializer_with_encoder_constructor(json.dumps)
+default_deserializer = deserializer_with_decoder_constructor(json.loads)
+
+# Pickle protocol 5 (Python 3.8+) can hand large buffers, like NumPy arrays or anything wrapped in a
+# pickle.PickleBuffer, to a callback instead of copying them into the pickle stream.
+PICKLE5_SUPPORTED = PickleBuffer is not None and pickle.HIGHEST_PROTOCOL >= 5
+
+
+def pickle5_serializer(payload):
+    """
+    Pickle a payload with protocol 5, keeping every buffer that supports it (NumPy arrays, or any bytes-like
+    object wrapped in a pickle.PickleBuffer) out of band. For use with message ducts created with
+    out_of_band=True, which send the pickle stream and each buffer as separate frames, straight from the memory
+    the buffers already live in.
+
+    :param payload: The Python object to pickle.
+    :return: The pickle stream and the list of out-of-band buffers.
+    :rtype: (bytes, list)
+    """
+    out_of_band_buffers = []
+    return pickle.dumps(payload, protocol=5, buffer_callback=out_of_band_buffers.append), out_of_band_buffers
+
+
+def pickle5_deserializer(serialized_payload, out_of_band_buffers):
+    """
+    Unpickle a payload serialized by pickle5_serializer. The out-of-band buffers are used in place, so arrays
+    rebuilt from them share their memory rather than copying it.
+
+    :param serialized_payload: The pickle stream.
+    :param out_of_band_buffers: The out-of-band buffers received along with the pickle stream.
+    :type out_of_band_buffers: list
+    :return: The unpickled Python object.
+    """
+    return pickle.loads(serialized_payload, buffers=out_of_band_buffers)
+
+
+# The one-byte tags at the end of every payload serialized by a tagged serializer, which tell the kinds of payload
+# apart. The tag goes at the end rather than the front so it can be dropped from a received bytearray in place.
+PAYLOAD_TAG_RAW = b'\x00'
+PAYLOAD_TAG_TEXT = b'\x01'
+PAYLOAD_TAG_STRUCTURED = b'\x02'
+
+
+def tagged_serializer_constructor(serialization_func=default_serializer):
+    """
+    Build a serializer that picks the cheapest encoding for each payload and tags it with its kind. Raw bytes-like
+    payloads (bytes, bytearray, memoryview) are sent untouched, strings are only UTF-8 encoded, and everything else
+    goes through the given serialization function. The payload and its tag are returned as a list, so they're sent
+    as a scatter/gather write without copying the payload.
+
+    :param serialization_func: The serializer for structured data. Default: Encoded JSON.
+    :return: The tagged serializer function.
+    :rtype: T -> list
+    """
+    def serialize(payload):
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            return [payload, PAYLOAD_TAG_RAW]
+        if isinstance(payload, str):
+            return [payload.encode('utf-8'), PAYLOAD_TAG_TEXT]
+        return serialized_buffers(serialization_func(payload)) + [PAYLOAD_TAG_STRUCTURED]
+    return serialize
+
+
+def tagged_deserializer_constructor(deserialization_func=default_deserializer):
+    """
+    Build the deserializer matching tagged_serializer_constructor. Raw payloads are handed back as the bytearray they
+    were received into (or a memoryview, if they weren't received into a bytearray, such as through shared memory),
+    strings are decoded from UTF-8, and everything else goes through the given deserialization function.
+
+    A MessageProtocolException is raised for payloads without a valid tag.
+
+    :param deserialization_func: The deserializer for structured data. Default: Encoded JSON.
+    :return: The tagged deserializer function.
+    :rtype: bytearray | memoryview | bytes -> T
+    """
+    def deserialize(serialized_payload):
+        tag = serialized_payload[-1:]
+        if isinstance(serialized_payload, bytearray):
+            del serialized_payload[-1:]
+            body = serialized_payload
+        else:
+            body = memoryview(serialized_payload)[:-1]
+        if tag == PAYLOAD_TAG_RAW:
+            return body
+        if tag == PAYLOAD_TAG_TEXT:
+            return str(body, 'utf-8')
+        if tag == PAYLOAD_TAG_STRUCTURED:
+            return deserialization_func(body)
+        raise MessageProtocolException("Received a payload without a valid type tag!")
+    return deserialize
+
+
+tagged_serializer = tagged_serializer_constructor()
+tagged_deserializer = tagged_deserializer_constructor()
+
+
+class Codec(object):
+    """
+    A named pair of serialization and deserialization functions, which message ducts created with handshake=True
+    can agree on by name. Codecs marked out_of_band work with out-of-band buffers, like pickle5_serializer.
+    """
+
+    def __init__(self, name, serialize, deserialize, out_of_band=False):
+        self.name = name
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.out_of_band = out_of_band
+
+    def __repr__(self):
+        return "Codec({!r})".format(self.name)
+
+
+# Every codec available in this process, by name.
+CODECS = {}
+
+
+def register_codec(codec):
+    """
+    Make a codec available for message ducts to negotiate during the handshake, replacing any codec of the same name.
+
+    :param codec: The codec to register.
+    :type codec: ductworks.serialization.Codec
+    :return: None
+    """
+    CODECS[codec.name] = codec
+
+
+register_codec(Codec('json', default_serializer, default_deserializer))
+register_codec(Codec('tagged-json', tagged_serializer, tagged_deserializer))
+register_codec(Codec('marshal', marshal.dumps, marshal.loads))
+if PICKLE5_SUPPORTED:
+    register_codec(Codec('pickle5', pickle5_serializer, pickle5_deserializer, out_of_band=True))
+if msgpack is not None:
+    register_codec(Codec('msgpack', msgpack.packb, lambda serialized_payload: msgpack.unpackb(serialized_payload,
+                                                                                              raw=False)))
+
+# The codecs offered during the handshake, fastest first. JSON is last as the fallback every peer understands.
+# pickle5 and marshal are faster still, but will happily execute or crash on malicious input, so they are only
+# offered by ducts given them in codecs, which should only ever talk to trusted peers.
+DEFAULT_CODEC_PREFERENCE = ('msgpack', 'tagged-json', 'json')
+
+
+class NegotiatedOptions(object):
+    """
+    What the two ends of a duct agreed on during the handshake.
+    """
+
+    def __init__(self, version, codec, compression, max_frame_size):
+        self.version = version
+        self.codec = codec
+        self.compression = compression
+        self.max_frame_size = max_frame_size
+
+    def __repr__(self):
+        return "NegotiatedOptions(version={!r}, codec={!r}, compression={!r}, max_frame_size={!r})".format(
+            self.version, self.codec.name, self.compression, self.max_frame_size
+        )
+
+
+def handshake_hello(codecs, compression_dictionary_id, max_frame_size):
+    """
+    Build the hello a message duct created with handshake=True sends to the other end.
+
+    :param codecs: The names of the codecs to offer, fastest first. Names that aren't registered are left out.
+    :type codecs: tuple | list
+    :param compression_dictionary_id: The id of the duct's compression dictionary, if it was given one.
+    :type compression_dictionary_id: int | None
+    :param max_frame_size: The largest frame the duct accepts, if there's a limit.
+    :type max_frame_size: int | None
+    :return: The serialized hello.
+    :rtype: bytes
+    """
+    return default_serializer({
+        'version': HANDSHAKE_VERSION,
+        'codecs': [name for name in codecs if name in CODECS],
+        'compression': list(SUPPORTED_COMPRESSION),
+        'compression_dictionary': compression_dictionary_id,
+        'max_frame_size': max_frame_size,
+    })
+
+
+def negotiate_options(codecs, peer_hello, leads_handshake, compression_dictionary_id, max_frame_size):
+    """
+    Work out what both ends of a duct agree on, given the other end's hello. Both ends must arrive at the same
+    answer, so the order of preference of the end leading the handshake (the parent) always wins.
+
+    A MessageProtocolException is raised if the two ends have no handshake version or codec in common, or were given
+    different compression dictionaries.
+
+    :param codecs: The names of the codecs this end offered, fastest first.
+    :type codecs: tuple | list
+    :param peer_hello: The other end's deserialized hello.
+    :type peer_hello: dict
+    :param leads_handshake: Whether this end's order of preference wins.
+    :type leads_handshake: bool
+    :param compression_dictionary_id: The id of this end's compression dictionary, if it was given one.
+    :type compression_dictionary_id: int | None
+    :param max_frame_size: The largest frame this end accepts, if there's a limit.
+    :type max_frame_size: int | None
+    :return: What the two ends agreed on.
+    :rtype: NegotiatedOptions
+    """
+    version = min(HANDSHAKE_VERSION, int(peer_hello.get('version', 0)))
+    if version < 1:
+        raise MessageProtocolException("The other end doesn't speak a compatible handshake version!")
+    own_codecs = [name for name in codecs if name in CODECS]
+    peer_codecs = list(peer_hello.get('codecs', ()))
+    own_compression = list(SUPPORTED_COMPRESSION)
+    peer_compression = list(peer_hello.get('compression', ()))
+    if not leads_handshake:
+        own_codecs, peer_codecs = peer_codecs, own_codecs
+        own_compression, peer_compression = peer_compression, own_compression
+    codec_name = next((name for name in own_codecs if name in peer_codecs), None)
+    if codec_name is None:
+        raise MessageProtocolException("No codec in common with the other end! Offered: {}, other end offered: "
+                                       "{}".format(own_codecs, peer_codecs))
+    compression = next((method for method in own_compression if method in peer_compression), None)
+    if compression is not None and peer_hello.get('compression_dictionary') != compression_dictionary_id:
+        raise MessageProtocolException("The other end was given a different compression dictionary!")
+    frame_size_limits = [limit for limit in (max_frame_size, peer_hello.get('max_frame_size')) if limit is not None]
+    return NegotiatedOptions(version, CODECS[codec_name], compression,
+                             min(frame_size_limits) if frame_size_limits else None)
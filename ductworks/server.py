@@ -0,0 +1,452 @@
+import collections
+import itertools
+import logging
+import queue
+import selectors
+import socket
+import threading
+import time
+from tempfile import NamedTemporaryFile
+
+from ductworks.base_duct import unix_domain_socket_constructor, unix_domain_socket_listener_destructor, \
+    tcp_socket_constructor, tcp_socket_listener_destructor, client_socket_destructor, IOV_MAX, \
+    random_abstract_namespace_address, ABSTRACT_NAMESPACE_SUPPORTED, DuctworksException
+from ductworks.framing import FrameReader, MessageProtocolException, pack_frame_header
+from ductworks.serialization import default_serializer, default_deserializer, serialized_buffers, serialized_length
+
+logger = logging.getLogger(__name__)
+
+# The highest resolution monotonic clock available.
+clock = getattr(time, 'monotonic', time.time)
+
+
+class UnknownClientException(DuctworksException):
+    """
+    This exception is thrown when a DuctServer is asked to talk to a client id that isn't (or is no longer) connected.
+    """
+    pass
+
+
+class DuctClientConnection(object):
+    """
+    The server side of a single child duct connected to a DuctServer. Whatever the socket won't take right away is
+    kept on the outgoing queue (under the send lock) until the server's selector says the socket is writable again.
+    """
+
+    def __init__(self, client_id, conn_socket, address, recv_buffer_size=FrameReader.DEFAULT_BUFFER_SIZE):
+        self.client_id = client_id
+        self.conn_socket = conn_socket
+        self.address = address
+        self.frame_reader = FrameReader(conn_socket, recv_buffer_size)
+        self.send_lock = threading.Lock()
+        self.outgoing = collections.deque()
+        self.last_send_progress = clock()
+        self.waiting_to_write = False
+
+    def fileno(self):
+        return self.conn_socket.fileno()
+
+    def write_outgoing(self):
+        """
+        Write as much of the outgoing queue as the socket will take without blocking. The send lock must be held.
+
+        :return: True if the outgoing queue is now empty, False otherwise.
+        :rtype: bool
+        """
+        outgoing = self.outgoing
+        while outgoing:
+            try:
+                bytes_sent = self.conn_socket.sendmsg(list(itertools.islice(outgoing, IOV_MAX)))
+            except (BlockingIOError, InterruptedError):
+                return False
+            if bytes_sent:
+                self.last_send_progress = clock()
+            while bytes_sent:
+                head_len = len(outgoing[0])
+                if bytes_sent >= head_len:
+                    bytes_sent -= head_len
+                    outgoing.popleft()
+                else:
+                    outgoing[0] = outgoing[0][bytes_sent:]
+                    bytes_sent = 0
+        return True
+
+    def queue_outgoing(self, buffers):
+        """
+        Send a list of buffers, writing what the socket takes right away and queueing a copy of the rest.
+        The send lock must be held.
+
+        :param buffers: The bytes-like objects to send, in order.
+        :type buffers: list
+        :return: True if everything was written, False if some of it is still queued.
+        :rtype: bool
+        """
+        was_empty = not self.outgoing
+        for buff in buffers:
+            view = memoryview(buff)
+            if view.ndim != 1 or view.itemsize != 1:
+                view = view.cast('B')
+            if view:
+                self.outgoing.append(view)
+        if was_empty:
+            self.last_send_progress = clock()
+            if self.write_outgoing():
+                return True
+        # The caller is free to reuse its buffers as soon as this returns, so keep our own copy of what's left.
+        for i, view in enumerate(self.outgoing):
+            if not isinstance(view.obj, bytes):
+                self.outgoing[i] = memoryview(view.tobytes())
+        return False
+
+
+class DuctServer(object):
+    """
+    The DuctServer keeps a single Unix Domain or TCP listener open and accepts any number of child message ducts
+    (MessageDuctChild, AsyncMessageDuctChild, or anything else speaking the message duct protocol) on it. Unlike
+    a MessageDuctParent, which accepts exactly one connection, the server multiplexes every connection from a single
+    thread with the selectors module (epoll on Linux, kqueue on the BSDs), so it scales to thousands of children
+    without needing a thread per connection.
+
+    Every connection is given an integer client id. Received messages are handed to the message handler as
+    handler(client_id, payload), or if no handler is given, are put on the message queue as (client_id, payload)
+    tuples. Replies are sent with send(client_id, payload). A client whose message can't be deserialized, or makes
+    the message (or connect) handler raise, is logged and disconnected, without affecting any other client.
+
+    Client sockets are non-blocking. Whatever a client isn't ready to receive yet is queued for it and written out
+    by the serving thread as the client catches up, so a slow client never holds up any other. A client that
+    doesn't accept any of its queued data for longer than the timeout is disconnected.
+    """
+
+    DEFAULT_TIMEOUT = 30
+    DEFAULT_LISTEN_QUEUE_DEPTH = socket.SOMAXCONN
+
+    def __init__(self, bind_address, message_handler=None, message_queue=None, connect_handler=None,
+                 disconnect_handler=None, serialize=default_serializer, deserialize=default_deserializer,
+                 server_listener_socket_constructor=unix_domain_socket_constructor,
+                 server_listener_socket_destructor=unix_domain_socket_listener_destructor,
+                 server_connection_socket_destructor=client_socket_destructor, timeout=DEFAULT_TIMEOUT,
+                 recv_buffer_size=FrameReader.DEFAULT_BUFFER_SIZE):
+        self.bind_address = bind_address
+        self.message_handler = message_handler
+        if message_queue is None and message_handler is None:
+            message_queue = queue.Queue()
+        self.message_queue = message_queue
+        self.connect_handler = connect_handler
+        self.disconnect_handler = disconnect_handler
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.server_listener_socket_constructor = server_listener_socket_constructor
+        self.server_listener_socket_destructor = server_listener_socket_destructor
+        self.server_connection_socket_destructor = server_connection_socket_destructor
+        self.socket_timeout = timeout
+        self.recv_buffer_size = recv_buffer_size
+        self.listener_address = None
+        self.listener_socket = None
+        self.selector = selectors.DefaultSelector()
+        self.clients = {}
+        self._next_client_id = 0
+        self._shutdown_event = threading.Event()
+        # Sends from other threads hand clients with newly queued data to the serving thread through here, and
+        # write to the wakeup socket so a select() in progress notices.
+        self._write_requests = collections.deque()
+        self._waiting_writers = set()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ, self._write_requests)
+
+    @classmethod
+    def psuedo_anonymous_server(cls, bind_address=None, abstract_namespace=False, **kwargs):
+        """
+        Create a new psuedo-anonymous duct server with Unix Domain sockets.
+
+        :param bind_address: The (filesystem) address to listen on, if any. If None a new random address will be
+            chosen. Default: None.
+        :type bind_address: basestring | None
+        :param abstract_namespace: If True and no bind address is given, pick a random address in the Linux
+            abstract namespace instead of the filesystem. Other platforms fall back to a filesystem address.
+            Default: False
+        :type abstract_namespace: bool
+        :param kwargs: Any other arguments to give to the DuctServer constructor.
+        :return: A new DuctServer.
+        :rtype: ductworks.server.DuctServer
+        """
+        if bind_address is None and abstract_namespace and ABSTRACT_NAMESPACE_SUPPORTED:
+            bind_address = random_abstract_namespace_address()
+        elif bind_address is None:
+            tmp = NamedTemporaryFile()
+            bind_address = tmp.name
+            tmp.close()
+        return cls(bind_address, **kwargs)
+
+    @classmethod
+    def psuedo_anonymous_tcp_server(cls, bind_address='localhost', bind_port=0, **kwargs):
+        """
+        Create a new psuedo-anonymous duct server with TCP sockets.
+
+        :param bind_address: The interface address to listen on, if any. Default: 'localhost'.
+        :type bind_address: basestring
+        :param bind_port: The port to bind the interface to. If 0, pick the a random open port. Default: 0.
+        :type bind_port: int
+        :param kwargs: Any other arguments to give to the DuctServer constructor.
+        :return: A new DuctServer.
+        :rtype: ductworks.server.DuctServer
+        """
+        kwargs.setdefault('server_listener_socket_constructor', tcp_socket_constructor)
+        kwargs.setdefault('server_listener_socket_destructor', tcp_socket_listener_destructor)
+        return cls((bind_address, bind_port), **kwargs)
+
+    def bind(self, listen_queue_depth=DEFAULT_LISTEN_QUEUE_DEPTH):
+        """
+        Create and bind the listener socket, if this hasn't been done already.
+
+        :param listen_queue_depth: The queue depth for the listener socket. Default: socket.SOMAXCONN
+        :type listen_queue_depth: int
+        :return: None
+        """
+        if self.listener_socket is None:
+            self.listener_socket = self.server_listener_socket_constructor()
+            self.listener_socket.bind(self.bind_address)
+            self.listener_address = self.listener_socket.getsockname()
+            self.listener_socket.listen(listen_queue_depth)
+            self.listener_socket.setblocking(False)
+            self.selector.register(self.listener_socket, selectors.EVENT_READ, None)
+
+    def _accept(self):
+        while True:
+            try:
+                conn_socket, address = self.listener_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn_socket.setblocking(False)
+            client_id = self._next_client_id
+            self._next_client_id += 1
+            client = DuctClientConnection(client_id, conn_socket, address, self.recv_buffer_size)
+            self.clients[client_id] = client
+            self.selector.register(conn_socket, selectors.EVENT_READ, client)
+            if self.connect_handler is not None:
+                try:
+                    self.connect_handler(client_id)
+                except Exception:
+                    logger.exception("The connect handler failed for client %s; disconnecting it.", client_id)
+                    self.disconnect(client_id)
+
+    def _dispatch(self, client_id, payload):
+        if self.message_handler is not None:
+            self.message_handler(client_id, payload)
+        else:
+            self.message_queue.put((client_id, payload))
+
+    def _service(self, client):
+        try:
+            num_bytes_received = client.frame_reader.receive()
+        except (BlockingIOError, InterruptedError, socket.timeout):
+            return
+        except OSError:
+            num_bytes_received = 0
+        if not num_bytes_received:
+            self.disconnect(client.client_id)
+            return
+        frame_reader = client.frame_reader
+        deserialize = self.deserialize
+        while True:
+            try:
+                frame = frame_reader.next_buffered_frame()
+            except MessageProtocolException:
+                # There's no way to find the next message boundary again, so drop the misbehaving client.
+                self.disconnect(client.client_id)
+                return
+            if frame is None:
+                break
+            flags, serialized_payload = frame
+            if flags:
+                # The server only speaks plain frames (no shared memory or other extensions).
+                self.disconnect(client.client_id)
+                return
+            try:
+                self._dispatch(client.client_id, deserialize(serialized_payload))
+            except Exception:
+                # Only the client that sent the message is dropped; the rest are still served.
+                logger.exception("Failed to handle a message from client %s; disconnecting it.", client.client_id)
+                self.disconnect(client.client_id)
+                return
+
+    def serve_once(self, timeout=None):
+        """
+        Wait for activity on the listener or any client connection, accept new clients, and dispatch every
+        message that has been fully received.
+
+        :param timeout: The longest time to wait for activity. If None, wait indefinitely. Default: None
+        :type timeout: int | float | None
+        :return: The number of sockets that had activity.
+        :rtype: int
+        """
+        if self.listener_socket is None:
+            self.bind()
+        self._watch_writers()
+        events = self.selector.select(timeout)
+        for key, mask in events:
+            if key.data is None:
+                self._accept()
+            elif key.data is self._write_requests:
+                self._drain_wakeups()
+            else:
+                if mask & selectors.EVENT_WRITE:
+                    self._flush(key.data)
+                if mask & selectors.EVENT_READ:
+                    self._service(key.data)
+        self._watch_writers()
+        self._drop_stalled_writers()
+        return len(events)
+
+    def _drain_wakeups(self):
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _watch_writers(self):
+        # Start watching for writability on every client that has had data queued since the last pass.
+        while self._write_requests:
+            client = self._write_requests.popleft()
+            if self.clients.get(client.client_id) is client:
+                self._waiting_writers.add(client)
+                self.selector.modify(client.conn_socket, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def _flush(self, client):
+        try:
+            with client.send_lock:
+                if not client.write_outgoing():
+                    return
+                # Checked and cleared under the send lock, so a send racing with this always asks to be watched again.
+                client.waiting_to_write = False
+                self._waiting_writers.discard(client)
+                self.selector.modify(client.conn_socket, selectors.EVENT_READ, client)
+        except OSError:
+            self.disconnect(client.client_id)
+
+    def _drop_stalled_writers(self):
+        if self.socket_timeout is None:
+            return
+        deadline = clock() - self.socket_timeout
+        for client in list(self._waiting_writers):
+            if client.last_send_progress < deadline:
+                logger.warning("Client %s hasn't accepted any data in %s seconds; disconnecting it.",
+                               client.client_id, self.socket_timeout)
+                self.disconnect(client.client_id)
+
+    def _send_buffers(self, client, buffers):
+        with client.send_lock:
+            if client.queue_outgoing(buffers) or client.waiting_to_write:
+                return
+            client.waiting_to_write = True
+            self._write_requests.append(client)
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # The wakeup socket is already full of unread wakeups, so the serving thread will be up soon anyway.
+            pass
+
+    def serve_forever(self, poll_interval=0.5):
+        """
+        Serve clients until shutdown() is called from another thread.
+
+        :param poll_interval: How often to check for a shutdown request, in seconds. Default: 0.5
+        :type poll_interval: int | float
+        :return: None
+        """
+        self._shutdown_event.clear()
+        while not self._shutdown_event.is_set():
+            self.serve_once(poll_interval)
+
+    def shutdown(self):
+        """
+        Ask a running serve_forever() loop to stop after its current iteration.
+
+        :return: None
+        """
+        self._shutdown_event.set()
+
+    def _get_client(self, client_id):
+        try:
+            return self.clients[client_id]
+        except KeyError:
+            raise UnknownClientException("No client with id {} is connected!".format(client_id))
+
+    def send(self, client_id, payload):
+        """
+        Send a payload to a connected client. This is safe to call from any thread, and never blocks: whatever the
+        client isn't ready to receive yet is queued, and written out by the serving thread.
+
+        An UnknownClientException is raised if no client with the given id is connected.
+
+        :param client_id: The id of the client to send to.
+        :type client_id: int
+        :param payload: A serializable Python object to send to the client.
+        :return: None
+        """
+        client = self._get_client(client_id)
+        serialized_payload = self.serialize(payload)
+        buffers = [pack_frame_header(serialized_length(serialized_payload))] + serialized_buffers(serialized_payload)
+        self._send_buffers(client, buffers)
+
+    def broadcast(self, payload):
+        """
+        Send a payload to every connected client, serializing it only once. Like send(), this never blocks on a
+        slow client. Clients whose connection has failed are disconnected.
+
+        :param payload: A serializable Python object to send to the clients.
+        :return: None
+        """
+        serialized_payload = self.serialize(payload)
+        buffers = [pack_frame_header(serialized_length(serialized_payload))] + serialized_buffers(serialized_payload)
+        for client in list(self.clients.values()):
+            try:
+                self._send_buffers(client, buffers)
+            except OSError:
+                self.disconnect(client.client_id)
+
+    def disconnect(self, client_id):
+        """
+        Close the connection to a client, if it's still connected.
+
+        :param client_id: The id of the client to disconnect.
+        :type client_id: int
+        :return: None
+        """
+        client = self.clients.pop(client_id, None)
+        if client is None:
+            return
+        try:
+            self.selector.unregister(client.conn_socket)
+        except (KeyError, ValueError):
+            pass
+        self._waiting_writers.discard(client)
+        with client.send_lock:
+            client.outgoing.clear()
+        self.server_connection_socket_destructor(client.conn_socket)
+        if self.disconnect_handler is not None:
+            self.disconnect_handler(client_id)
+
+    def close(self):
+        """
+        Close the listener, every client connection, and the selector. Any data still queued for a client is
+        dropped.
+
+        :return: None
+        """
+        for client_id in list(self.clients):
+            self.disconnect(client_id)
+        if self.listener_socket is not None:
+            self.selector.unregister(self.listener_socket)
+            self.server_listener_socket_destructor(self.listener_socket)
+            self.listener_socket = None
+        if self._wakeup_recv is not None:
+            self.selector.close()
+            self._wakeup_recv.close()
+            self._wakeup_send.close()
+            self._wakeup_recv = self._wakeup_send = None
+
+    def __del__(self):
+        self.close()
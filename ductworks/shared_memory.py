@@ -0,0 +1,129 @@
+import os
+import mmap
+import struct
+import tempfile
+
+from ductworks.base_duct import FD_PASSING_SUPPORTED, DuctworksException
+
+# Large payloads are moved through shared memory by handing the segment itself (an open file descriptor) to the
+# other end of a Unix Domain socket, so this only works where descriptors can be passed.
+SHARED_MEMORY_SUPPORTED = FD_PASSING_SUPPORTED
+
+# Where segments are created on platforms without memfd_create(2); a tmpfs mount if there is one.
+SHARED_MEMORY_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# The body of a shared memory frame: the size of the payload held by the segment sent alongside it.
+SHARED_MEMORY_DESCRIPTOR_FORMAT = '!Q'
+SHARED_MEMORY_DESCRIPTOR_SIZE = struct.calcsize(SHARED_MEMORY_DESCRIPTOR_FORMAT)
+
+
+class SharedMemoryException(DuctworksException):
+    """
+    This exception is thrown when a shared memory segment can't be created, or when one received from the other
+    end of a duct doesn't match its descriptor.
+    """
+    pass
+
+
+def _create_anonymous_file(name):
+    if hasattr(os, 'memfd_create'):
+        return os.memfd_create(name, os.MFD_CLOEXEC)
+    fd, path = tempfile.mkstemp(prefix=name + '-', dir=SHARED_MEMORY_DIRECTORY)
+    # Nothing ever needs to find the segment by name, so it is unlinked right away; it lives exactly as long as
+    # some process holds a descriptor or a mapping of it.
+    os.unlink(path)
+    return fd
+
+
+def create_shared_memory_segment(serialized_payload, name='ductworks'):
+    """
+    Copy a serialized payload into a new anonymous shared memory segment. The segment has no name on the
+    filesystem; it is freed by the kernel as soon as every descriptor for it is closed and every mapping of it is
+    released, so it can never outlive the processes using it.
+
+    :param serialized_payload: The bytes-like payload to copy into the segment, or a list of bytes-like pieces to
+        copy in back to back. Must not be empty.
+    :type serialized_payload: bytes | bytearray | memoryview | list
+    :param name: A name for the segment, only used for debugging (it shows up in /proc/<pid>/fd). Default: 'ductworks'
+    :type name: str
+    :return: An open file descriptor for the segment, which the caller must close.
+    :rtype: int
+    """
+    if not isinstance(serialized_payload, (list, tuple)):
+        serialized_payload = [serialized_payload]
+    views = []
+    for buff in serialized_payload:
+        view = memoryview(buff)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        views.append(view)
+    segment_size = sum(len(view) for view in views)
+    if not segment_size:
+        raise SharedMemoryException("Can't create an empty shared memory segment!")
+    fd = _create_anonymous_file(name)
+    try:
+        os.ftruncate(fd, segment_size)
+        segment_map = mmap.mmap(fd, segment_size)
+        try:
+            offset = 0
+            for view in views:
+                segment_map[offset:offset + len(view)] = view
+                offset += len(view)
+        finally:
+            segment_map.close()
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+def map_shared_memory_segment(fd, size):
+    """
+    Map a shared memory segment received from the other end of a duct and take ownership of it. The descriptor is
+    always closed; the returned memoryview reads straight from the shared pages without copying them, and the
+    segment is released once the memoryview (and everything sliced from it) is garbage collected.
+
+    :param fd: The file descriptor for the segment, as received from the other end.
+    :type fd: int
+    :param size: The size of the payload held by the segment, from its descriptor.
+    :type size: int
+    :return: A writable view over the payload.
+    :rtype: memoryview
+    """
+    try:
+        segment_size = os.fstat(fd).st_size
+        if segment_size < size:
+            raise SharedMemoryException("Received a {} byte shared memory segment for a {} byte payload!"
+                                        "".format(segment_size, size))
+        # A private mapping is writable but never changes the segment itself, so it doesn't matter if the sender
+        # still holds a descriptor for it.
+        segment_map = mmap.mmap(fd, size, flags=mmap.MAP_PRIVATE)
+    finally:
+        os.close(fd)
+    return memoryview(segment_map)
+
+
+def pack_shared_memory_descriptor(size):
+    """
+    Build the body of a shared memory frame for a segment holding a payload of the given size.
+
+    :param size: The size of the payload held by the segment.
+    :type size: int
+    :return: The packed descriptor.
+    :rtype: bytes
+    """
+    return struct.pack(SHARED_MEMORY_DESCRIPTOR_FORMAT, size)
+
+
+def unpack_shared_memory_descriptor(descriptor):
+    """
+    Read the payload size back out of the body of a shared memory frame.
+
+    :param descriptor: The packed descriptor.
+    :return: The size of the payload held by the segment.
+    :rtype: int
+    """
+    if len(descriptor) != SHARED_MEMORY_DESCRIPTOR_SIZE:
+        raise SharedMemoryException("Malformed shared memory descriptor!")
+    size, = struct.unpack(SHARED_MEMORY_DESCRIPTOR_FORMAT, descriptor)
+    return size
@@ -1,9 +1,12 @@
 from ductworks.message_duct import MessageDuctChild
 import sys
 
-connect_address = sys.argv[1]
-child_duct = MessageDuctChild.psuedo_anonymous_child_duct(connect_address)
-child_duct.connect()
+if len(sys.argv) > 1:
+    connect_address = sys.argv[1]
+    child_duct = MessageDuctChild.psuedo_anonymous_child_duct(connect_address)
+    child_duct.connect()
+else:
+    child_duct = MessageDuctChild.from_inherited_fd()
 while True:
     if child_duct.poll(0.01):
         received_payload = child_duct.recv()
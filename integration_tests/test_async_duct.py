@@ -0,0 +1,154 @@
+from unittest import TestCase
+from unittest.mock import patch
+from assertpy import assert_that
+import asyncio
+import json
+import os
+import struct
+
+from ductworks.async_duct import AsyncMessageDuctParent, AsyncMessageDuctChild, \
+    create_psuedo_anonymous_async_duct_pair
+from ductworks.message_duct import MessageDuctParent, MessageDuctChild, MessageProtocolException, FrameReader, \
+    EXTENDED_MAGIC_BYTE, FRAME_FLAG_WIDE_LENGTH, PRIORITY_HIGH
+
+
+class AsyncMessageDuctIntegrationTest(TestCase):
+    def test_basic_async_message_passing(self):
+        """
+        As a Python developer,
+        I want to be able to create an asyncio message duct pair and await sends and receives,
+        so that my asyncio services don't need to hop through threads to talk to other processes.
+        """
+        async def scenario():
+            parent, child = await create_psuedo_anonymous_async_duct_pair()
+            bind_address = parent.bind_address
+            assert_that(os.path.exists(bind_address)).is_false()
+            await parent.send(["hello world", 42])
+            assert_that(await child.recv()).is_equal_to(["hello world", 42])
+            await child.send_many(range(10))
+            await child.close()
+            received = [message async for message in parent]
+            assert_that(received).is_equal_to(list(range(10)))
+            await parent.close()
+
+        asyncio.run(scenario())
+
+    def test_async_tcp_message_passing(self):
+        """
+        As a Python developer,
+        I want asyncio ducts to work over TCP too,
+        so that my asyncio services can talk to remote systems.
+        """
+        async def scenario():
+            parent = AsyncMessageDuctParent.psuedo_anonymous_tcp_parent_duct()
+            await parent.bind()
+            child = AsyncMessageDuctChild.psuedo_anonymous_tcp_child_duct(*parent.listener_address)
+            await child.connect()
+            assert_that(await parent.listen()).is_true()
+            await child.send("bob saget")
+            assert_that(await parent.recv()).is_equal_to("bob saget")
+            await child.close()
+            await parent.close()
+
+        asyncio.run(scenario())
+
+    def test_sync_and_async_interop(self):
+        """
+        As a Python developer,
+        I want asyncio ducts to speak the same wire protocol as regular message ducts,
+        so that a synchronous process and an asyncio process can talk to each other.
+        """
+        async def scenario():
+            async_parent = AsyncMessageDuctParent.psuedo_anonymous_parent_duct()
+            await async_parent.bind()
+            sync_child = MessageDuctChild.psuedo_anonymous_child_duct(async_parent.listener_address)
+            sync_child.connect()
+            assert_that(await async_parent.listen()).is_true()
+            sync_child.send({"from": "sync"})
+            assert_that(await async_parent.recv()).is_equal_to({"from": "sync"})
+            await async_parent.send({"from": "async"})
+            assert_that(sync_child.recv()).is_equal_to({"from": "async"})
+            sync_child.close()
+            await async_parent.close()
+
+            sync_parent = MessageDuctParent.psuedo_anonymous_parent_duct()
+            sync_parent.bind()
+            async_child = AsyncMessageDuctChild.psuedo_anonymous_child_duct(sync_parent.listener_address)
+            await async_child.connect()
+            assert_that(sync_parent.listen()).is_true()
+            await async_child.send("ping")
+            assert_that(sync_parent.recv()).is_equal_to("ping")
+            sync_parent.send("pong")
+            assert_that(await async_child.recv()).is_equal_to("pong")
+            await async_child.close()
+            sync_parent.close()
+
+        asyncio.run(scenario())
+
+    def test_extended_frames_between_sync_and_async(self):
+        """
+        As a Python developer,
+        I want asyncio ducts to read the extended envelopes synchronous ducts send (compressed, high priority and
+        wide frames), and to send wide frames themselves, so that mixing the two never corrupts the stream.
+        """
+        async def scenario():
+            sync_parent = MessageDuctParent.psuedo_anonymous_parent_duct(compression_threshold=64)
+            sync_parent.bind()
+            async_child = AsyncMessageDuctChild.psuedo_anonymous_child_duct(sync_parent.listener_address)
+            await async_child.connect()
+            assert_that(sync_parent.listen()).is_true()
+
+            sync_parent.send("compress me " * 100)
+            assert_that(await async_child.recv()).is_equal_to("compress me " * 100)
+            assert_that(sync_parent.compression_stats.frames_compressed).is_equal_to(1)
+            sync_parent.send("urgent", priority=PRIORITY_HIGH)
+            assert_that(await async_child.recv()).is_equal_to("urgent")
+            body = json.dumps("wide").encode('utf-8')
+            sync_parent.socket_duct.sendmsg_all([struct.pack(FrameReader.WIDE_HEADER_FORMAT, EXTENDED_MAGIC_BYTE,
+                                                             FRAME_FLAG_WIDE_LENGTH, len(body)), body])
+            assert_that(await async_child.recv()).is_equal_to("wide")
+
+            # Frames over 4 GiB are too much for a test; make every frame count as one instead.
+            with patch('ductworks.framing.MAX_NARROW_FRAME_SIZE', 0):
+                await async_child.send_many(["wide", "and", "wider"])
+            assert_that(sync_parent.recv_many()).is_equal_to(["wide", "and", "wider"])
+
+            sync_parent.channel(1).send("on a channel")
+            with self.assertRaises(MessageProtocolException):
+                await async_child.recv()
+            await async_child.close()
+            sync_parent.close()
+
+        asyncio.run(scenario())
+
+    def test_max_frame_size(self):
+        """
+        As a Python developer,
+        I want an asyncio duct to refuse frames larger than a limit I set, before reading them into memory,
+        so that a misbehaving peer can't make my service allocate however much its frame header claims.
+        """
+        async def scenario():
+            parent, child = await create_psuedo_anonymous_async_duct_pair(max_frame_size=1024)
+            await parent.send("x" * 100)
+            assert_that(await child.recv()).is_equal_to("x" * 100)
+            await parent.send("x" * 2048)
+            with self.assertRaises(MessageProtocolException):
+                await child.recv()
+            await parent.close()
+            await child.close()
+
+            sync_parent = MessageDuctParent.psuedo_anonymous_parent_duct()
+            sync_parent.bind()
+            async_child = AsyncMessageDuctChild.psuedo_anonymous_child_duct(sync_parent.listener_address,
+                                                                            max_frame_size=1024)
+            await async_child.connect()
+            assert_that(sync_parent.listen()).is_true()
+            # Only the header is ever sent; the limit has to be enforced without waiting for a 1 TiB body.
+            sync_parent.socket_duct.sendmsg_all([struct.pack(FrameReader.WIDE_HEADER_FORMAT, EXTENDED_MAGIC_BYTE,
+                                                             FRAME_FLAG_WIDE_LENGTH, 1 << 40)])
+            with self.assertRaises(MessageProtocolException):
+                await asyncio.wait_for(async_child.recv(), 5)
+            await async_child.close()
+            sync_parent.close()
+
+        asyncio.run(scenario())
@@ -8,8 +8,20 @@ import subprocess
 import sys
 import multiprocessing
 import errno
+import socket
+import pickle
+import json
+import struct
 
-from ductworks.message_duct import MessageDuctParent, MessageDuctChild, create_psuedo_anonymous_duct_pair
+from ductworks.message_duct import MessageDuctParent, MessageDuctChild, create_psuedo_anonymous_duct_pair, wait, \
+    create_anonymous_duct_pair, create_anonymous_seqpacket_duct_pair, spawn_with_duct, pickle5_serializer, \
+    pickle5_deserializer, PICKLE5_SUPPORTED, MessageProtocolException, tagged_serializer, tagged_deserializer, \
+    WriteQueueFull, WRITE_QUEUE_RAISE, WRITE_QUEUE_DROP_OLDEST, PRIORITY_HIGH, PRIORITY_NORMAL, FrameReader, \
+    pack_frame_header, parse_frame_header, EXTENDED_MAGIC_BYTE, FRAME_FLAG_COMPRESSED, FRAME_FLAG_WIDE_LENGTH, \
+    lock_like
+from ductworks.base_duct import ABSTRACT_NAMESPACE_SUPPORTED, RawDuctChild
+from ductworks.compression import train_compression_dictionary
+from ductworks.metrics import DEFAULT_METRICS_REGISTRY
 
 from integration_tests import SUBPROCESS_TEST_SCRIPT, ROOT_DIR
 
@@ -30,6 +42,128 @@ class MessageDuctIntegrationTest(TestCase):
         parent.close()
         assert_that(os.path.exists(bind_address)).is_false()
 
+    def test_socketpair_message_passing(self):
+        """
+        As a Python developer,
+        I want to be able to create a connected duct pair instantly, without touching the filesystem,
+        so that creating lots of short lived duct pairs is cheap.
+        """
+        parent, child = create_anonymous_duct_pair()
+        parent.send(["hello world", 42])
+        assert_that(child.recv()).is_equal_to(["hello world", 42])
+        child.send("hello this is dog")
+        assert_that(parent.poll(1)).is_true()
+        assert_that(parent.recv()).is_equal_to("hello this is dog")
+        child.close()
+        self.assertRaises(EOFError, parent.recv)
+        parent.close()
+
+    def test_abstract_namespace_message_passing(self):
+        """
+        As a Python developer,
+        I want to be able to bind parent ducts to addresses in the Linux abstract namespace,
+        so that binding and connecting never create or remove files.
+        """
+        if not ABSTRACT_NAMESPACE_SUPPORTED:
+            self.skipTest("Abstract namespace sockets are only supported on Linux.")
+        parent = MessageDuctParent.psuedo_anonymous_parent_duct(abstract_namespace=True)
+        parent.bind()
+        assert_that(parent.listener_address[:1]).is_equal_to(b"\0")
+        child = MessageDuctChild.psuedo_anonymous_child_duct(parent.listener_address)
+        child.connect()
+        assert_that(parent.listen()).is_true()
+        parent.send("abstract")
+        assert_that(child.recv()).is_equal_to("abstract")
+        child.close()
+        parent.close()
+
+    def test_child_connects_before_parent_binds(self):
+        """
+        As a Python developer,
+        I want a child duct that starts connecting before its parent is ready to connect as soon as the parent is,
+        so that my worker pools come up in milliseconds rather than seconds.
+        """
+        for wait_for_path in (True, False):
+            parent = MessageDuctParent.psuedo_anonymous_parent_duct()
+            raw_child = RawDuctChild(parent.bind_address)
+            connect_times = []
+
+            def child_target():
+                raw_child.connect(wait_for_path=wait_for_path)
+                connect_times.append(time.time())
+
+            t = threading.Thread(target=child_target)
+            t.start()
+            time.sleep(0.25)
+            bind_time = time.time()
+            parent.bind()
+            assert_that(parent.listen()).is_true()
+            t.join()
+            assert_that(connect_times[0] - bind_time).is_less_than(0.5)
+            raw_child.close()
+            parent.close()
+
+    def test_connect_deadline(self):
+        """
+        As a Python developer,
+        I want connecting to a parent that never shows up to fail after a bounded amount of time,
+        so that my workers don't hang forever waiting on a dead parent.
+        """
+        child = MessageDuctChild.psuedo_anonymous_child_duct(os.path.join(ROOT_DIR, "no-such-duct"))
+        start_time = time.time()
+        try:
+            child.socket_duct.connect(connect_timeout=0.2)
+        except (IOError, OSError) as e:
+            assert_that(e.errno).is_equal_to(errno.ENOENT)
+        else:
+            raise AssertionError("Connecting to a missing duct should have failed!")
+        assert_that(time.time() - start_time).is_between(0.2, 2)
+        # The old fixed retry schedule can still be asked for.
+        start_time = time.time()
+        with self.assertRaises((IOError, OSError)):
+            child.socket_duct.connect(RawDuctChild.DEFAULT_CONNECT_RETRY_COUNT, 0.1, wait_for_path=False)
+        assert_that(time.time() - start_time).is_between(0.3, 2)
+
+    def test_seqpacket_message_passing(self):
+        """
+        As a Python developer,
+        I want to be able to send messages over sequenced-packet sockets, big and small,
+        so that messages that fit in a packet are sent and received with a single syscall each.
+        """
+        if not hasattr(socket, 'SOCK_SEQPACKET'):
+            self.skipTest("SOCK_SEQPACKET sockets aren't supported on this platform.")
+        parent = MessageDuctParent.psuedo_anonymous_seqpacket_parent_duct(packet_size=4096)
+        parent.bind()
+        child = MessageDuctChild.psuedo_anonymous_seqpacket_child_duct(parent.listener_address, packet_size=4096)
+        child.connect()
+        assert_that(parent.listen()).is_true()
+        big_string = "lol" * 1024 * 128
+
+        def child_target():
+            child.send_many([{"seq": i} for i in range(20)])
+            child.send(big_string)
+            child.send("small")
+
+        t = threading.Thread(target=child_target)
+        t.start()
+        received = []
+        while len(received) < 20:
+            received.extend(parent.recv_many(max_count=20 - len(received), timeout=5))
+        assert_that(received).is_equal_to([{"seq": i} for i in range(20)])
+        assert_that(parent.recv()).is_equal_to(big_string)
+        assert_that(parent.recv()).is_equal_to("small")
+        t.join()
+        child.close()
+        self.assertRaises(EOFError, parent.recv)
+        parent.close()
+
+        parent, child = create_anonymous_seqpacket_duct_pair()
+        parent.send(["hello world", 42])
+        assert_that(child.poll(1)).is_true()
+        assert_that(child.recv()).is_equal_to(["hello world", 42])
+        child.close()
+        parent.close()
+
     def test_tcp_message_passing(self):
         """
         As a Python developer,
@@ -70,6 +204,378 @@ class MessageDuctIntegrationTest(TestCase):
         parent.close()
         assert_that(os.path.exists(bind_address)).is_false()
 
+    def test_large_binary_message(self):
+        """
+        As a Python developer,
+        I want multi-megabyte payloads to be written straight from my serialized buffer to the socket,
+        so that sending large messages doesn't cost an extra copy of the whole payload.
+        """
+        big_payload = os.urandom(1024 * 1024) * 24
+
+        parent, child = create_psuedo_anonymous_duct_pair(serialize=bytes, deserialize=bytes)
+
+        def parent_target():
+            parent.send(big_payload)
+
+        t = threading.Thread(target=parent_target)
+        t.start()
+
+        assert_that(child.recv() == big_payload).is_true()
+        t.join()
+        child.close()
+        parent.close()
+
+    def test_shared_memory_large_messages(self):
+        """
+        As a Python developer,
+        I want large payloads to be moved between processes through shared memory instead of the socket,
+        and to read them on the other end without copying, so that big messages don't cost a trip through the kernel.
+        """
+        big_payload = os.urandom(1024 * 1024) * 8
+
+        parent, child = create_anonymous_duct_pair(serialize=lambda payload: payload,
+                                                   deserialize=lambda payload: payload,
+                                                   shared_memory_threshold=64 * 1024)
+        parent.send(big_payload)
+        parent.send_many([b"small", big_payload, b"tail"])
+
+        received = child.recv()
+        assert_that(received).is_instance_of(memoryview)
+        assert_that(received == big_payload).is_true()
+        assert_that(child.recv_many(timeout=1)).is_length(3)
+        child.send(b"small reply")
+        assert_that(bytes(parent.recv())).is_equal_to(b"small reply")
+        child.close()
+        parent.close()
+
+    def test_file_descriptor_passing(self):
+        """
+        As a Python developer,
+        I want to hand already open files and sockets to the other end of a duct along with a message,
+        so that workers can take over files and client connections instead of having their contents copied.
+        """
+        parent, child = create_anonymous_duct_pair(receive_fds=True)
+        read_fd, write_fd = os.pipe()
+        client_socket, server_socket = socket.socketpair()
+
+        parent.send("no descriptors")
+        parent.send_fds({"kind": "handoff"}, [write_fd, server_socket])
+        os.close(write_fd)
+        server_socket.close()
+
+        assert_that(child.recv_fds()).is_equal_to(("no descriptors", []))
+        payload, fds = child.recv_fds()
+        assert_that(payload).is_equal_to({"kind": "handoff"})
+        assert_that(fds).is_length(2)
+        os.write(fds[0], b"through the duct")
+        os.close(fds[0])
+        assert_that(os.read(read_fd, 1024)).is_equal_to(b"through the duct")
+        handed_off = socket.socket(fileno=fds[1])
+        client_socket.sendall(b"ping")
+        assert_that(handed_off.recv(4)).is_equal_to(b"ping")
+
+        handed_off.close()
+        client_socket.close()
+        os.close(read_fd)
+        child.close()
+        parent.close()
+
+    def test_pickle5_out_of_band_buffers(self):
+        """
+        As a Python developer,
+        I want large buffers inside my messages to be sent and received as frames of their own,
+        so that array heavy messages aren't copied into (and back out of) one big pickle blob.
+        """
+        if not PICKLE5_SUPPORTED:
+            self.skipTest("Pickle protocol 5 needs Python 3.8 or newer.")
+        big_buffer = bytearray(os.urandom(1024 * 1024)) * 4
+        parent, child = create_anonymous_duct_pair(serialize=pickle5_serializer, deserialize=pickle5_deserializer,
+                                                   out_of_band=True)
+
+        def parent_target():
+            parent.send({"data": pickle.PickleBuffer(big_buffer), "seq": 1})
+            parent.send_many([{"seq": 2}, {"data": pickle.PickleBuffer(b"small"), "seq": 3}])
+
+        t = threading.Thread(target=parent_target)
+        t.start()
+        received = child.recv()
+        assert_that(received["seq"]).is_equal_to(1)
+        assert_that(received["data"] == big_buffer).is_true()
+        assert_that(child.recv()).is_equal_to({"seq": 2})
+        assert_that(bytes(child.recv()["data"])).is_equal_to(b"small")
+        t.join()
+        child.close()
+        parent.close()
+
+    def test_handshake_negotiation(self):
+        """
+        As a Python developer,
+        I want the two ends of a duct to agree on the fastest codec they both support when they connect,
+        so that I don't have to configure matching serializers on both sides by hand.
+        """
+        parent = MessageDuctParent.psuedo_anonymous_parent_duct(handshake=True, codecs=("marshal", "json"),
+                                                                max_frame_size=1024)
+        parent.bind()
+        child = MessageDuctChild.psuedo_anonymous_child_duct(parent.listener_address, handshake=True,
+                                                             codecs=("msgpack", "json", "marshal"))
+        child.connect()
+        parent.listen()
+
+        parent.send({"hello": [1, 2, 3]})
+        assert_that(child.recv()).is_equal_to({"hello": [1, 2, 3]})
+        assert_that(child.negotiated_options.codec.name).is_equal_to("marshal")
+        assert_that(child.negotiated_options.max_frame_size).is_equal_to(1024)
+        child.send(b"binary is fine with marshal")
+        assert_that(parent.recv()).is_equal_to(b"binary is fine with marshal")
+        assert_that(parent.negotiated_options.codec.name).is_equal_to("marshal")
+        assert_that(child.send).raises(MessageProtocolException).when_called_with(b"x" * 2048)
+        child.close()
+        parent.close()
+
+        # Codecs that can run code on malicious input are only used if both ends opt in to them.
+        parent = MessageDuctParent.psuedo_anonymous_parent_duct(handshake=True)
+        parent.bind()
+        child = MessageDuctChild.psuedo_anonymous_child_duct(parent.listener_address, handshake=True,
+                                                             codecs=("pickle5", "marshal", "json"))
+        child.connect()
+        parent.listen()
+        child.send({"hello": "world"})
+        assert_that(parent.recv()).is_equal_to({"hello": "world"})
+        assert_that(parent.negotiated_options.codec.name).is_equal_to("json")
+        child.close()
+        parent.close()
+
+    def test_tagged_codec(self):
+        """
+        As a Python developer,
+        I want raw binary and text payloads to skip JSON entirely while structured payloads still use it,
+        so that binary heavy ducts don't pay for serialization they don't need.
+        """
+        parent, child = create_anonymous_duct_pair(serialize=tagged_serializer, deserialize=tagged_deserializer)
+        binary_payload = os.urandom(4096)
+        parent.send_many([binary_payload, bytearray(b"mutable"), u"h\u00e9llo", {"structured": [1, 2]}, b""])
+
+        received = child.recv_many(timeout=1)
+        assert_that(received).is_length(5)
+        assert_that(received[0]).is_instance_of(bytearray).is_equal_to(bytearray(binary_payload))
+        assert_that(received[1]).is_equal_to(bytearray(b"mutable"))
+        assert_that(received[2]).is_equal_to(u"h\u00e9llo")
+        assert_that(received[3]).is_equal_to({"structured": [1, 2]})
+        assert_that(received[4]).is_empty()
+        child.close()
+        parent.close()
+
+    def test_compressed_tcp_message_passing(self):
+        """
+        As a Python developer,
+        I want verbose JSON sent between hosts to be compressed, with a trained dictionary for small messages,
+        so that bandwidth bound TCP ducts carry more messages, and I can see whether it pays off.
+        """
+        messages = [{"event": "order_placed", "customer_id": i, "status": "pending", "items": [{"sku": i * 7}]}
+                    for i in range(40)]
+        dictionary = train_compression_dictionary([json.dumps(message).encode('utf-8') for message in messages[:20]])
+        parent = MessageDuctParent.psuedo_anonymous_tcp_parent_duct(handshake=True, codecs=("json",),
+                                                                    compression_threshold=32,
+                                                                    compression_dictionary=dictionary)
+        parent.bind()
+        child = MessageDuctChild.psuedo_anonymous_tcp_child_duct(parent.listener_address[0],
+                                                                 parent.listener_address[1], handshake=True,
+                                                                 compression_dictionary=dictionary)
+        child.connect()
+        assert_that(parent.listen()).is_true()
+        parent.send_many(messages)
+        # Too small to be worth compressing.
+        parent.send("tiny")
+
+        assert_that(child.recv_many(timeout=1, max_count=41)).is_equal_to(messages + ["tiny"])
+        assert_that(child.negotiated_options.compression).is_equal_to("zlib")
+        assert_that(parent.compression_stats.frames_compressed).is_equal_to(40)
+        assert_that(parent.compression_stats.ratio).is_greater_than(2)
+        assert_that(child.compression_stats.frames_decompressed).is_equal_to(40)
+        child.close()
+        parent.close()
+
+    def test_duct_metrics(self):
+        """
+        As a Python developer,
+        I want ducts to count what they send and receive and time where they spend it, all in one registry,
+        so that I can tell whether a slow pipeline is stuck serializing, waiting on the other end, or on a lock.
+        """
+        parent, child = create_psuedo_anonymous_duct_pair(parent_lock=threading.Lock(), metrics=True)
+        parent.send({"hello": "world"})
+        parent.send_many([1, 2, 3])
+        assert_that(child.recv_many(timeout=1)).is_equal_to([{"hello": "world"}, 1, 2, 3])
+
+        snapshot = DEFAULT_METRICS_REGISTRY.snapshot()
+        assert_that(snapshot).contains_key(parent.metrics.name, child.metrics.name)
+        parent_snapshot = snapshot[parent.metrics.name]
+        assert_that(parent_snapshot["messages_sent"]).is_equal_to(4)
+        assert_that(parent_snapshot["send_calls"]).is_equal_to(2)
+        assert_that(parent_snapshot["serialize_time"]["count"]).is_equal_to(4)
+        assert_that(parent_snapshot["lock_wait_time"]["count"]).is_equal_to(2)
+        child_snapshot = snapshot[child.metrics.name]
+        assert_that(child_snapshot["messages_received"]).is_equal_to(4)
+        assert_that(child_snapshot["bytes_received"]).is_equal_to(parent_snapshot["bytes_sent"])
+        assert_that(child_snapshot["deserialize_time"]["p99"]).is_greater_than(0)
+
+        child.metrics.reset()
+        assert_that(child.metrics.snapshot()["messages_received"]).is_zero()
+        parent_name = parent.metrics.name
+        child.close()
+        parent.close()
+        assert_that(DEFAULT_METRICS_REGISTRY.metrics()).does_not_contain_key(parent_name)
+
+    def test_buffered_small_messages(self):
+        """
+        As a Python developer,
+        I want many small messages to be received with as few socket reads as possible,
+        and for poll() to still tell me when a message is ready, so that small message rates aren't syscall bound.
+        """
+        parent, child = create_psuedo_anonymous_duct_pair()
+        for i in range(50):
+            child.send({"seq": i})
+        assert_that(parent.poll(1)).is_true()
+        assert_that(parent.recv()).is_equal_to({"seq": 0})
+        # Everything sent so far was pulled off of the socket by the first read.
+        assert_that(parent.socket_duct.poll(0)).is_false()
+        for i in range(1, 50):
+            assert_that(parent.poll(0)).is_true()
+            assert_that(parent.recv()).is_equal_to({"seq": i})
+        assert_that(parent.poll(0)).is_false()
+        child.close()
+        parent.close()
+
+    def test_unbuffered_message_passing(self):
+        """
+        As a Python developer,
+        I want to be able to turn off read-ahead buffering,
+        so that I can safely share a duct between processes.
+        """
+        parent, child = create_psuedo_anonymous_duct_pair(recv_buffer_size=0)
+        for i in range(10):
+            child.send({"seq": i})
+        for i in range(10):
+            assert_that(parent.recv()).is_equal_to({"seq": i})
+            assert_that(parent.frame_reader.buffered_bytes).is_equal_to(0)
+        child.close()
+        parent.close()
+
+    def test_duct_shared_between_processes(self):
+        """
+        As a Python developer,
+        I want several processes to be able to take turns receiving from one duct guarded by a multiprocessing.Lock,
+        so that I can hand out work to a group of forked workers over a single connection.
+        """
+        parent, child = create_psuedo_anonymous_duct_pair(child_lock=multiprocessing.Lock())
+        assert_that(child.frame_reader.read_ahead).is_false()
+        results = multiprocessing.Queue()
+
+        def worker():
+            while True:
+                message = child.recv()
+                if message is None:
+                    break
+                results.put(message)
+
+        workers = [multiprocessing.Process(target=worker) for _ in range(2)]
+        for p in workers:
+            p.daemon = True
+            p.start()
+        expected = [{"seq": i, "data": "x" * (i * 997 % 5000)} for i in range(300)]
+        for message in expected:
+            parent.send(message)
+        parent.send_many([None, None])
+        received = [results.get(timeout=10) for _ in expected]
+        for p in workers:
+            p.join(10)
+            assert_that(p.exitcode).is_equal_to(0)
+        assert_that(sorted(received, key=lambda message: message["seq"])).is_equal_to(expected)
+        child.close()
+        parent.close()
+
+    def test_batch_message_passing(self):
+        """
+        As a Python developer,
+        I want to be able to send and receive messages in batches,
+        so that high rates of small messages don't pay for a lock, a serialization call and a write each.
+        """
+        batch = [{"seq": i, "value": "telemetry"} for i in range(5000)]
+        parent, child = create_psuedo_anonymous_duct_pair()
+
+        def child_target():
+            assert_that(child.send_many(batch)).is_equal_to(len(batch))
+            child.send_many(["tail"])
+
+        t = threading.Thread(target=child_target)
+        t.start()
+
+        received = []
+        while len(received) < len(batch):
+            received.extend(parent.recv_many(max_count=min(1000, len(batch) - len(received)), timeout=10))
+        assert_that(received).is_equal_to(batch)
+        assert_that(parent.recv()).is_equal_to("tail")
+        assert_that(parent.recv_many()).is_empty()
+        t.join()
+        child.close()
+        parent.close()
+
+    def test_wait_on_many_ducts(self):
+        """
+        As a Python developer,
+        I want to be able to wait on several ducts at once and get back every duct that's ready,
+        so that I can service many ducts from a single thread like with multiprocessing.connection.wait.
+        """
+        pairs = [create_psuedo_anonymous_duct_pair() for _ in range(4)]
+        parents = [parent for parent, _ in pairs]
+        assert_that(wait(parents, 0)).is_empty()
+        pairs[1][1].send_many(["first", "second"])
+        pairs[3][1].send("third")
+        assert_that(wait(parents, 1)).contains_only(parents[1], parents[3])
+        assert_that(parents[1].recv()).is_equal_to("first")
+        assert_that(parents[3].recv()).is_equal_to("third")
+        # The second message has already been read off of the socket, and is waiting in the read buffer.
+        assert_that(wait(parents, 1)).is_equal_to([parents[1]])
+        assert_that(parents[1].recv()).is_equal_to("second")
+        # Waiting for an urgent message reads the normal ones ahead of it off of the socket, and queues them up.
+        pairs[2][1].send("fourth")
+        assert_that(parents[2].poll(0.5, priority=PRIORITY_HIGH)).is_false()
+        assert_that(wait(parents, 1)).is_equal_to([parents[2]])
+        assert_that(parents[2].recv()).is_equal_to("fourth")
+        for parent, child in pairs:
+            child.close()
+            parent.close()
+
+    def test_high_file_descriptors(self):
+        """
+        As a Python developer,
+        I want ducts to keep working when their file descriptors are numbered above FD_SETSIZE,
+        so that long running processes with lots of open files can still use ductworks.
+        """
+        import resource
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard_limit != resource.RLIM_INFINITY and hard_limit < 2048:
+            self.skipTest("Can't raise the open file limit high enough.")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft_limit, 2048), hard_limit))
+        filler_fds = []
+        try:
+            devnull_fd = os.open(os.devnull, os.O_RDONLY)
+            filler_fds.append(devnull_fd)
+            while filler_fds[-1] < 1100:
+                filler_fds.append(os.dup(devnull_fd))
+            parent, child = create_psuedo_anonymous_duct_pair()
+            assert_that(parent.fileno()).is_greater_than(1024)
+            assert_that(parent.poll(0)).is_false()
+            child.send("hello")
+            assert_that(parent.poll(1)).is_true()
+            assert_that(wait([parent, child], 1)).is_equal_to([parent])
+            assert_that(parent.recv()).is_equal_to("hello")
+            child.close()
+            parent.close()
+        finally:
+            for fd in filler_fds:
+                os.close(fd)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+
     def test_multiple_writers(self):
         """
         As a Python developer,
@@ -98,6 +604,246 @@ class MessageDuctIntegrationTest(TestCase):
         parent.close()
         assert_that(os.path.exists(bind_address)).is_false()
 
+    def test_full_duplex_locking(self):
+        """
+        As a Python developer,
+        I want separate send and recv locks on a duct shared between threads, with neither direction interleaving,
+        so that a thread waiting on a reply doesn't keep every other thread from sending.
+        """
+        big_string = "lol" * 1024 * 128
+        big_list = [big_string, 1, big_string, 2, big_string, 3]
+
+        # A single lock is matched with a recv lock of its own.
+        parent, child = create_psuedo_anonymous_duct_pair(parent_lock=(threading.Lock(), threading.Lock()),
+                                                          child_lock=threading.Lock())
+        assert_that(child.recv_lock).is_not_same_as(child.send_lock)
+        assert_that(type(lock_like(multiprocessing.Lock()))).is_same_as(type(multiprocessing.Lock()))
+        child_received = []
+        child_reader = threading.Thread(target=lambda: child_received.append(child.recv()))
+        child_reader.start()
+        # The child's reader is now blocked in recv(), holding the child's recv lock.
+        time.sleep(0.1)
+
+        parent_received = []
+
+        def parent_reader():
+            for _ in range(50):
+                parent_received.append(parent.recv())
+
+        def child_writer():
+            for _ in range(25):
+                child.send(big_list)
+
+        readers = [threading.Thread(target=parent_reader) for _ in range(2)]
+        writers = [threading.Thread(target=child_writer) for _ in range(4)]
+        for t in readers + writers:
+            t.start()
+        for t in writers + readers:
+            t.join(30)
+            assert_that(t.is_alive()).is_false()
+        assert_that(parent_received).is_length(100)
+        for received in parent_received:
+            assert_that(received).is_equal_to(big_list)
+
+        assert_that(child_reader.is_alive()).is_true()
+        parent.send("done")
+        child_reader.join(10)
+        assert_that(child_received).is_equal_to(["done"])
+        child.close()
+        parent.close()
+
+    def test_background_writer(self):
+        """
+        As a Python developer,
+        I want sends to return right away while a writer thread feeds a slow peer from a bounded queue,
+        so that my request handling threads don't stall on the socket, and I choose what happens when it fills up.
+        """
+        big_string = "lol" * 1024 * 128
+        parent, child = create_psuedo_anonymous_duct_pair(write_queue_size=4, write_queue_policy=WRITE_QUEUE_RAISE)
+        # The child isn't reading, so the writer stalls on the first few messages while the rest queue up.
+        started = time.time()
+        queued = 0
+        with self.assertRaises(WriteQueueFull):
+            for _ in range(20):
+                parent.send(big_string)
+                queued += 1
+        assert_that(time.time() - started).is_less_than(1)
+        assert_that(queued).is_between(4, 19)
+        assert_that(parent.flush(0.1)).is_false()
+
+        for _ in range(queued):
+            assert_that(child.recv()).is_equal_to(big_string)
+        assert_that(parent.flush(5)).is_true()
+        assert_that(child.poll(0.1)).is_false()
+        child.close()
+        parent.close()
+
+        parent, child = create_psuedo_anonymous_duct_pair(write_queue_size=2,
+                                                          write_queue_policy=WRITE_QUEUE_DROP_OLDEST)
+        for i in range(20):
+            parent.send_nowait([i, big_string])
+        parent.send("last")
+        received = []
+        while received[-1:] != ["last"]:
+            received.append(child.recv())
+        # Some of the oldest were thrown away to make room, but whatever was sent went out in order.
+        assert_that(parent.background_writer.messages_dropped).is_positive()
+        sequence = [message[0] for message in received[:-1]]
+        assert_that(sequence).is_equal_to(sorted(sequence))
+        assert_that(parent.background_writer.messages_dropped).is_equal_to(21 - len(received))
+        child.close()
+        parent.close()
+
+    def test_channel_multiplexing(self):
+        """
+        As a Python developer,
+        I want to carry several independent streams of messages over one duct, without a big message on one of them
+        holding up the others, so that I don't need a socket, address, and poll loop for every stream.
+        """
+        big_buffer = bytearray(os.urandom(256 * 1024)) * 4
+        parent, child = create_anonymous_duct_pair(handshake=True, codecs=("pickle5",), channel_fragment_size=4096,
+                                                   parent_lock=(threading.Lock(), threading.Lock()),
+                                                   child_lock=(threading.Lock(), threading.Lock()))
+        senders = [
+            threading.Thread(target=lambda: parent.channel(1).send({"data": pickle.PickleBuffer(big_buffer)})),
+            threading.Thread(target=lambda: [parent.channel(2).send(i) for i in range(50)]),
+            threading.Thread(target=lambda: parent.send("plain")),
+        ]
+        for t in senders:
+            t.start()
+        received = {}
+        receivers = [threading.Thread(target=lambda: received.setdefault(2, [child.channel(2).recv()
+                                                                             for _ in range(50)])),
+                     threading.Thread(target=lambda: received.setdefault(1, child.channel(1).recv()))]
+        for t in receivers:
+            t.start()
+        assert_that(child.recv()).is_equal_to("plain")
+        for t in senders + receivers:
+            t.join()
+        assert_that(received[2]).is_equal_to(list(range(50)))
+        assert_that(received[1]["data"] == big_buffer).is_true()
+        assert_that(child.channel(3).poll(0.05)).is_false()
+
+        # Either end may use channels at any time, without any setup.
+        child.channel(65535).send([b"reply"] * 2)
+        assert_that(parent.channel(65535).recv()).is_equal_to([b"reply"] * 2)
+        with self.assertRaises(ValueError):
+            parent.channel(65536)
+        child.close()
+        parent.close()
+
+    def test_priority_lanes(self):
+        """
+        As a Python developer,
+        I want urgent messages (like a cancellation) to overtake the bulk messages already on their way,
+        so that a worker busy with a backlog of data still reacts to control messages right away.
+        """
+        big_buffer = bytearray(os.urandom(1024 * 1024))
+        parent, child = create_anonymous_duct_pair(handshake=True, codecs=("pickle5",), priority_lanes=True,
+                                                   channel_fragment_size=4096, receive_fds=True)
+        bulk_sender = threading.Thread(target=lambda: [parent.send(pickle.PickleBuffer(big_buffer))
+                                                       for _ in range(5)] + [parent.send_many(["done", "done"])])
+        bulk_sender.start()
+        # Give the bulk messages time to fill up the socket.
+        time.sleep(0.05)
+        control_sender = threading.Thread(target=lambda: parent.send("cancel", priority=PRIORITY_HIGH))
+        control_sender.start()
+        assert_that(child.poll(10, priority=PRIORITY_HIGH)).is_true()
+        # The bulk messages read while waiting for it were split up, so it didn't have to wait for all of them.
+        assert_that(len(child.channel_multiplexer.plain_messages)).is_less_than(5)
+        assert_that(child.recv()).is_equal_to("cancel")
+        received = [child.recv() for _ in range(7)]
+        assert_that([payload == big_buffer for payload in received[:5]]).is_equal_to([True] * 5)
+        assert_that(received[5:]).is_equal_to(["done", "done"])
+        bulk_sender.join()
+        control_sender.join()
+        assert_that(child.poll(0.05, priority=PRIORITY_HIGH)).is_false()
+
+        # Messages with file descriptors are never split, but may still be sent with a priority.
+        read_fd, write_fd = os.pipe()
+        parent.send_fds("pipe", [write_fd], priority=PRIORITY_HIGH)
+        os.close(write_fd)
+        payload, fds = child.recv_fds()
+        assert_that(payload).is_equal_to("pipe")
+        os.write(fds[0], b"!")
+        assert_that(os.read(read_fd, 1)).is_equal_to(b"!")
+        for fd in fds + [read_fd]:
+            os.close(fd)
+        parent.send("normal")
+        assert_that(child.poll(1, priority=PRIORITY_NORMAL)).is_true()
+        assert_that(child.recv()).is_equal_to("normal")
+        child.close()
+        parent.close()
+
+        # Waiting for an urgent message only reads so far ahead through the normal ones.
+        parent, child = create_anonymous_duct_pair(max_read_ahead=4)
+        parent.send_many(list(range(6)))
+        start_time = time.time()
+        assert_that(child.poll(1, priority=PRIORITY_HIGH)).is_false()
+        assert_that(time.time() - start_time).is_less_than(0.5)
+        assert_that(child.poll(None, priority=PRIORITY_HIGH)).is_false()
+        assert_that(len(child.channel_multiplexer.plain_messages)).is_equal_to(4)
+        assert_that([child.recv() for _ in range(4)]).is_equal_to([0, 1, 2, 3])
+        parent.send("urgent", priority=PRIORITY_HIGH)
+        assert_that(child.poll(1, priority=PRIORITY_HIGH)).is_true()
+        assert_that([child.recv() for _ in range(3)]).is_equal_to(["urgent", 4, 5])
+        child.close()
+        parent.close()
+
+    def test_streaming_and_wide_frames(self):
+        """
+        As a Python developer,
+        I want to send payloads too big to hold in memory (or to fit in a 32 bit frame length) as a stream of chunks,
+        so that moving a multi-gigabyte file between processes doesn't need a multi-gigabyte buffer at either end.
+        """
+        chunks = [os.urandom(size) for size in (10000, 0, 1, 50000, 4096)]
+        parent, child = create_anonymous_duct_pair(handshake=True, channel_fragment_size=4096,
+                                                   parent_lock=(threading.Lock(), threading.Lock()))
+
+        def stream_with_message():
+            for index, chunk in enumerate(chunks):
+                if index == 2:
+                    parent.send("interleaved")
+                yield chunk
+
+        sender = threading.Thread(target=lambda: parent.send_stream(stream_with_message()))
+        sender.start()
+        received = list(child.recv_stream())
+        sender.join()
+        assert_that(b''.join(bytes(chunk) for chunk in received)).is_equal_to(b''.join(chunks))
+        assert_that(max(len(chunk) for chunk in received)).is_less_than_or_equal_to(4096)
+        # A message sent in the middle of the stream is kept for recv().
+        assert_that(child.recv()).is_equal_to("interleaved")
+
+        def failing_stream():
+            yield b'partial'
+            raise ValueError("disk on fire")
+
+        with self.assertRaises(ValueError):
+            parent.send_stream(failing_stream())
+        with self.assertRaises(MessageProtocolException):
+            list(child.recv_stream())
+
+        parent.send_stream([b'unread'])
+        with self.assertRaises(MessageProtocolException):
+            child.recv()
+        assert_that([bytes(chunk) for chunk in child.recv_stream()]).is_equal_to([b'unread'])
+
+        # Frames longer than 4 GiB get a 64 bit length, which any frame may use.
+        header = pack_frame_header(5 << 30, FRAME_FLAG_COMPRESSED)
+        assert_that(len(header)).is_equal_to(FrameReader.WIDE_HEADER_SIZE)
+        assert_that(parse_frame_header(header)).is_equal_to((FRAME_FLAG_COMPRESSED, len(header), 5 << 30))
+        assert_that(parse_frame_header(header[:-1])).is_none()
+        child.close()
+        parent.close()
+        parent, child = create_anonymous_duct_pair()
+        body = json.dumps("wide").encode('utf-8')
+        parent.socket_duct.sendmsg_all([struct.pack(FrameReader.WIDE_HEADER_FORMAT, EXTENDED_MAGIC_BYTE,
+                                                    FRAME_FLAG_WIDE_LENGTH, len(body)), body])
+        assert_that(child.recv()).is_equal_to("wide")
+        child.close()
+        parent.close()
+
     def test_ducts_with_subprocess(self):
         """
         As a Python developer,
@@ -127,6 +873,26 @@ class MessageDuctIntegrationTest(TestCase):
             if proc:
                 proc.terminate()
 
+    def test_spawn_with_inherited_duct(self):
+        """
+        As a Python developer,
+        I want to be able to start a subprocess that inherits an already connected duct,
+        so that my workers can start talking immediately without a listen/connect handshake.
+        """
+        proc, parent = spawn_with_duct([sys.executable, SUBPROCESS_TEST_SCRIPT], env={'PYTHONPATH': ROOT_DIR})
+        try:
+            for _ in range(100):
+                parent.send("pingpong")
+                assert_that(parent.poll(5)).is_true()
+                assert_that(parent.recv()).is_equal_to("pingpong")
+            parent.send(None)
+            assert_that(proc.wait(10)).is_equal_to(0)
+            self.assertRaises(EOFError, parent.recv)
+        finally:
+            parent.close()
+            if proc.poll() is None:
+                proc.terminate()
+
     def test_mp_pipe_replacement(self):
         """
         As a Python developer,
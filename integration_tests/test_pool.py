@@ -0,0 +1,110 @@
+from unittest import TestCase
+from assertpy import assert_that
+import os
+import tempfile
+import time
+
+from ductworks.pool import DuctPool, TaskFailed, WorkerCrashed, SCHEDULE_ROUND_ROBIN
+
+
+def square(x):
+    return x * x
+
+
+def fail_on_three(x):
+    if x == 3:
+        raise ValueError("three")
+    return x
+
+
+def crash_once(marker_path):
+    # The first worker to run this dies, the retry finds the marker and survives.
+    if not os.path.exists(marker_path):
+        open(marker_path, 'w').close()
+        os._exit(1)
+    return "survived"
+
+
+def always_crash(_):
+    os._exit(1)
+
+
+def sleep_for(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+class DuctPoolIntegrationTest(TestCase):
+    def test_pool_dispatch_and_recovery(self):
+        """
+        As a Python developer,
+        I want a pool of fork+exec workers that streams results back, reports task errors, and replaces workers
+        that crash, so that I don't write my own dispatcher on top of MessageDuctParent for every project.
+        """
+        with DuctPool(processes=2, prefetch=3) as pool:
+            assert_that(pool.map(square, range(100))).is_equal_to([x * x for x in range(100)])
+            assert_that(sorted(pool.imap_unordered(square, range(50)))).is_equal_to([x * x for x in range(50)])
+
+            with self.assertRaises(TaskFailed) as context:
+                list(pool.imap_unordered(fail_on_three, range(10)))
+            assert_that(str(context.exception)).is_equal_to("ValueError: three")
+            assert_that(context.exception.remote_traceback).contains("fail_on_three")
+            # The pool is still usable after a failed task.
+            assert_that(pool.map(square, [4])).is_equal_to([16])
+
+            marker_path = os.path.join(tempfile.mkdtemp(), "crashed")
+            assert_that(pool.map(crash_once, [marker_path])).is_equal_to(["survived"])
+            assert_that(pool.workers_restarted).is_equal_to(1)
+            with self.assertRaises(WorkerCrashed):
+                pool.map(always_crash, [None])
+            assert_that(pool.map(square, range(10))).is_equal_to([x * x for x in range(10)])
+
+        with DuctPool(processes=3, scheduling=SCHEDULE_ROUND_ROBIN, prefetch=1) as pool:
+            assert_that(pool.map(square, range(30))).is_equal_to([x * x for x in range(30)])
+            assert_that([worker.tasks_completed for worker in pool.workers]).is_equal_to([10, 10, 10])
+
+    def test_quick_result_before_slow_task(self):
+        """
+        As a Python developer,
+        I want the result of a quick task back as soon as it's done, even if a slow task was sent to the same worker,
+        so that result batching never holds a finished result hostage to whatever runs next.
+        """
+        with DuctPool(processes=1, prefetch=2) as pool:
+            results = pool.imap_unordered(sleep_for, [0, 1.5])
+            start_time = time.time()
+            assert_that(next(results)).is_equal_to(0)
+            assert_that(time.time() - start_time).is_less_than(1)
+            assert_that(next(results)).is_equal_to(1.5)
+
+        # With more tasks queued up behind the slow one, the worker is never idle, but must still not hold on to
+        # the results of the quick tasks while it runs the slow one.
+        with DuctPool(processes=1, prefetch=3) as pool:
+            results = pool.imap_unordered(sleep_for, [0, 0.0008, 1, 0, 0])
+            start_time = time.time()
+            assert_that([next(results), next(results)]).is_equal_to([0, 0.0008])
+            assert_that(time.time() - start_time).is_less_than(0.5)
+            assert_that(sorted(results)).is_equal_to([0, 0, 1])
+
+    def test_abandoned_tasks(self):
+        """
+        As a Python developer,
+        I want breaking out of imap_unordered, or a failed task, to return right away rather than wait for every
+        task still running, and the late results of those tasks to never turn up in a later map,
+        so that giving up on a batch of slow tasks is actually quick.
+        """
+        with DuctPool(processes=2, prefetch=2) as pool:
+            start_time = time.time()
+            with self.assertRaises(TaskFailed):
+                # sleep_for(-1) fails right away.
+                list(pool.imap_unordered(sleep_for, [2, -1]))
+            assert_that(time.time() - start_time).is_less_than(1.5)
+
+            start_time = time.time()
+            for result in pool.imap_unordered(sleep_for, [0, 2, 2]):
+                assert_that(result).is_equal_to(0)
+                break
+            assert_that(time.time() - start_time).is_less_than(1.5)
+
+            # The abandoned tasks' results are dropped, not mistaken for those of the next map.
+            assert_that(pool.map(square, range(10))).is_equal_to([x * x for x in range(10)])
+            assert_that([worker.load() for worker in pool.workers]).is_equal_to([0, 0])
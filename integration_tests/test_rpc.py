@@ -0,0 +1,166 @@
+from unittest import TestCase
+from assertpy import assert_that
+import asyncio
+import threading
+import time
+
+from ductworks.async_duct import AsyncMessageDuctParent
+from ductworks.message_duct import MessageDuctChild, RemoteDuctClosed, create_psuedo_anonymous_duct_pair
+from ductworks.rpc import RpcClient, RpcServer, RpcRegistry, RpcError, AsyncRpcClient
+
+
+def make_registry(calls):
+    registry = RpcRegistry()
+
+    @registry.register
+    def add(a, b=0):
+        return a + b
+
+    @registry.register(name='count_to', streaming=True)
+    def count(n, fail_at=None):
+        for i in range(n):
+            if i == fail_at:
+                raise ValueError("failed at {}".format(i))
+            yield i
+
+    @registry.register(streaming=True)
+    def tick(n, interval):
+        for i in range(n):
+            if i:
+                time.sleep(interval)
+            yield i
+
+    registry.register(calls.append, name='record')
+    registry.register(lambda seconds: time.sleep(seconds) or seconds, name='sleep')
+    registry.register(lambda: threading.Event().wait(60), name='hang')
+    return registry
+
+
+def serve_in_thread(duct, registry):
+    server_thread = threading.Thread(target=RpcServer(duct, registry).serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return server_thread
+
+
+class RpcIntegrationTest(TestCase):
+    def test_pipelined_rpc(self):
+        """
+        As a Python developer,
+        I want to make many RPC calls over one duct without waiting for each reply before the next call,
+        so that my chatty control plane isn't limited to one call per round trip.
+        """
+        calls = []
+        parent, child = create_psuedo_anonymous_duct_pair(handshake=True)
+        server_thread = serve_in_thread(child, make_registry(calls))
+        with RpcClient(parent) as client:
+            futures = [client.call_async('add', i, b=1) for i in range(500)]
+            assert_that([future.result(10) for future in futures]).is_equal_to(list(range(1, 501)))
+            assert_that(client.call('add', 2, 3)).is_equal_to(5)
+            futures = client.call_many([('add', [i], {'b': 2}) for i in range(100)] + [('add', ["a", 1])])
+            assert_that([future.result(10) for future in futures[:-1]]).is_equal_to(list(range(2, 102)))
+            assert_that(futures[-1].exception(10)).is_instance_of(RpcError)
+
+            assert_that(list(client.stream('count_to', 5))).is_equal_to([0, 1, 2, 3, 4])
+            failing_stream = client.stream('count_to', 5, fail_at=3)
+            assert_that(next(failing_stream)).is_equal_to(0)
+            with self.assertRaises(RpcError) as context:
+                list(failing_stream)
+            assert_that(str(context.exception)).is_equal_to("ValueError: failed at 3")
+            assert_that(context.exception.remote_traceback).contains("count")
+
+            with self.assertRaises(RpcError):
+                client.call('nonexistent')
+            client.notify('record', "notified")
+            client.notify('nonexistent')
+            # Replies come back in order, so the notifications have been handled once this call returns.
+            assert_that(client.call('add', 1)).is_equal_to(1)
+            assert_that(calls).is_equal_to(["notified"])
+            hanging_call = client.call_async('hang')
+        # Closing the client fails any calls still waiting on a reply.
+        assert_that(hanging_call.exception(10)).is_instance_of(RemoteDuctClosed)
+        assert_that(server_thread.is_alive()).is_true()
+        child.close()
+
+        # An asyncio client can talk to the same (synchronous) server.
+        async def scenario():
+            async_parent = AsyncMessageDuctParent.psuedo_anonymous_parent_duct()
+            await async_parent.bind()
+            sync_child = MessageDuctChild.psuedo_anonymous_child_duct(async_parent.listener_address)
+            sync_child.connect()
+            assert_that(await async_parent.listen()).is_true()
+            async_server_thread = serve_in_thread(sync_child, make_registry([]))
+            client = AsyncRpcClient(async_parent)
+            futures = [await client.call_async('add', i, 1) for i in range(100)]
+            assert_that(await asyncio.gather(*futures)).is_equal_to(list(range(1, 101)))
+            assert_that([item async for item in client.stream('count_to', 3)]).is_equal_to([0, 1, 2])
+            with self.assertRaises(RpcError):
+                await client.call('add', "a", 1)
+            await client.close()
+            async_server_thread.join(10)
+            assert_that(async_server_thread.is_alive()).is_false()
+            sync_child.close()
+
+        asyncio.run(scenario())
+
+    def test_server_stops_on_local_close(self):
+        """
+        As a Python developer,
+        I want closing the server's end of the duct from another thread to stop serve_forever() cleanly, whether it
+        is waiting for calls or in the middle of one, so that shutting a server down doesn't kill its thread with an
+        exception.
+        """
+        for method, args in (('add', [1, 2]), ('sleep', [0.2])):
+            parent, child = create_psuedo_anonymous_duct_pair(handshake=True)
+            errors = []
+
+            def serve():
+                try:
+                    RpcServer(child, make_registry([])).serve_forever()
+                except Exception as e:
+                    errors.append(e)
+
+            server_thread = threading.Thread(target=serve)
+            server_thread.start()
+            with RpcClient(parent) as client:
+                assert_that(client.call('add', 1)).is_equal_to(1)
+                client.call_async(method, *args)
+                time.sleep(0.1)
+                child.close()
+                server_thread.join(10)
+            assert_that(server_thread.is_alive()).is_false()
+            assert_that(errors).is_empty()
+
+    def test_quick_reply_before_slow_call(self):
+        """
+        As a Python developer,
+        I want the reply to a quick call (or a stream item) sent as soon as it's ready, even if a slow call comes
+        right after it, so that reply batching never holds a finished call hostage to whatever runs next.
+        """
+        parent, child = create_psuedo_anonymous_duct_pair(handshake=True)
+        server_thread = serve_in_thread(child, make_registry([]))
+        with RpcClient(parent) as client:
+            start_time = time.time()
+            quick_call, slow_call = client.call_many([('add', [1, 2]), ('sleep', [1.5])])
+            assert_that(quick_call.result(10)).is_equal_to(3)
+            assert_that(time.time() - start_time).is_less_than(1)
+            assert_that(slow_call.result(10)).is_equal_to(1.5)
+
+            # A request arriving mid-batch mustn't hold back the replies already done either.
+            start_time = time.time()
+            calls = client.call_many([('sleep', [0]), ('sleep', [0.0008]), ('sleep', [1])])
+            time.sleep(0.0003)
+            late_call = client.call_async('add', 2, 3)
+            assert_that([call.result(10) for call in calls[:2]]).is_equal_to([0, 0.0008])
+            assert_that(time.time() - start_time).is_less_than(0.5)
+            assert_that(calls[2].result(10)).is_equal_to(1)
+            assert_that(late_call.result(10)).is_equal_to(5)
+
+            start_time = time.time()
+            stream = client.stream('tick', 2, 1.5)
+            assert_that(next(stream)).is_equal_to(0)
+            assert_that(time.time() - start_time).is_less_than(1)
+            assert_that(list(stream)).is_equal_to([1])
+        server_thread.join(10)
+        assert_that(server_thread.is_alive()).is_false()
+        child.close()
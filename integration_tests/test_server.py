@@ -0,0 +1,165 @@
+from unittest import TestCase
+from assertpy import assert_that
+import os
+import threading
+import time
+
+from ductworks.message_duct import MessageDuctChild, pack_frame_header
+from ductworks.server import DuctServer, UnknownClientException
+
+
+class DuctServerIntegrationTest(TestCase):
+    def test_many_children_one_listener(self):
+        """
+        As a Python developer,
+        I want a single server to accept many child ducts on one listener and tell me who sent what,
+        so that I don't need a listener, a socket path and a poll loop per worker.
+        """
+        server = DuctServer.psuedo_anonymous_server()
+        server.bind()
+        bind_address = server.listener_address
+        server_thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05})
+        server_thread.start()
+
+        children = []
+        try:
+            for i in range(50):
+                child = MessageDuctChild.psuedo_anonymous_child_duct(bind_address)
+                child.connect()
+                child.send({"worker": i})
+                children.append(child)
+
+            received = {}
+            for _ in range(50):
+                client_id, payload = server.message_queue.get(timeout=10)
+                received[payload["worker"]] = client_id
+            assert_that(sorted(received)).is_equal_to(list(range(50)))
+
+            for worker, client_id in received.items():
+                server.send(client_id, worker * 2)
+            for i, child in enumerate(children):
+                assert_that(child.recv()).is_equal_to(i * 2)
+
+            server.broadcast("bye")
+            for child in children:
+                assert_that(child.recv()).is_equal_to("bye")
+        finally:
+            server.shutdown()
+            server_thread.join()
+            for child in children:
+                child.close()
+            server.close()
+        assert_that(os.path.exists(bind_address)).is_false()
+
+    def test_handlers_and_tcp(self):
+        """
+        As a Python developer,
+        I want to be able to handle messages and disconnects with callbacks over TCP,
+        so that I can build request/response services on top of the server.
+        """
+        disconnected = threading.Event()
+        server = DuctServer.psuedo_anonymous_tcp_server(
+            message_handler=lambda client_id, payload: server.send(client_id, payload.upper()),
+            disconnect_handler=lambda client_id: disconnected.set()
+        )
+        server.bind()
+        child = MessageDuctChild.psuedo_anonymous_tcp_child_duct(*server.listener_address)
+        child.connect()
+        child.send("a" * (1024 * 1024))
+        child.send("hello")
+        while not child.poll(0):
+            server.serve_once(0.1)
+        assert_that(child.recv()).is_equal_to("A" * (1024 * 1024))
+        while not child.poll(0):
+            server.serve_once(0.1)
+        assert_that(child.recv()).is_equal_to("HELLO")
+        child.close()
+        while not disconnected.is_set():
+            server.serve_once(0.1)
+        self.assertRaises(UnknownClientException, server.send, 0, "gone")
+        server.close()
+
+    def test_misbehaving_clients(self):
+        """
+        As a Python developer,
+        I want a client that sends garbage, or trips up my message handler, to be dropped on its own,
+        so that one bad worker can't take down the server for every other worker.
+        """
+        def handler(client_id, payload):
+            if payload == "crash":
+                raise ValueError("handler failed")
+            server.send(client_id, payload)
+
+        server = DuctServer.psuedo_anonymous_server(message_handler=handler)
+        server.bind()
+        children = []
+        for _ in range(3):
+            child = MessageDuctChild.psuedo_anonymous_child_duct(server.listener_address)
+            child.connect()
+            children.append(child)
+        good, crashing, garbage = children
+        crashing.send("crash")
+        garbage.socket_duct.sendmsg_all([pack_frame_header(5), b"{nope"])
+        good.send("still here")
+        while not good.poll(0):
+            server.serve_once(0.1)
+        assert_that(good.recv()).is_equal_to("still here")
+        for child in (crashing, garbage):
+            while not child.poll(0):
+                server.serve_once(0.1)
+            self.assertRaises(EOFError, child.recv)
+        assert_that(server.clients).is_length(1)
+        for child in children:
+            child.close()
+        server.close()
+
+    def test_slow_clients(self):
+        """
+        As a Python developer,
+        I want a client that stops reading to neither hold up the server nor lose the data queued for it,
+        so that one stuck worker doesn't stall replies to all the others.
+        """
+        big_payload = "x" * (16 * 1024 * 1024)
+        server = DuctServer.psuedo_anonymous_server(timeout=1)
+        server.bind()
+        server_thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05})
+        server_thread.start()
+        try:
+            children = []
+            for _ in range(3):
+                child = MessageDuctChild.psuedo_anonymous_child_duct(server.listener_address)
+                child.connect()
+                child.send("hello")
+                children.append(child)
+            slow, stalled, fast = children
+            client_ids = {}
+            for _ in range(3):
+                client_id, payload = server.message_queue.get(timeout=5)
+                client_ids[client_id] = payload
+            slow_id, stalled_id, fast_id = sorted(client_ids)
+
+            # Neither of these can be written in one go, and neither client is reading yet.
+            server.send(slow_id, big_payload)
+            server.send(stalled_id, big_payload)
+            fast.send("ping")
+            client_id, payload = server.message_queue.get(timeout=5)
+            assert_that(client_id).is_equal_to(fast_id)
+            server.send(fast_id, payload)
+            assert_that(fast.poll(5)).is_true()
+            assert_that(fast.recv()).is_equal_to("ping")
+
+            # The slow client gets all of its data once it starts reading...
+            assert_that(slow.recv()).is_equal_to(big_payload)
+            # ...but one that never does is dropped after the timeout.
+            deadline = time.time() + 5
+            while stalled_id in server.clients and time.time() < deadline:
+                time.sleep(0.05)
+            assert_that(server.clients).does_not_contain_key(stalled_id)
+            assert_that(server.clients).contains_key(slow_id, fast_id)
+            for child in children:
+                child.close()
+        finally:
+            server.shutdown()
+            server_thread.join()
+            server.close()
+        assert_that(server.selector.get_map()).is_none()